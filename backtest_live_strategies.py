@@ -0,0 +1,102 @@
+"""
+用实盘脚本自己的信号函数回测历史K线（见 utils/event_backtest）
+用法: python backtest_live_strategies.py --strategy trump_multi_15m eth_k7
+      python backtest_live_strategies.py --portfolio   # TRUMP 多参数×多账户组合回测（见 utils/portfolio）
+"""
+import argparse
+
+from utils.event_backtest import (
+    load_live_module, run_event_backtest, signal_dict_signal, single_kline_signal, window_kline_signal
+)
+from utils.kline_datasets import discover_datasets, load_dataset
+from utils.portfolio import ACCOUNT_CAPITAL, portfolio_instances, simulate_portfolio
+
+VINE_ORDER_EXPIRE_BARS = 12  # VINE 5m 委托有效期1小时
+
+def _trump_multi(m):
+    return [(f"参数{i+1}", single_kline_signal(m.analyze_kline, p["TAKE_PROFIT_PERCENT"], p["STOP_LOSS_PERCENT"],
+                                              p["AMPLITUDE_PERCENT"]))
+            for i, p in enumerate(m.STRATEGY_PARAMS)]
+
+def _ada(m):
+    return [("默认", single_kline_signal(m.analyze_kline, m.TAKE_PROFIT_PERCENT, m.STOP_LOSS_PERCENT))]
+
+def _vine_k1k2(m):
+    return [("默认", window_kline_signal(m.analyze_kline, m.TAKE_PROFIT_PERCENT, m.STOP_LOSS_PERCENT))]
+
+def _eth(m):
+    return [("默认", signal_dict_signal(m.analyze_signal))]
+
+# 名称: (脚本, 构造 [(参数名, 信号函数)], 窗口K线数, 挂单有效K线数, 保证金属性名)
+LIVE_STRATEGIES = {
+    "trump_multi_15m": ("okx_trump_multi_strategy_15m.py", _trump_multi, 2, None, "MARGIN"),
+    "ada": ("okx_ada_trading_strategy.py", _ada, 2, None, "MARGIN"),
+    "vine_k1k2": ("okx_vine_k1k2_trading_strategy.py", _vine_k1k2, 7, VINE_ORDER_EXPIRE_BARS, "MARGIN"),
+    "eth_k7": ("okx_eth_K7_strategy.py", _eth, 6, None, "QTY_USDT"),
+    "eth_k1k2": ("okx_eth_k1k2_pine_strategy.py", _eth, 6, None, "QTY_USDT"),
+}
+
+def backtest_live_strategy(name, datasets=None):
+    script, build, window_size, expire_bars, margin_attr = LIVE_STRATEGIES[name]
+    try:
+        module = load_live_module(script)
+    except Exception as e:
+        # 单个脚本加载失败不影响其余策略
+        print(f"[{name}] 加载 {script} 失败，跳过: {e!r}")
+        return []
+    datasets = discover_datasets() if datasets is None else datasets
+    files = datasets.get((module.INST_ID, module.BAR))
+    if not files:
+        print(f"[{name}] 本地无 {module.INST_ID} {module.BAR} K线数据，跳过")
+        return []
+    rows = load_dataset(files)
+    opts = {"margin": getattr(module, margin_attr), "leverage": module.LEVERAGE}
+    if expire_bars is not None:
+        opts["expire_bars"] = expire_bars
+    results = []
+    for label, signal_fn in build(module):
+        res = run_event_backtest(rows, signal_fn, window_size, **opts)
+        winrate = res["win"] / res["total"] if res["total"] else 0
+        print(f"[{name}/{label}] {module.INST_ID} {module.BAR} K线{len(rows)}根 | 收益={res['balance']:.2f} | "
+              f"胜率={winrate:.2%} | 交易{res['total']}笔 | 成交{res['filled']} 撤单{res['expired']}")
+        results.append((label, res))
+    return results
+
+def portfolio_backtest(datasets=None, script="okx_trump_multi_strategy_15m.py", capital=ACCOUNT_CAPITAL):
+    """STRATEGY_PARAMS × ACCOUNT_SUFFIXES 的全部实例在同一条K线流上一次回测，按账户汇总全仓保证金与回撤"""
+    try:
+        module = load_live_module(script)
+    except Exception as e:
+        print(f"[portfolio] 加载 {script} 失败: {e!r}")
+        return None
+    datasets = discover_datasets() if datasets is None else datasets
+    files = datasets.get((module.INST_ID, module.BAR))
+    if not files:
+        print(f"[portfolio] 本地无 {module.INST_ID} {module.BAR} K线数据，跳过")
+        return None
+    rows = load_dataset(files)
+    instances = portfolio_instances(module.STRATEGY_PARAMS, module.ACCOUNT_SUFFIXES)
+    res = simulate_portfolio(rows, instances, margin=module.MARGIN, leverage=module.LEVERAGE, capital=capital)
+    print(f"[portfolio] {module.INST_ID} {module.BAR} K线{len(rows)}根 | {len(res['accounts'])}个账户 × "
+          f"{len(module.STRATEGY_PARAMS)}组参数")
+    for inst in res["instances"]:
+        winrate = inst["wins"] / inst["trades"] if inst["trades"] else 0
+        print(f"  账户{inst['account']}/{inst['label']}: 收益={inst['profit']:.2f} | 胜率={winrate:.2%} | 交易{inst['trades']}笔")
+    for a, account in enumerate(res["accounts"]):
+        print(f"  账户{account}: 期末权益={res['equity'][-1, a]:.2f} | 最大回撤={res['account_drawdown'][a]:.2f} | "
+              f"保证金峰值={res['margin_peak'][a]:.2f} | 最低可用保证金={res['min_free_margin'][a]:.2f}")
+    print(f"  合计: 期末权益={res['total_equity'][-1]:.2f} | 最大回撤={res['max_drawdown']:.2f} | "
+          f"同时占用保证金峰值={res['total_margin_peak']:.2f}")
+    return res
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='实盘信号函数历史回测')
+    parser.add_argument('--strategy', nargs='*', default=sorted(LIVE_STRATEGIES), choices=sorted(LIVE_STRATEGIES), help='策略（默认全部）')
+    parser.add_argument('--portfolio', action='store_true', help='TRUMP 多参数×多账户组合回测')
+    args = parser.parse_args()
+    datasets = discover_datasets()
+    if args.portfolio:
+        portfolio_backtest(datasets)
+        raise SystemExit(0)
+    for name in args.strategy:
+        backtest_live_strategy(name, datasets)
@@ -0,0 +1,155 @@
+"""
+多标的、多周期批量参数筛选
+发现 swap_kline_data/ 与 trump_kline_data/ 下的全部数据集，按 (数据集 × 策略 × 网格) 生成作业，
+作业拆成分段区间任务后按作业规模从大到小提交同一个进程池，最后输出一张汇总排行榜。
+用法: python batch_optimize.py --inst ADA VINE DOGE ETH --bar 15m 5m
+"""
+import argparse
+import concurrent.futures
+import csv
+
+from optimize_trump_strategy import (
+    GRID_CHUNKSIZE, HAS_NUMPY, PARAM_NAMES, frange, iter_amp_triples, parse_kline,
+    search_best_tp_sl_fine
+)
+from utils.grid_scheduler import TopN, ProgressMeter, run_chunked
+from utils.kline_datasets import DATA_ROOTS, dataset_length, discover_datasets, load_arrays, load_dataset
+
+LEADERBOARD_FILE = "batch_leaderboard.csv"
+MIN_BARS = 200  # K线太少的数据集不参与筛选
+
+# ========== 网格与策略 ==========
+GRIDS = {
+    "coarse": {
+        "amp": [round(x, 3) for x in frange(0.012, 0.08, 0.01)],
+        "tp": [round(x, 3) for x in frange(0.01, 0.06, 0.01)],
+        "sl": [round(x, 3) for x in frange(0.01, 0.06, 0.01)],
+    },
+}
+
+def _segmented_tasks(grid):
+    return iter_amp_triples(grid["amp"], grid["amp"], grid["amp"])
+
+def _segmented_combos(grid):
+    return (len(grid["tp"]) * len(grid["sl"])) ** 3
+
+def _segmented_run(klines, amps, grid):
+    tp, sl = grid["tp"], grid["sl"]
+    return search_best_tp_sl_fine(klines, *amps, tp, sl, tp, sl, tp, sl)
+
+# 每个策略: tasks(grid) 生成任务参数，combos(grid) 为每个任务包含的回测次数，run(klines, task, grid) 返回含 profit 的结果
+STRATEGIES = {
+    "segmented_amp": {"tasks": _segmented_tasks, "combos": _segmented_combos, "run": _segmented_run},
+}
+
+# ========== worker ==========
+_WORKER_JOBS = None
+_WORKER_DATA = {}
+
+def _init_batch_worker(jobs):
+    global _WORKER_JOBS
+    _WORKER_JOBS = jobs
+
+def _worker_dataset(files):
+    # 数据集较小，每个worker首次用到时加载一次并缓存（同一数据集的任务共用首次触达索引）
+    key = tuple(files)
+    klines = _WORKER_DATA.get(key)
+    if klines is None:
+        if HAS_NUMPY:
+            # 合并存储的二进制镜像直接内存映射，其余数据集读取后转换
+            klines = load_arrays(files, seconds=True)
+        else:
+            klines = [parse_kline(k) for k in load_dataset(files)]
+        _WORKER_DATA[key] = klines
+    return klines
+
+def _run_batch_chunk(chunk):
+    results = []
+    for job_idx, task in chunk:
+        job = _WORKER_JOBS[job_idx]
+        strategy = STRATEGIES[job["strategy"]]
+        results.append(strategy["run"](_worker_dataset(job["files"]), task, GRIDS[job["grid"]]))
+    return results
+
+# ========== 作业规划 ==========
+def plan_jobs(instruments=None, bars=None, strategies=None, grids=None, roots=DATA_ROOTS):
+    """生成作业列表并按规模（K线数×回测次数）从大到小排序"""
+    jobs = []
+    for (inst_id, bar), files in discover_datasets(roots).items():
+        if instruments and not any(inst_id.upper().startswith(name.upper()) for name in instruments):
+            continue
+        if bars and bar not in bars:
+            continue
+        n_bars = dataset_length(files)
+        if n_bars < MIN_BARS:
+            continue
+        for strategy_name in strategies or STRATEGIES:
+            strategy = STRATEGIES[strategy_name]
+            for grid_name in grids or GRIDS:
+                grid = GRIDS[grid_name]
+                n_tasks = sum(1 for _ in strategy["tasks"](grid))
+                jobs.append({"inst_id": inst_id, "bar": bar, "strategy": strategy_name, "grid": grid_name,
+                             "files": files, "bars": n_bars, "tasks": n_tasks,
+                             "backtests": n_tasks * strategy["combos"](grid)})
+    jobs.sort(key=lambda job: job["bars"] * job["backtests"], reverse=True)
+    return jobs
+
+def run_batch(jobs, topN=5, chunksize=GRID_CHUNKSIZE):
+    """所有作业共用一个进程池，返回按收益排序的汇总排行榜（每个作业保留前topN）"""
+    tops = [TopN(topN) for _ in jobs]
+    meter = ProgressMeter(sum(job["backtests"] for job in jobs), label="批量")
+    combos = [STRATEGIES[job["strategy"]]["combos"](GRIDS[job["grid"]]) for job in jobs]
+    def on_result(seq, item, res):
+        job_idx = item[0]
+        if res is not None:
+            tops[job_idx].push(seq, res)
+        meter.update(combos[job_idx])
+    # 大作业的任务先提交，尾部只剩小作业，进程池不会空等单个长作业
+    items = ((idx, task) for idx, job in enumerate(jobs)
+             for task in STRATEGIES[job["strategy"]]["tasks"](GRIDS[job["grid"]]))
+    with concurrent.futures.ProcessPoolExecutor(initializer=_init_batch_worker, initargs=(jobs,)) as executor:
+        run_chunked(executor, _run_batch_chunk, items, chunksize, on_result)
+    meter.update(0, force=True)
+    leaderboard = []
+    for job, top in zip(jobs, tops):
+        for rank, res in enumerate(top.results()):
+            row = {"inst_id": job["inst_id"], "bar": job["bar"], "strategy": job["strategy"], "grid": job["grid"],
+                   "bars": job["bars"], "job_rank": rank + 1}
+            row.update(res)
+            leaderboard.append(row)
+    leaderboard.sort(key=lambda row: row["profit"], reverse=True)
+    return leaderboard
+
+def write_leaderboard(leaderboard, path=LEADERBOARD_FILE):
+    fields = ["inst_id", "bar", "strategy", "grid", "bars", "job_rank"] + list(PARAM_NAMES) + ["profit"]
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=fields, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(leaderboard)
+    print(f"汇总排行榜已保存到: {path}")
+
+# ========== 主流程 ==========
+def get_config():
+    parser = argparse.ArgumentParser(description='多标的多周期批量参数筛选')
+    parser.add_argument('--inst', nargs='*', default=None, help='标的前缀，如 ADA VINE DOGE ETH（默认全部）')
+    parser.add_argument('--bar', nargs='*', default=None, help='K线周期，如 15m 5m（默认全部）')
+    parser.add_argument('--strategy', nargs='*', default=None, choices=sorted(STRATEGIES), help='策略（默认全部）')
+    parser.add_argument('--grid', nargs='*', default=None, choices=sorted(GRIDS), help='参数网格（默认全部）')
+    parser.add_argument('--top', type=int, default=5, help='每个作业保留的前N名')
+    parser.add_argument('--output', type=str, default=LEADERBOARD_FILE, help='排行榜CSV路径')
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = get_config()
+    jobs = plan_jobs(args.inst, args.bar, args.strategy, args.grid)
+    if not jobs:
+        print("未发现可用的K线数据集")
+        raise SystemExit(0)
+    print(f"共 {len(jobs)} 个作业:")
+    for job in jobs:
+        print(f"  {job['inst_id']} {job['bar']} {job['strategy']}/{job['grid']} | K线 {job['bars']} 根 | 回测 {job['backtests']} 次")
+    leaderboard = run_batch(jobs, topN=args.top)
+    write_leaderboard(leaderboard, args.output)
+    for i, row in enumerate(leaderboard[:20]):
+        print(f"Top{i+1}: {row['inst_id']} {row['bar']} | " +
+              ", ".join(f"{name}={row[name]}" for name in PARAM_NAMES) + f" | 收益={row['profit']:.2f}")
@@ -1,11 +1,31 @@
 import requests
 import time
 import itertools
+import random
+import bisect
 from datetime import datetime, timedelta, timezone
 import os
 import csv
-import glob
 import concurrent.futures
+import contextlib
+import hashlib
+import json
+from utils.backtest_kernel import (
+    HAS_NUMPY, LEVERAGE, MARGIN, METRIC_SIGNS, KlineArrays, np, as_kline_arrays, build_segment_plan, plan_from_segments,
+    backtest_segmented_kernel, backtest_segmented_metrics, segment_reach, collapse_unreachable
+)
+from utils.grid_scheduler import TopN, ProgressMeter, ChunkCheckpoint, chunked, run_chunked
+from utils.result_cache import ResultCache, dataset_fingerprint
+from utils.param_search import OPTIMIZERS, PARAM_NAMES, config_to_params
+from utils.kline_datasets import discover_datasets, load_arrays, load_dataset
+from utils.intrabar import make_resolver
+from utils.limit_orders import ENTRY_CLOSE, ENTRY_MARKET, backtest_segmented_limit
+from utils.position_book import backtest_segmented_pyramiding
+if HAS_NUMPY:
+    from utils.shared_klines import SharedKlines, attach_shared_klines
+    from utils.trade_ledger import TradeLedger
+    from utils.profit_surface import create_surface, write_block
+    from utils.monte_carlo import simulate_trades
 
 # ========== 采集K线相关函数 ==========
 RETRY_LIMIT = 5
@@ -114,6 +134,29 @@ DAYS = 30
 TP_RANGE = [round(x, 3) for x in frange(0.01, 0.06, 0.002)]
 SL_RANGE = [round(x, 3) for x in frange(0.01, 0.06, 0.002)]
 AMP_RANGE = [round(x, 3) for x in frange(0.01, 0.08, 0.002)]
+GRID_CHUNKSIZE = 4  # 每个进程池任务包含的分段区间组合数
+EVAL_CHUNKSIZE = 64  # 逐组参数回测（自适应搜索）时每个任务包含的参数组数
+SEARCH_METHOD = "grid"  # grid=网格+微调；halving/coordinate 见 utils/param_search.OPTIMIZERS；incremental=只增量回测已保存的候选参数；walkforward=前推分析
+SEARCH_PRUNE = True  # TP/SL搜索使用分支定界剪枝（结果与穷举相同，仅按 profit 排名时生效）
+RANK_METRIC = "profit"  # 排名指标：profit/winrate/trades/max_drawdown/sharpe/max_losing_streak
+PRUNE_EPS = 1e-6  # 上界比较的浮点余量，只剪掉确定无法超过当前最优的子树
+USE_RESULT_CACHE = True  # 回测结果写入磁盘缓存（utils/result_cache），重复的参数直接命中
+CACHE_LOOKUP_BATCH = 256  # 派发前每批查询缓存的参数组数
+# 缓存中的策略标识，回测逻辑改变时需要更换，避免命中旧结果
+AMP_SEARCH_STRATEGY = "segmented_amp_search_v2"  # 参数: (分段区间, TP/SL网格) -> 该区间最优结果（含绩效指标）
+CUSTOM_STRATEGY = "segmented_custom_v1"  # 参数: (完整参数元组, 使用的最近K线数) -> 收益
+USE_CHECKPOINT = True  # 分段区间搜索把完成的块追加写入检查点，中断后重跑只补缺失部分
+CHECKPOINT_DIR = "optimizer_checkpoints"
+STATE_FILE = os.path.join("optimizer_state", "segmented_states.json")  # 候选参数的增量回测状态
+WF_TRAIN_BARS = 96 * 14  # 前推分析每折训练K线数（15m约14天）
+WF_TEST_BARS = 96 * 3  # 每折样本外测试K线数，折与折之间按测试长度滚动
+EXPORT_SURFACE = False  # 网格搜索后额外导出完整收益曲面（memmap，见 utils/profit_surface）
+SURFACE_FILE = os.path.join("optimizer_state", "profit_surface.npy")
+MONTE_CARLO_SIMS = 2000  # 网格搜索后对每组Top参数做交易重抽样的次数，0=不做
+LIMIT_ORDER_CHECK = True  # 网格搜索后按限价单成交模型（挂单有效期、越过止盈撤单）复核Top参数
+LIMIT_EXPIRE_BARS = 4  # 复核时挂单有效K线数（15m×4=1小时）
+PYRAMIDING = 10  # 网格搜索后按允许加仓（最多同时持有的笔数）复核Top参数，0=不做
+INTRABAR_BAR = "5m"  # 同一根K线同时触及止盈止损时用该周期的本地K线判断先后（只加载歧义K线所在文件），None=一律按止损计
 
 def parse_kline(k):
     return {
@@ -124,13 +167,65 @@ def parse_kline(k):
         "close": float(k[4])
     }
 
+# backtest_segmented 固定分段参数: (止盈, 止损, 振幅下限, 振幅上限)
+SEGMENTED_PARAMS = [
+    (0.05, 0.044, 0.012, 0.022),
+    (0.046, 0.046, 0.022, 0.05),
+    (0.02, 0.03, 0.05, None),
+]
+
 def backtest_segmented(klines):
+    """
+    固定分段参数回测，返回 (balance, winrate, total, ledger, seg_count, seg_profit)。
+    ledger 为列式交易账本 TradeLedger（权益曲线/回撤/盈亏比等报表见 utils/trade_ledger）；
+    无numpy时退回 backtest_segmented_loop，第四项为逐笔字典列表。
+    """
+    if not HAS_NUMPY:
+        return backtest_segmented_loop(klines)
+    (take_profit_1, stop_loss_1, amp_1_min, amp_1_max), \
+        (take_profit_2, stop_loss_2, amp_2_min, amp_2_max), \
+        (take_profit_3, stop_loss_3, amp_3_min, _) = SEGMENTED_PARAMS
+    arrays = as_kline_arrays(klines)
+    amp = arrays.amp
+    seg = np.select([amp >= amp_3_min,
+                     (amp >= amp_2_min) & (amp < amp_2_max),
+                     (amp >= amp_1_min) & (amp < amp_1_max)], [2, 1, 0], default=-1)
+    # 持仓期间每根K线都检查平仓，首次触达索引建在全部K线上
+    checks, touch = arrays.checks_for(float("-inf"))
+    plan = plan_from_segments(arrays, seg, checks, touch)
+    raw_trades = []
+    balance = backtest_segmented_kernel(plan, take_profit_1, stop_loss_1, take_profit_2, stop_loss_2,
+                                        take_profit_3, stop_loss_3, trades=raw_trades)
+    seg_count = [0.0, 0.0, 0.0]
+    seg_profit = [0.0, 0.0, 0.0]
+    # 空仓期间（含开仓步）落入分段的信号K计入 seg_count，十字星同样计数
+    seg_hits = [np.concatenate(([0], np.cumsum(seg[:-1] == s))) for s in range(3)]
+    free_start = 1
+    for entry_step, exit_step, side, pos_seg, entry, exit_price, result in raw_trades:
+        for s in range(3):
+            seg_count[s] += float(seg_hits[s][entry_step] - seg_hits[s][free_start - 1])
+        # 按成交顺序逐笔累加，与循环版逐位一致
+        seg_profit[pos_seg] += result
+        free_start = exit_step + 1
+    ledger = TradeLedger.from_records([(entry_step - 1, exit_step, side, pos_seg + 1, entry, exit_price, result)
+                                       for entry_step, exit_step, side, pos_seg, entry, exit_price, result in raw_trades])
+    # 最后一段空仓：直到未平仓的最后一笔开仓步，或直到序列末尾
+    k = bisect.bisect_left(plan["entries"], free_start)
+    end_step = plan["entries"][k] if k < len(plan["entries"]) else len(arrays) - 1
+    for s in range(3):
+        seg_count[s] += float(seg_hits[s][end_step] - seg_hits[s][free_start - 1])
+    total = len(ledger)
+    win = int(np.count_nonzero(ledger.pnl > 0))
+    winrate = win / total if total > 0 else 0
+    return balance, winrate, total, ledger, seg_count, seg_profit
+
+def backtest_segmented_loop(klines):
+    # 逐根K线循环版本（无numpy时的回退实现）
     LEVERAGE = 10
     MARGIN = 10
-    # 参数定义
-    take_profit_1, stop_loss_1, amp_1_min, amp_1_max = 0.05, 0.044, 0.012, 0.022
-    take_profit_2, stop_loss_2, amp_2_min, amp_2_max = 0.046, 0.046, 0.022, 0.05
-    take_profit_3, stop_loss_3, amp_3_min = 0.02, 0.03, 0.05
+    (take_profit_1, stop_loss_1, amp_1_min, amp_1_max), \
+        (take_profit_2, stop_loss_2, amp_2_min, amp_2_max), \
+        (take_profit_3, stop_loss_3, amp_3_min, _) = SEGMENTED_PARAMS
     balance = 0
     win = 0
     total = 0
@@ -243,60 +338,411 @@ def save_klines_to_csv(klines, symbol, bar):
     return file_path
 
 def load_klines_from_csv(symbol, bar):
-    import csv
-    import os
-    pattern = os.path.join(SAVE_DIR, f"{symbol}_{bar}_*.csv")
-    files = sorted(glob.glob(pattern))
+    # 合并该标的周期的全部本地文件（合并存储与各次保存的分片），而不是只取文件名排序最后的一个
+    files = discover_datasets((SAVE_DIR,)).get((symbol, bar))
     if not files:
         return None
-    latest_file = files[-1]
-    klines = []
-    with open(latest_file, "r", encoding="utf-8") as f:
-        reader = csv.reader(f)
-        next(reader)  # 跳过表头
-        for row in reader:
-            # [timestamp, open, high, low, close]
-            klines.append([int(row[0]), float(row[1]), float(row[2]), float(row[3]), float(row[4])])
-    print(f"已从本地文件加载K线: {latest_file}，共{len(klines)}根")
+    klines = load_dataset(files)
+    print(f"已从本地加载K线: {len(files)} 个文件，共{len(klines)}根")
     return klines
 
+def load_kline_arrays(symbol, bar):
+    """本地全部文件合并后的 KlineArrays（时间戳为秒，与 parse_kline 一致）；合并存储的 .klb 镜像直接内存映射"""
+    files = discover_datasets((SAVE_DIR,)).get((symbol, bar))
+    if not files:
+        return None
+    arrays = load_arrays(files, seconds=True)
+    print(f"已从本地加载K线: {len(files)} 个文件，共{len(arrays)}根")
+    return arrays
+
+def kline_dicts_of(klines):
+    # 逐根处理的旧接口（增量回测状态）使用 parse_kline 格式的字典，只在调用处由列数组生成
+    if not HAS_NUMPY or not isinstance(klines, KlineArrays):
+        return klines
+    return [{"ts": ts, "open": o, "high": h, "low": l, "close": c} for ts, o, h, l, c in
+            zip(klines.ts.tolist(), klines.open.tolist(), klines.high.tolist(), klines.low.tolist(), klines.close.tolist())]
+
+# ========== 小周期判定同K线止盈止损 ==========
+def intrabar_resolver(symbol=SYMBOL, bar="15m", lower_bar=INTRABAR_BAR):
+    """本地 lower_bar 数据构建的小周期判定器；没有数据或 lower_bar 为 None 时返回 None（按止损计）"""
+    files = discover_datasets().get((symbol, lower_bar)) if lower_bar else None
+    return make_resolver(files, bar) if files else None
+
+def attach_intrabar(arrays, symbol=SYMBOL, bar="15m", lower_bar=INTRABAR_BAR, resolver=None):
+    """
+    给列式K线挂上小周期判定器：回测内核遇到同一根K线同时触及止盈止损时，按需加载该K线时间段的
+    小周期K线判断先后；本地没有小周期数据或 lower_bar 为 None 时保持按止损计。
+    """
+    resolver = resolver or intrabar_resolver(symbol, bar, lower_bar)
+    if resolver is not None:
+        arrays.intrabar = resolver
+    return arrays
+
+def strategy_id(base, klines):
+    # 实际挂上的小周期判定器及其数据会改变回测结果，缓存与检查点的策略标识随之区分
+    intrabar = getattr(klines, "intrabar", None)
+    return f"{base}:intrabar-{intrabar.fingerprint}" if intrabar is not None else base
+
+def intrabar_spec(klines):
+    # 父进程挂上的判定器交给 worker 按同样的文件重建；未挂判定器时 worker 也不挂
+    intrabar = getattr(klines, "intrabar", None)
+    return intrabar.spec if intrabar is not None else None
+
 # ========== 并行参数优化 ==========
-def parallel_grid_search(klines, amp_grid, tp_grid, sl_grid, topN=20):
-    tasks = []
-    for amp1_min in amp_grid:
-        for amp2_min in amp_grid:
+# worker 进程内的K线与TP/SL网格，由进程池初始化函数设置一次，任务只传分段区间元组
+_WORKER_KLINES = None
+_WORKER_GRIDS = None
+_WORKER_RANK = "profit"
+
+def _init_grid_worker(klines_spec, grids, rank_by="profit", resolver_spec=None):
+    global _WORKER_KLINES, _WORKER_GRIDS, _WORKER_RANK
+    _WORKER_KLINES = attach_shared_klines(klines_spec) if HAS_NUMPY else klines_spec
+    if resolver_spec is not None:
+        _WORKER_KLINES.intrabar = make_resolver(*resolver_spec)
+    _WORKER_GRIDS = grids
+    _WORKER_RANK = rank_by
+
+def _search_amp_chunk(chunk):
+    # 指标在worker内算好，只有每个分段区间的最优结果（含指标）回传父进程
+    return [search_best_tp_sl_fine(_WORKER_KLINES, *amps, *_WORKER_GRIDS, rank_by=_WORKER_RANK) for _, amps in chunk]
+
+@contextlib.contextmanager
+def grid_search_pool(klines, grids, rank_by="profit"):
+    """K线放入共享内存后创建进程池；无numpy时K线随初始化参数每个worker只传一次"""
+    if HAS_NUMPY:
+        with SharedKlines(klines) as shared:
+            initargs = (shared.spec, grids, rank_by, intrabar_spec(klines))
+            with concurrent.futures.ProcessPoolExecutor(initializer=_init_grid_worker, initargs=initargs) as executor:
+                yield executor
+    else:
+        with concurrent.futures.ProcessPoolExecutor(initializer=_init_grid_worker, initargs=(klines, grids, rank_by)) as executor:
+            yield executor
+
+_WORKER_RECENT = {}
+
+def _worker_recent_klines(n_bars):
+    # 最近 n_bars 根K线的视图，按长度缓存，同一长度的所有参数共用其触达索引
+    klines = _WORKER_KLINES
+    if n_bars >= len(klines):
+        return klines
+    cached = _WORKER_RECENT.get(n_bars)
+    if cached is None:
+        cached = klines.slice(len(klines) - n_bars, len(klines)) if HAS_NUMPY else klines[-n_bars:]
+        _WORKER_RECENT[n_bars] = cached
+    return cached
+
+def _evaluate_params_chunk(chunk):
+    return [backtest_segmented_custom(_worker_recent_klines(n_bars), *config) for config, n_bars in chunk]
+
+_WORKER_WINDOWS = {}
+
+def _worker_window(start, stop):
+    # [start, stop) 区间的K线视图，按区间缓存，同一折的所有分段区间共用其首次触达索引
+    cached = _WORKER_WINDOWS.get((start, stop))
+    if cached is None:
+        cached = _WORKER_KLINES.slice(start, stop) if HAS_NUMPY else _WORKER_KLINES[start:stop]
+        _WORKER_WINDOWS[(start, stop)] = cached
+    return cached
+
+def _walk_forward_chunk(chunk):
+    # 每项 (折, 分段区间)：在训练区间上搜索最优TP/SL，并立即回测紧随其后的测试区间
+    results = []
+    for (train_start, train_end, test_end), amps in chunk:
+        best = search_best_tp_sl_fine(_worker_window(train_start, train_end), *amps, *_WORKER_GRIDS)
+        if best is not None:
+            best = dict(best)
+            best['oos_profit'] = backtest_segmented_custom(_worker_window(train_end, test_end),
+                                                           *(best[name] for name in PARAM_NAMES))
+        results.append(best)
+    return results
+
+def _surface_amp_chunk(chunk):
+    # 每项 (曲面路径, 分段区间下标, 分段区间)：遍历全部TP/SL组合，整块写入曲面，只回传完成标记
+    for path, index, amps in chunk:
+        run = make_segmented_runner(_WORKER_KLINES, *amps)
+        block = np.array([run(*combo) for combo in itertools.product(*_WORKER_GRIDS)], dtype=np.float32)
+        write_block(path, index, block.reshape([len(g) for g in _WORKER_GRIDS]))
+    return [True] * len(chunk)
+
+def make_pool_evaluator(executor, total_bars, chunksize=EVAL_CHUNKSIZE, cache=None, dataset=None, strategy=CUSTOM_STRATEGY):
+    """
+    返回 evaluate(configs, fraction)：在进程池上回测完整参数元组，fraction 为使用的最近K线比例。
+    传入 cache 时先查缓存，只派发未命中的参数，新结果写回缓存；strategy 为缓存中的策略标识（见 strategy_id）。
+    """
+    def evaluate(configs, fraction=1.0):
+        n_bars = total_bars if fraction >= 1.0 else max(2, int(total_bars * fraction))
+        items = [(tuple(c), n_bars) for c in configs]
+        found = cache.get_many(dataset, strategy, items) if cache else {}
+        todo = [item for item in dict.fromkeys(items) if item not in found]
+        def on_result(seq, item, profit):
+            found[item] = profit
+        run_chunked(executor, _evaluate_params_chunk, todo, chunksize, on_result)
+        if cache:
+            cache.put_many(dataset, strategy, [(item, found[item]) for item in todo])
+        return [found[item] for item in items]
+    return evaluate
+
+def run_optimizer(klines, method, space, seed=0, cache=None, **opts):
+    """用 OPTIMIZERS 中的搜索方法在进程池上寻优，并输出回测次数与找到最优所用的回测次数"""
+    dataset = dataset_fingerprint(klines) if cache else None
+    with grid_search_pool(klines, None) as executor:
+        evaluate = make_pool_evaluator(executor, len(klines), cache=cache, dataset=dataset,
+                                       strategy=strategy_id(CUSTOM_STRATEGY, klines))
+        summary = OPTIMIZERS[method](evaluate, space, random.Random(seed), **opts)
+    best = summary['best']
+    print(f"[{method}] 回测次数: {summary['evaluations']} (折合全量 {summary['bar_evaluations']:.0f} 次) | "
+          f"找到最优用时: 第{summary['evaluations_to_best']}次 | 最优收益: {best['profit'] if best else 'N/A'}")
+    return summary
+
+def grid_size(grids):
+    """各网格长度之积，即每个分段区间下的 TP/SL 组合数"""
+    combos = 1
+    for g in grids:
+        combos *= len(g)
+    return combos
+
+def ensure_parent_dir(path):
+    """输出文件所在目录不存在时创建"""
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+
+def iter_amp_triples(amp1_grid, amp2_grid, amp3_grid):
+    for amp1_min in amp1_grid:
+        for amp2_min in amp2_grid:
             if amp2_min <= amp1_min: continue
-            for amp3_min in amp_grid:
+            for amp3_min in amp3_grid:
                 if amp3_min <= amp2_min: continue
-                tasks.append((amp1_min, amp2_min, amp3_min))
-    print(f"共需遍历分段区间组合: {len(tasks)}")
-    results = []
-    with concurrent.futures.ProcessPoolExecutor() as executor:
-        future_to_amp = {executor.submit(search_best_tp_sl, klines, amp1_min, amp2_min, amp3_min, tp_grid, sl_grid): (amp1_min, amp2_min, amp3_min) for (amp1_min, amp2_min, amp3_min) in tasks}
-        for i, future in enumerate(concurrent.futures.as_completed(future_to_amp)):
-            res = future.result()
-            results.append(res)
-            if (i+1) % 50 == 0:
-                print(f"已完成{i+1}/{len(tasks)}组分段区间")
-    results = sorted(results, key=lambda x: x['profit'], reverse=True)[:topN]
+                yield (amp1_min, amp2_min, amp3_min)
+
+def run_amp_search(klines, amp_grids, grids, topN, chunksize=GRID_CHUNKSIZE, label="", cache=None, checkpoint=USE_CHECKPOINT,
+                   rank_by=RANK_METRIC):
+    """
+    分段区间组合分块提交进程池，流式保留前topN，并输出吞吐与ETA。
+    传入 cache 时派发前按 (分段区间, TP/SL网格) 查缓存，命中的区间不再回测，新结果写回缓存。
+    checkpoint 为真时每个完成块追加写入检查点，中断后以相同输入重跑只派发缺失的区间，
+    前N名按原提交序号合并，与不中断的运行完全相同。
+    rank_by 为排名指标（见 METRIC_SIGNS），每个分段区间按它选出最优，前N名也按它排序。
+    """
+    total = sum(1 for _ in iter_amp_triples(*amp_grids))
+    combos = grid_size(grids)
+    print(f"{label}共需遍历分段区间组合: {total}，每组TP/SL组合: {combos}")
+    sign = METRIC_SIGNS[rank_by]
+    top = TopN(topN, key=lambda r: sign * r[rank_by])
+    meter = ProgressMeter(total * combos, label=label)
+    strategy = strategy_id(f"{AMP_SEARCH_STRATEGY}:{rank_by}", klines)
+    dataset = dataset_fingerprint(klines) if cache or checkpoint else None
+    grid_key = tuple(tuple(g) for g in grids)
+    new_results = []
+    hits = 0
+    saved = {}
+    if checkpoint:
+        run_key = hashlib.sha1(json.dumps([dataset, strategy, amp_grids, grids]).encode()).hexdigest()
+        checkpoint = ChunkCheckpoint(os.path.join(CHECKPOINT_DIR, f"amp_search_{run_key[:16]}.jsonl"), run_key)
+        saved = checkpoint.completed
+        if saved:
+            print(f"{label}从检查点恢复已完成的分段区间组合: {len(saved)}/{total}")
+    def flush():
+        cache.put_many(dataset, strategy, new_results)
+        del new_results[:]
+    def uncached(triples):
+        # 分批查缓存，命中的直接计入前N名，只把未命中的区间交给进程池
+        nonlocal hits
+        for block in chunked(enumerate(triples), CACHE_LOOKUP_BATCH):
+            block = [(seq, amps) for seq, amps in block if seq not in saved]
+            found = cache.get_many(dataset, strategy, [(amps, grid_key) for _, amps in block]) if cache and block else {}
+            for seq, amps in block:
+                res = found.get((amps, grid_key))
+                if res is None:
+                    yield seq, amps
+                else:
+                    hits += 1
+                    top.push(seq, res)
+                    meter.update(combos)
+    def on_result(_, item, res):
+        seq, amps = item
+        top.push(seq, res)
+        meter.update(combos)
+        if cache:
+            new_results.append(((amps, grid_key), res))
+            if len(new_results) >= CACHE_LOOKUP_BATCH:
+                flush()
+    def on_chunk(records):
+        checkpoint.record([(seq, amps, res) for _, (seq, amps), res in records])
+    for seq, (amps, res) in saved.items():
+        top.push(seq, res)
+        meter.update(combos)
+        if cache:
+            new_results.append(((tuple(amps), grid_key), res))
+    try:
+        with grid_search_pool(klines, grids, rank_by) as executor:
+            run_chunked(executor, _search_amp_chunk, uncached(iter_amp_triples(*amp_grids)), chunksize, on_result,
+                        on_chunk=on_chunk if checkpoint else None)
+    finally:
+        if cache:
+            flush()
+        if checkpoint:
+            checkpoint.close()
+    # 完整跑完才删除检查点；异常退出时保留，下次以相同输入运行即从断点继续
+    if checkpoint:
+        os.remove(checkpoint.path)
+    meter.update(0, force=True)
+    if cache:
+        print(f"{label}结果缓存命中分段区间组合: {hits}/{total}")
+    return top.results()
+
+def parallel_grid_search(klines, amp_grid, tp_grid, sl_grid, topN=20, chunksize=GRID_CHUNKSIZE, cache=None, rank_by=RANK_METRIC):
+    grids = (tp_grid, sl_grid, tp_grid, sl_grid, tp_grid, sl_grid)
+    return run_amp_search(klines, (amp_grid, amp_grid, amp_grid), grids, topN, chunksize, cache=cache, rank_by=rank_by)
+
+def walk_forward_folds(n_bars, train_bars=WF_TRAIN_BARS, test_bars=WF_TEST_BARS):
+    """滚动前推的 (训练起点, 训练终点=测试起点, 测试终点) 列表，测试区间首尾相接不重叠"""
+    folds = []
+    start = 0
+    while start + train_bars + test_bars <= n_bars:
+        folds.append((start, start + train_bars, start + train_bars + test_bars))
+        start += test_bars
+    return folds
+
+def walk_forward_search(klines, amp_grid, tp_grid, sl_grid, train_bars=WF_TRAIN_BARS, test_bars=WF_TEST_BARS,
+                        topN=5, chunksize=GRID_CHUNKSIZE):
+    """
+    前推分析：所有折的 (折, 分段区间) 任务提交到同一个进程池，K线只放入共享内存一次，
+    各折按训练收益保留前topN，每组参数同时给出样本外收益 oos_profit。
+    返回 [{"fold", "train", "test", "top"}]，并打印各折Top1样本外收益之和。
+    """
+    folds = walk_forward_folds(len(klines), train_bars, test_bars)
+    amp_grids = (amp_grid, amp_grid, amp_grid)
+    grids = (tp_grid, sl_grid, tp_grid, sl_grid, tp_grid, sl_grid)
+    n_triples = sum(1 for _ in iter_amp_triples(*amp_grids))
+    combos = grid_size(grids)
+    print(f"前推分析共 {len(folds)} 折，每折分段区间组合: {n_triples}，每组TP/SL组合: {combos}")
+    tops = [TopN(topN) for _ in folds]
+    meter = ProgressMeter(len(folds) * n_triples * combos, label="前推")
+    fold_index = {fold: i for i, fold in enumerate(folds)}
+    def on_result(seq, item, res):
+        if res is not None:
+            tops[fold_index[item[0]]].push(seq, res)
+        meter.update(combos)
+    items = ((fold, amps) for fold in folds for amps in iter_amp_triples(*amp_grids))
+    with grid_search_pool(klines, grids) as executor:
+        run_chunked(executor, _walk_forward_chunk, items, chunksize, on_result)
+    meter.update(0, force=True)
+    report = []
+    oos_total = 0
+    for i, ((train_start, train_end, test_end), top) in enumerate(zip(folds, tops)):
+        results = top.results()
+        report.append({"fold": i, "train": (train_start, train_end), "test": (train_end, test_end), "top": results})
+        if results:
+            oos_total += results[0]['oos_profit']
+            print(f"第{i+1}折 训练[{train_start},{train_end}) 测试[{train_end},{test_end}) | "
+                  f"Top1 样本内收益={results[0]['profit']:.2f} 样本外收益={results[0]['oos_profit']:.2f}")
+    print(f"前推分析各折Top1样本外收益合计: {oos_total:.2f}")
+    return report
+
+def format_metrics(res):
+    if 'trades' not in res:
+        return ""
+    return (f" | 胜率={res['winrate']:.2%} 笔数={res['trades']} 最大回撤={res['max_drawdown']:.2f} "
+            f"夏普={res['sharpe']:.2f} 最长连亏={res['max_losing_streak']}")
+
+def export_profit_surface(klines, amp_grid, tp_grid, sl_grid, path=SURFACE_FILE, chunksize=GRID_CHUNKSIZE):
+    """
+    把 (amp1, amp2, amp3, tp1, sl1, tp2, sl2, tp3, sl3) 全部组合的收益写入 memmap float32 曲面，
+    worker 直接写各自的分段区间子块，父进程不经手收益数据。查询见 utils/profit_surface.ProfitSurface。
+    """
+    if not HAS_NUMPY:
+        raise RuntimeError("导出收益曲面需要安装 numpy")
+    ensure_parent_dir(path)
+    grids = (tp_grid, sl_grid, tp_grid, sl_grid, tp_grid, sl_grid)
+    shape = create_surface(path, PARAM_NAMES, (amp_grid, amp_grid, amp_grid) + grids)
+    combos = grid_size(grids)
+    pos = {amp: i for i, amp in enumerate(amp_grid)}
+    triples = list(iter_amp_triples(amp_grid, amp_grid, amp_grid))
+    print(f"导出收益曲面 {shape} -> {path}，分段区间组合: {len(triples)}，每组TP/SL组合: {combos}")
+    meter = ProgressMeter(len(triples) * combos, label="曲面")
+    items = ((path, tuple(pos[a] for a in amps), amps) for amps in triples)
+    with grid_search_pool(klines, grids) as executor:
+        run_chunked(executor, _surface_amp_chunk, items, chunksize, lambda *_: meter.update(combos))
+    meter.update(0, force=True)
+    return path
+
+def trade_pnls(klines, params):
+    """一组参数的逐笔盈亏（按成交顺序）"""
+    plan = build_segment_plan(klines, params['amp1_min'], params['amp2_min'], params['amp3_min'])
+    trades = []
+    backtest_segmented_kernel(plan, *(params[name] for name in PARAM_NAMES[3:]), trades=trades)
+    return [t[6] for t in trades]
+
+def monte_carlo_report(klines, results, n_sims=MONTE_CARLO_SIMS, method="bootstrap", seed=0):
+    """对每组候选参数的交易序列重抽样，输出收益/回撤分位数与破产概率，结果写入 res['monte_carlo']"""
+    if not HAS_NUMPY:
+        raise RuntimeError("蒙特卡洛分析需要安装 numpy")
+    print(f"\n【蒙特卡洛稳健性分析】{method} × {n_sims}")
+    for i, res in enumerate(results):
+        mc = simulate_trades(trade_pnls(klines, res), n_sims=n_sims, method=method, rng=seed + i)
+        res['monte_carlo'] = mc
+        print(f"Top{i+1}: 收益 P5/P50/P95={mc['final'][5]:.2f}/{mc['final'][50]:.2f}/{mc['final'][95]:.2f} | "
+              f"最大回撤 P50/P95={mc['max_drawdown'][50]:.2f}/{mc['max_drawdown'][95]:.2f} | "
+              f"破产概率={mc['ruin_probability']:.2%}")
+    return results
+
+def limit_order_report(klines, results, expire_bars=LIMIT_EXPIRE_BARS, entry=ENTRY_CLOSE, slippage=0.0):
+    """
+    按实盘的限价挂单方式复核候选参数（utils/limit_orders），结果写入 res['limit_profit'] 与 res['limit_stats']。
+    限价引擎逐根K线检查止盈止损（与实盘一致，和搜索内核只在可检查步检查不同），因此对照基准用同一引擎的
+    立即成交模式（ENTRY_MARKET）计算，写入 res['market_profit']；两者之差只来自成交方式。
+    """
+    if not HAS_NUMPY:
+        raise RuntimeError("限价单复核需要安装 numpy")
+    print(f"\n【限价单成交复核】有效期{expire_bars}根K线，挂单价={entry}（对照: 同一引擎信号K收盘价立即成交）")
+    for i, res in enumerate(results):
+        stats = {}
+        params = [res[name] for name in PARAM_NAMES[3:]]
+        plan = build_segment_plan(klines, res['amp1_min'], res['amp2_min'], res['amp3_min'])
+        market = backtest_segmented_limit(plan, *params, entry=ENTRY_MARKET)
+        profit = backtest_segmented_limit(plan, *params, expire_bars=expire_bars, entry=entry, slippage=slippage,
+                                          stats=stats)
+        res['market_profit'], res['limit_profit'], res['limit_stats'] = market, profit, stats
+        print(f"Top{i+1}: 立即成交收益={market:.2f} | 限价单收益={profit:.2f} | 搜索收益={res['profit']:.2f} | "
+              f"挂单{stats['orders']} 成交{stats['filled']} 到期{stats['expired']} 越过止盈撤单{stats['cancelled']}")
+    return results
+
+def pyramiding_report(klines, results, pyramiding=PYRAMIDING):
+    """
+    按允许加仓的持仓簿（utils/position_book）复核候选参数，结果写入 res['pyramiding_profit']。
+    持仓簿的平仓规则与搜索内核一致（pyramiding=1 时与 res['profit'] 相同），两者差异只来自加仓。
+    """
+    if not HAS_NUMPY:
+        raise RuntimeError("加仓复核需要安装 numpy")
+    print(f"\n【加仓复核】最多同时持有{pyramiding}笔")
+    for i, res in enumerate(results):
+        plan = build_segment_plan(klines, res['amp1_min'], res['amp2_min'], res['amp3_min'])
+        profit, still_open, peak = backtest_segmented_pyramiding(plan, *(res[name] for name in PARAM_NAMES[3:]),
+                                                                 pyramiding=pyramiding)
+        res['pyramiding_profit'] = profit
+        print(f"Top{i+1}: 单笔持仓收益={res['profit']:.2f} | 加仓收益={profit:.2f} | "
+              f"最大同时持仓{peak}笔，期末未平仓{still_open}笔")
     return results
 
 def search_best_tp_sl(klines, amp1_min, amp2_min, amp3_min, tp_grid, sl_grid):
-    best = None
-    for tp1 in tp_grid:
-        for sl1 in sl_grid:
-            for tp2 in tp_grid:
-                for sl2 in sl_grid:
-                    for tp3 in tp_grid:
-                        for sl3 in sl_grid:
-                            profit = backtest_segmented_custom(klines, amp1_min, amp2_min, amp3_min, tp1, sl1, tp2, sl2, tp3, sl3)
-                            if best is None or profit > best['profit']:
-                                best = {'amp1_min': amp1_min, 'amp2_min': amp2_min, 'amp3_min': amp3_min,
-                                        'tp1': tp1, 'sl1': sl1, 'tp2': tp2, 'sl2': sl2, 'tp3': tp3, 'sl3': sl3,
-                                        'profit': profit}
-    return best
+    return search_best_tp_sl_fine(klines, amp1_min, amp2_min, amp3_min, tp_grid, sl_grid, tp_grid, sl_grid, tp_grid, sl_grid)
+
+def make_segmented_runner(klines, amp1_min, amp2_min, amp3_min):
+    # 同一分段区间下的所有TP/SL组合共用一次分段预计算；无numpy时退回逐根循环
+    if HAS_NUMPY:
+        plan = build_segment_plan(klines, amp1_min, amp2_min, amp3_min)
+        return lambda tp1, sl1, tp2, sl2, tp3, sl3: backtest_segmented_kernel(plan, tp1, sl1, tp2, sl2, tp3, sl3)
+    return lambda tp1, sl1, tp2, sl2, tp3, sl3: backtest_segmented_custom_loop(klines, amp1_min, amp2_min, amp3_min, tp1, sl1, tp2, sl2, tp3, sl3)
 
 def backtest_segmented_custom(klines, amp1_min, amp2_min, amp3_min, tp1, sl1, tp2, sl2, tp3, sl3):
+    if HAS_NUMPY:
+        plan = build_segment_plan(klines, amp1_min, amp2_min, amp3_min)
+        return backtest_segmented_kernel(plan, tp1, sl1, tp2, sl2, tp3, sl3)
+    return backtest_segmented_custom_loop(klines, amp1_min, amp2_min, amp3_min, tp1, sl1, tp2, sl2, tp3, sl3)
+
+def backtest_segmented_custom_loop(klines, amp1_min, amp2_min, amp3_min, tp1, sl1, tp2, sl2, tp3, sl3):
+    # 逐根K线循环版本（无numpy时的回退实现，也是列式内核的对照基准）
     LEVERAGE = 10
     MARGIN = 10
     balance = 0
@@ -366,7 +812,7 @@ def backtest_segmented_custom(klines, amp1_min, amp2_min, amp3_min, tp1, sl1, tp
                     position = None
     return balance
 
-def local_fine_tune(klines, base_params, topN=5):
+def local_fine_tune(klines, base_params, topN=5, chunksize=GRID_CHUNKSIZE, cache=None, rank_by=RANK_METRIC):
     amp1_c, amp2_c, amp3_c = base_params['amp1_min'], base_params['amp2_min'], base_params['amp3_min']
     tp1_c, sl1_c = base_params['tp1'], base_params['sl1']
     tp2_c, sl2_c = base_params['tp2'], base_params['sl2']
@@ -381,27 +827,45 @@ def local_fine_tune(klines, base_params, topN=5):
     sl2_grid = [round(x, 3) for x in frange(sl2_c-0.01, sl2_c+0.01, 0.002) if 0.01 <= x <= 0.06]
     tp3_grid = [round(x, 3) for x in frange(tp3_c-0.01, tp3_c+0.01, 0.002) if 0.01 <= x <= 0.06]
     sl3_grid = [round(x, 3) for x in frange(sl3_c-0.01, sl3_c+0.01, 0.002) if 0.01 <= x <= 0.06]
-    # 组合任务
-    tasks = []
-    for amp1_min in amp1_grid:
-        for amp2_min in amp2_grid:
-            if amp2_min <= amp1_min: continue
-            for amp3_min in amp3_grid:
-                if amp3_min <= amp2_min: continue
-                tasks.append((amp1_min, amp2_min, amp3_min))
-    print(f"微调分段区间组合: {len(tasks)}")
-    results = []
-    with concurrent.futures.ProcessPoolExecutor() as executor:
-        future_to_amp = {executor.submit(search_best_tp_sl_fine, klines, amp1_min, amp2_min, amp3_min, tp1_grid, sl1_grid, tp2_grid, sl2_grid, tp3_grid, sl3_grid): (amp1_min, amp2_min, amp3_min) for (amp1_min, amp2_min, amp3_min) in tasks}
-        for i, future in enumerate(concurrent.futures.as_completed(future_to_amp)):
-            res = future.result()
-            results.append(res)
-            if (i+1) % 20 == 0:
-                print(f"微调已完成{i+1}/{len(tasks)}组分段区间")
-    results = sorted(results, key=lambda x: x['profit'], reverse=True)[:topN]
-    return results
+    grids = (tp1_grid, sl1_grid, tp2_grid, sl2_grid, tp3_grid, sl3_grid)
+    return run_amp_search(klines, (amp1_grid, amp2_grid, amp3_grid), grids, topN, chunksize, label="微调", cache=cache, rank_by=rank_by)
 
-def search_best_tp_sl_fine(klines, amp1_min, amp2_min, amp3_min, tp1_grid, sl1_grid, tp2_grid, sl2_grid, tp3_grid, sl3_grid):
+def search_best_tp_sl_fine(klines, amp1_min, amp2_min, amp3_min, tp1_grid, sl1_grid, tp2_grid, sl2_grid, tp3_grid, sl3_grid,
+                           prune=SEARCH_PRUNE, rank_by="profit"):
+    """
+    分段区间下按 rank_by 指标选出最优TP/SL。按 profit 排名时可剪枝，结果再补上完整绩效指标；
+    其他指标需遍历全部组合，每组参数的指标都在同一次回测中算出。
+    """
+    if rank_by != "profit":
+        return search_best_tp_sl_by_metric(klines, amp1_min, amp2_min, amp3_min, tp1_grid, sl1_grid, tp2_grid, sl2_grid,
+                                           tp3_grid, sl3_grid, rank_by)
+    if prune and HAS_NUMPY:
+        best = search_best_tp_sl_pruned(klines, amp1_min, amp2_min, amp3_min, tp1_grid, sl1_grid, tp2_grid, sl2_grid, tp3_grid, sl3_grid)
+    else:
+        best = search_best_tp_sl_exhaustive(klines, amp1_min, amp2_min, amp3_min, tp1_grid, sl1_grid, tp2_grid, sl2_grid, tp3_grid, sl3_grid)
+    if best is not None and HAS_NUMPY:
+        plan = build_segment_plan(klines, amp1_min, amp2_min, amp3_min)
+        best.update(backtest_segmented_metrics(plan, *(best[name] for name in PARAM_NAMES[3:])))
+    return best
+
+def search_best_tp_sl_by_metric(klines, amp1_min, amp2_min, amp3_min, tp1_grid, sl1_grid, tp2_grid, sl2_grid, tp3_grid, sl3_grid, rank_by):
+    if not HAS_NUMPY:
+        raise RuntimeError("按 profit 以外的指标排名需要安装 numpy")
+    plan = build_segment_plan(klines, amp1_min, amp2_min, amp3_min)
+    sign = METRIC_SIGNS[rank_by]
+    best = None
+    best_score = None
+    for combo in itertools.product(tp1_grid, sl1_grid, tp2_grid, sl2_grid, tp3_grid, sl3_grid):
+        metrics = backtest_segmented_metrics(plan, *combo)
+        score = sign * metrics[rank_by]
+        if best is None or score > best_score:
+            best = config_to_params((amp1_min, amp2_min, amp3_min) + combo, metrics['profit'])
+            best.update(metrics)
+            best_score = score
+    return best
+
+def search_best_tp_sl_exhaustive(klines, amp1_min, amp2_min, amp3_min, tp1_grid, sl1_grid, tp2_grid, sl2_grid, tp3_grid, sl3_grid):
+    run = make_segmented_runner(klines, amp1_min, amp2_min, amp3_min)
     best = None
     for tp1 in tp1_grid:
         for sl1 in sl1_grid:
@@ -409,40 +873,235 @@ def search_best_tp_sl_fine(klines, amp1_min, amp2_min, amp3_min, tp1_grid, sl1_g
                 for sl2 in sl2_grid:
                     for tp3 in tp3_grid:
                         for sl3 in sl3_grid:
-                            profit = backtest_segmented_custom(klines, amp1_min, amp2_min, amp3_min, tp1, sl1, tp2, sl2, tp3, sl3)
+                            profit = run(tp1, sl1, tp2, sl2, tp3, sl3)
+                            if best is None or profit > best['profit']:
+                                best = {'amp1_min': amp1_min, 'amp2_min': amp2_min, 'amp3_min': amp3_min,
+                                        'tp1': tp1, 'sl1': sl1, 'tp2': tp2, 'sl2': sl2, 'tp3': tp3, 'sl3': sl3,
+                                        'profit': profit}
+    return best
+
+def search_best_tp_sl_pruned(klines, amp1_min, amp2_min, amp3_min, tp1_grid, sl1_grid, tp2_grid, sl2_grid, tp3_grid, sl3_grid):
+    """
+    分支定界版TP/SL搜索，返回与穷举完全相同的最优参数（同分取遍历顺序中最先出现者）：
+    - 某分段开仓后从未触达的止盈（止损）取值回测结果相同，只评估网格中第一个
+    - 分段盈利不超过 止盈可触达笔数×单笔止盈，已定参数的上界加未定分段的最大上界
+      不超过当前最优时整棵子树跳过
+    """
+    plan = build_segment_plan(klines, amp1_min, amp2_min, amp3_min)
+    tp_lists, sl_lists, caps = [], [], []
+    for seg, (tp_grid, sl_grid) in enumerate(((tp1_grid, sl1_grid), (tp2_grid, sl2_grid), (tp3_grid, sl3_grid))):
+        tp_reach, sl_reach = segment_reach(plan, seg, tp_grid, sl_grid)
+        tp_lists.append(collapse_unreachable(tp_grid, tp_reach))
+        sl_lists.append(collapse_unreachable(sl_grid, sl_reach))
+        caps.append({tp: MARGIN * LEVERAGE * tp * count for tp, count in zip(tp_grid, tp_reach)})
+    max_cap2 = max(caps[1][tp] for tp in tp_lists[1])
+    max_cap3 = max(caps[2][tp] for tp in tp_lists[2])
+    best = None
+    def dominated(bound):
+        return best is not None and bound + PRUNE_EPS <= best['profit']
+    for tp1 in tp_lists[0]:
+        if dominated(caps[0][tp1] + max_cap2 + max_cap3): continue
+        for sl1 in sl_lists[0]:
+            for tp2 in tp_lists[1]:
+                if dominated(caps[0][tp1] + caps[1][tp2] + max_cap3): continue
+                for sl2 in sl_lists[1]:
+                    for tp3 in tp_lists[2]:
+                        if dominated(caps[0][tp1] + caps[1][tp2] + caps[2][tp3]): continue
+                        for sl3 in sl_lists[2]:
+                            profit = backtest_segmented_kernel(plan, tp1, sl1, tp2, sl2, tp3, sl3)
                             if best is None or profit > best['profit']:
                                 best = {'amp1_min': amp1_min, 'amp2_min': amp2_min, 'amp3_min': amp3_min,
                                         'tp1': tp1, 'sl1': sl1, 'tp2': tp2, 'sl2': sl2, 'tp3': tp3, 'sl3': sl3,
                                         'profit': profit}
     return best
 
+# ========== 增量回测状态 ==========
+def new_segmented_state(params, resolver=None):
+    """参数按 PARAM_NAMES 顺序；状态只含基础类型，可直接JSON序列化；intrabar 记录所用小周期判定器的指纹"""
+    return {"params": list(params), "balance": 0, "win": 0, "total": 0,
+            "position": None, "entry": 0, "bars": 0, "last_bar": None,
+            "intrabar": resolver.fingerprint if resolver is not None else None}
+
+def advance_segmented_state(state, new_klines, resolve=None):
+    """
+    把新K线接在 state 已回测的K线之后继续回测，原地更新并返回 state。
+    规则与 backtest_segmented_custom_loop 相同，分多次追加与一次性回测全部K线结果逐位一致；
+    传入 resolve（小周期判定器）时同一根K线同时触及止盈止损由它判定先后，与挂了同一判定器的回测内核一致。
+    上一根K线保存在状态中作为下一步的信号K，代价只与新K线数量成正比。
+    """
+    amp1_min, amp2_min, amp3_min, tp1, sl1, tp2, sl2, tp3, sl3 = state["params"]
+    balance, win, total = state["balance"], state["win"], state["total"]
+    position = tuple(state["position"]) if state["position"] else None
+    entry = state["entry"]
+    k0 = state["last_bar"]
+    for k1 in new_klines:
+        if k0 is None:
+            k0 = k1
+            continue
+        amp = abs(k0["close"] - k0["open"]) / k0["open"]
+        seg = None
+        if amp >= amp3_min:
+            tp, sl, seg = tp3, sl3, 2
+        elif amp >= amp2_min and amp < amp3_min:
+            tp, sl, seg = tp2, sl2, 1
+        elif amp >= amp1_min and amp < amp2_min:
+            tp, sl, seg = tp1, sl1, 0
+        if seg is None:
+            k0 = k1
+            continue
+        if position is None:
+            entry = k0["close"]
+            if k0["close"] > k0["open"]:
+                position = ("SHORT", seg, tp, sl)
+            elif k0["close"] < k0["open"]:
+                position = ("LONG", seg, tp, sl)
+        else:
+            pos_dir, pos_seg, pos_tp, pos_sl = position
+            profit_per_trade = MARGIN * LEVERAGE * pos_tp
+            loss_per_trade = MARGIN * LEVERAGE * pos_sl
+            if pos_dir == "LONG":
+                tp_price, sl_price = entry * (1 + pos_tp), entry * (1 - pos_sl)
+                hit_tp = k1["high"] >= tp_price
+                hit_sl = k1["low"] <= sl_price
+            else:
+                tp_price, sl_price = entry * (1 - pos_tp), entry * (1 + pos_sl)
+                hit_tp = k1["low"] <= tp_price
+                hit_sl = k1["high"] >= sl_price
+            # 同一根K线同时触及止盈止损时按止损计（有判定器时由小周期K线决定）
+            if hit_sl and hit_tp and resolve is not None:
+                hit_sl = not resolve(int(k1["ts"]), pos_dir == "LONG", tp_price, sl_price)
+            if hit_sl:
+                balance -= loss_per_trade
+                total += 1
+                position = None
+            elif hit_tp:
+                balance += profit_per_trade
+                win += 1
+                total += 1
+                position = None
+        k0 = k1
+    state.update(balance=balance, win=win, total=total, position=list(position) if position else None,
+                 entry=entry, last_bar=dict(k0) if k0 is not None else None)
+    state["bars"] += len(new_klines)
+    return state
+
+def load_segmented_states(path=STATE_FILE):
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return {tuple(state["params"]): state for state in json.load(f)}
+
+def save_segmented_states(states, path=STATE_FILE):
+    # 先写临时文件再替换，中途退出不会留下半个状态文件
+    ensure_parent_dir(path)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(list(states.values()), f)
+    os.replace(tmp_path, path)
+
+def incremental_reoptimize(klines, candidates=(), path=STATE_FILE, resolver=None):
+    """
+    增量重排候选参数：已保存状态的参数只回测上次之后新增的K线，新加入的候选参数回测全部历史。
+    klines 为 parse_kline 格式的完整序列（按时间升序），candidates 为参数元组或含参数名的字典。
+    resolver 为小周期判定器（与排名所用的一致）；状态记录判定器指纹，指纹不同（小周期数据变化或启停）的状态从头重算。
+    返回按收益从高到低排列的参数字典列表（含 profit/win/total）。
+    """
+    fingerprint = resolver.fingerprint if resolver is not None else None
+    states = {params: state for params, state in load_segmented_states(path).items()
+              if state.get("intrabar") == fingerprint}
+    for params in candidates:
+        if isinstance(params, dict):
+            params = tuple(params[name] for name in PARAM_NAMES)
+        if tuple(params) not in states:
+            states[tuple(params)] = new_segmented_state(params, resolver)
+    delta_bars = 0
+    starts = {}
+    for state in states.values():
+        last_bar = state["last_bar"]
+        last_ts = last_bar["ts"] if last_bar else None
+        if last_ts not in starts:
+            # 新K线都在末尾，从后往前找到上次回测到的位置
+            start = len(klines)
+            while last_ts is not None and start > 0 and klines[start - 1]["ts"] > last_ts:
+                start -= 1
+            starts[last_ts] = 0 if last_ts is None else start
+        new_klines = klines[starts[last_ts]:]
+        advance_segmented_state(state, new_klines, resolver)
+        delta_bars += len(new_klines)
+    save_segmented_states(states, path)
+    print(f"增量回测 {len(states)} 组参数，共处理新K线 {delta_bars} 根")
+    ranked = sorted(states.values(), key=lambda st: st["balance"], reverse=True)
+    results = []
+    for state in ranked:
+        res = config_to_params(tuple(state["params"]), state["balance"])
+        res["win"], res["total"] = state["win"], state["total"]
+        results.append(res)
+    return results
+
 # ========== 主流程 ==========
 if __name__ == "__main__":
     print("正在加载本地K线数据...")
-    raw_klines = load_klines_from_csv(SYMBOL, "15m")
-    if raw_klines is None:
-        print("本地无K线数据，开始采集...")
-        raw_klines = fetch_okx_history_klines(SYMBOL, "15m", DAYS)
-        save_klines_to_csv(raw_klines, SYMBOL, "15m")
-    klines = [parse_kline(k) for k in raw_klines]
+    # 有numpy时直接由本地文件列构建 KlineArrays（.klb 镜像为内存映射），不经过列表与字典
+    klines = load_kline_arrays(SYMBOL, "15m") if HAS_NUMPY else None
+    if klines is None:
+        raw_klines = load_klines_from_csv(SYMBOL, "15m")
+        if raw_klines is None:
+            print("本地无K线数据，开始采集...")
+            raw_klines = fetch_okx_history_klines(SYMBOL, "15m", DAYS)
+            save_klines_to_csv(raw_klines, SYMBOL, "15m")
+        klines = [parse_kline(k) for k in raw_klines]
+        if HAS_NUMPY:
+            klines = as_kline_arrays(klines)
     print(f"共获取{len(klines)}根K线")
+    # 网格排名与增量状态使用同一个小周期判定器，两者的收益一致
+    resolver = intrabar_resolver() if HAS_NUMPY else None
+    if SEARCH_METHOD == "incremental":
+        # 只对上次保存了状态的候选参数回测新增K线，不重新搜索
+        for i, res in enumerate(incremental_reoptimize(kline_dicts_of(klines), resolver=resolver)[:20]):
+            print(f"增量Top{i+1}: {res}")
+        raise SystemExit(0)
+    if HAS_NUMPY:
+        # 列式数组只构建一次，后续所有回测共用
+        klines = attach_intrabar(klines, resolver=resolver)
+        if klines.intrabar is not None:
+            print(f"同K线止盈止损将用本地{INTRABAR_BAR}K线判定先后")
     # 并行参数优化
     amp_grid = [round(x, 3) for x in frange(0.012, 0.08, 0.01)]
     tp_grid = [round(x, 3) for x in frange(0.01, 0.06, 0.01)]
     sl_grid = [round(x, 3) for x in frange(0.01, 0.06, 0.01)]
     topN = 20
-    top_results = parallel_grid_search(klines, amp_grid, tp_grid, sl_grid, topN=topN)
+    cache = ResultCache() if USE_RESULT_CACHE else None
+    if SEARCH_METHOD == "walkforward":
+        walk_forward_search(klines, amp_grid, tp_grid, sl_grid)
+        raise SystemExit(0)
+    if SEARCH_METHOD != "grid":
+        space = [amp_grid, amp_grid, amp_grid, tp_grid, sl_grid, tp_grid, sl_grid, tp_grid, sl_grid]
+        summary = run_optimizer(klines, SEARCH_METHOD, space, cache=cache)
+        print(f"\n【{SEARCH_METHOD} 搜索最优参数】{summary['best']}")
+        raise SystemExit(0)
+    top_results = parallel_grid_search(klines, amp_grid, tp_grid, sl_grid, topN=topN, cache=cache)
+    print(f"\n【排名指标: {RANK_METRIC}】")
     print("\n【分段振幅多参数策略Top参数】")
     for i, res in enumerate(top_results):
         print(f"Top{i+1}: 分段1[{res['amp1_min']},{res['amp2_min']}), 止盈={res['tp1']}, 止损={res['sl1']} | "
               f"分段2[{res['amp2_min']},{res['amp3_min']}), 止盈={res['tp2']}, 止损={res['sl2']} | "
-              f"分段3[{res['amp3_min']},+∞), 止盈={res['tp3']}, 止损={res['sl3']} | 收益={res['profit']:.2f}")
+              f"分段3[{res['amp3_min']},+∞), 止盈={res['tp3']}, 止损={res['sl3']} | 收益={res['profit']:.2f}{format_metrics(res)}")
+    if MONTE_CARLO_SIMS and HAS_NUMPY:
+        monte_carlo_report(klines, top_results, MONTE_CARLO_SIMS)
+    if LIMIT_ORDER_CHECK and HAS_NUMPY:
+        limit_order_report(klines, top_results)
+    if PYRAMIDING and HAS_NUMPY:
+        pyramiding_report(klines, top_results)
+    if EXPORT_SURFACE:
+        export_profit_surface(klines, amp_grid, tp_grid, sl_grid)
     # 自动微调Top1
     print("\n【Top1参数微调优化】")
-    fine_results = local_fine_tune(klines, top_results[0], topN=5)
+    fine_results = local_fine_tune(klines, top_results[0], topN=5, cache=cache)
     for i, res in enumerate(fine_results):
         print(f"微调Top{i+1}: 分段1[{res['amp1_min']},{res['amp2_min']}), 止盈={res['tp1']}, 止损={res['sl1']} | "
               f"分段2[{res['amp2_min']},{res['amp3_min']}), 止盈={res['tp2']}, 止损={res['sl2']} | "
-              f"分段3[{res['amp3_min']},+∞), 止盈={res['tp3']}, 止损={res['sl3']} | 收益={res['profit']:.2f}")
+              f"分段3[{res['amp3_min']},+∞), 止盈={res['tp3']}, 止损={res['sl3']} | 收益={res['profit']:.2f}{format_metrics(res)}")
+    # 保存候选参数的回测状态，之后以 SEARCH_METHOD="incremental" 运行只回测新增K线
+    incremental_reoptimize(kline_dicts_of(klines), candidates=top_results + fine_results, resolver=resolver)
 
  
\ No newline at end of file
@@ -0,0 +1,52 @@
+"""测试共用的K线数据：仓库自带的历史K线与确定性随机游走K线"""
+import glob
+import os
+import random
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_bundled_klines(bar):
+    """仓库 trump_kline_data 中最新一份 bar 周期K线，经 parse_kline 转为字典"""
+    import optimize_trump_strategy as ots
+    files = sorted(glob.glob(os.path.join(ROOT, ots.SAVE_DIR, f"{ots.SYMBOL}_{bar}_*.csv")))
+    klines = []
+    with open(files[-1], "r", encoding="utf-8") as f:
+        next(f)
+        for line in f:
+            row = line.strip().split(",")
+            klines.append([int(row[0]), float(row[1]), float(row[2]), float(row[3]), float(row[4])])
+    return [ots.parse_kline(k) for k in klines]
+
+
+def random_walk_klines(seed, n):
+    """字典格式的随机游走K线（约5%为十字星），供内核与逐根循环对照"""
+    rnd = random.Random(seed)
+    klines = []
+    price = 10.0
+    for i in range(n):
+        open_ = price
+        close = open_ if rnd.random() < 0.05 else open_ * (1 + rnd.gauss(0, 0.03))
+        high = max(open_, close) * (1 + abs(rnd.gauss(0, 0.02)))
+        low = min(open_, close) * (1 - abs(rnd.gauss(0, 0.02)))
+        klines.append({"ts": i, "open": open_, "high": high, "low": low, "close": close})
+        price = close
+    return klines
+
+
+def random_klines(n, seed, move=0.02, wick=0.01, gap=0.0):
+    """
+    [ts, open, high, low, close] 列表格式的随机游走K线：收盘相对开盘在 ±move 内，
+    影线不超过 wick；gap>0 时开盘相对上一根收盘跳空 ±gap。
+    """
+    rnd = random.Random(seed)
+    price = 100.0
+    klines = []
+    for i in range(n):
+        open_ = price * (1 + rnd.uniform(-gap, gap)) if gap else price
+        close = open_ * (1 + rnd.uniform(-move, move))
+        high = max(open_, close) * (1 + rnd.uniform(0, wick))
+        low = min(open_, close) * (1 - rnd.uniform(0, wick))
+        klines.append([i, open_, high, low, close])
+        price = close
+    return klines
@@ -0,0 +1,98 @@
+"""列式回测内核与逐根循环版本的逐位一致性检查"""
+import random
+
+import pytest
+
+pytest.importorskip("numpy")
+
+import optimize_trump_strategy as ots
+from tests.conftest import load_bundled_klines, random_walk_klines
+
+
+@pytest.mark.parametrize("bar", ["15m", "5m"])
+def test_custom_matches_loop_on_bundled_data(bar):
+    klines = load_bundled_klines(bar)
+    grid = [round(x, 3) for x in ots.frange(0.01, 0.06, 0.002)]
+    amps = [round(x, 3) for x in ots.frange(0.004, 0.08, 0.002)]
+    rnd = random.Random(bar)
+    for _ in range(150):
+        amp = sorted(rnd.sample(amps, 3))
+        params = [rnd.choice(grid) for _ in range(6)]
+        expected = ots.backtest_segmented_custom_loop(klines, *amp, *params)
+        assert repr(ots.backtest_segmented_custom(klines, *amp, *params)) == repr(expected)
+
+
+@pytest.mark.parametrize("n", [0, 1, 2, 3, 50, 600])
+def test_custom_matches_loop_on_random_walk(n):
+    klines = random_walk_klines(n, n)
+    rnd = random.Random(n)
+    for _ in range(30):
+        amp = sorted(rnd.sample([0.005, 0.01, 0.02, 0.03, 0.05, 0.07], 3))
+        params = [rnd.choice([0.01, 0.02, 0.04, 0.06]) for _ in range(6)]
+        expected = ots.backtest_segmented_custom_loop(klines, *amp, *params)
+        assert repr(ots.backtest_segmented_custom(klines, *amp, *params)) == repr(expected)
+
+
+def assert_segmented_matches_loop(klines):
+    # 全部输出逐位一致：balance、胜率、笔数、交易明细（账本转回逐笔字典）、seg_count、seg_profit
+    balance, winrate, total, ledger, seg_count, seg_profit = ots.backtest_segmented(klines)
+    result = (balance, winrate, total, ledger.to_dicts(), seg_count, seg_profit)
+    assert repr(result) == repr(ots.backtest_segmented_loop(klines))
+
+
+@pytest.mark.parametrize("bar", ["15m", "5m"])
+def test_segmented_matches_loop_on_bundled_data(bar):
+    klines = load_bundled_klines(bar)
+    for part in (klines, klines[:500], klines[100:1500]):
+        assert_segmented_matches_loop(part)
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_segmented_matches_loop_on_random_walk(seed):
+    assert_segmented_matches_loop(random_walk_klines(seed, random.Random(seed).randint(0, 600)))
+
+
+def test_list_input_reuses_converted_arrays():
+    klines = random_walk_klines(7, 200)
+    assert ots.as_kline_arrays(klines) is ots.as_kline_arrays(klines)
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_pruned_search_matches_exhaustive(seed):
+    klines = random_walk_klines(100 + seed, 400)
+    grid = [0.01, 0.03, 0.05, 0.2]  # 0.2 基本不可触达，覆盖合并分支
+    rnd = random.Random(seed)
+    for _ in range(3):
+        amp = sorted(rnd.sample([0.005, 0.01, 0.02, 0.03, 0.05, 0.07], 3))
+        grids = [grid] * 6
+        exhaustive = ots.search_best_tp_sl_fine(klines, *amp, *grids, prune=False)
+        assert ots.search_best_tp_sl_fine(klines, *amp, *grids, prune=True) == exhaustive
+
+
+def test_trade_metrics_match_ledger_reports():
+    from utils.backtest_kernel import trade_metrics
+    klines = load_bundled_klines("15m")
+    _, _, _, ledger, _, _ = ots.backtest_segmented(klines)
+    metrics = trade_metrics(float(ledger.pnl.sum()), ledger.pnl.tolist())
+    report = ledger.report()
+    assert metrics["trades"] == report["trades"] and metrics["winrate"] == report["winrate"]
+    assert metrics["max_drawdown"] == pytest.approx(report["max_drawdown"])
+    pnl = ledger.pnl
+    assert metrics["sharpe"] == pytest.approx(pnl.mean() / pnl.std() * len(pnl) ** 0.5)
+    assert trade_metrics(0, [1.0, -1.0, -1.0, 2.0, -1.0])["max_losing_streak"] == 2
+
+
+@pytest.mark.parametrize("rank_by", ["winrate", "max_drawdown", "sharpe"])
+def test_metric_ranking_matches_brute_force(rank_by):
+    import itertools
+    from utils.backtest_kernel import METRIC_SIGNS, backtest_segmented_metrics, build_segment_plan
+    klines = random_walk_klines(11, 400)
+    grid = [0.01, 0.03, 0.05]
+    amps = (0.01, 0.02, 0.04)
+    best = ots.search_best_tp_sl_fine(klines, *amps, grid, grid, grid, grid, grid, grid, rank_by=rank_by)
+    plan = build_segment_plan(klines, *amps)
+    scores = [METRIC_SIGNS[rank_by] * backtest_segmented_metrics(plan, *c)[rank_by]
+              for c in itertools.product(grid, repeat=6)]
+    assert METRIC_SIGNS[rank_by] * best[rank_by] == max(scores)
+    profit_best = ots.search_best_tp_sl_fine(klines, *amps, grid, grid, grid, grid, grid, grid)
+    assert set(ots.PARAM_NAMES) | set(METRIC_SIGNS) <= set(profit_best)
@@ -0,0 +1,88 @@
+"""事件驱动回测：最新在前的窗口视图与限价单/止盈止损模拟"""
+from utils.event_backtest import (
+    NewestFirstWindow, load_live_module, run_event_backtest, signal_dict_signal, single_kline_signal
+)
+
+
+def test_window_is_newest_first_view_without_copies():
+    rows = [[ts, 1.0, 1.0, 1.0, 1.0] for ts in range(10)]
+    window = NewestFirstWindow(rows, 3)
+    window.move_to(5)
+    assert [k[0] for k in window] == [5, 4, 3]
+    assert window[1] is rows[4]
+    assert [k[0] for k in window[1:]] == [4, 3]
+    window.move_to(9)
+    assert window[-1][0] == 7 and len(window) == 3
+
+
+def _amplitude_kline(kline, amplitude_percent):
+    # 与 okx_trump_multi_strategy_15m.analyze_kline 的返回约定相同
+    o, h, l, c = (float(x) for x in kline[1:5])
+    if (h - l) / l >= amplitude_percent:
+        return ('SHORT' if c > o else 'LONG'), c, {}
+    return None, None, {}
+
+
+def test_limit_entry_fill_expiry_and_exits():
+    rows = [
+        [0, 100, 100, 100, 100],
+        [1, 100, 106, 99, 105],   # 大阳线 -> 下一根开始挂空单 @105
+        [2, 104, 104, 103, 103],  # 未触及105
+        [3, 103, 106, 102, 104],  # 成交；止损 105*1.05 未触及
+        [4, 104, 104, 99.5, 100],  # 止盈 105*0.95=99.75
+        [5, 100, 100, 100, 100],
+    ]
+    res = run_event_backtest(rows, single_kline_signal(_amplitude_kline, 0.05, 0.05, 0.05), 2, expire_bars=3)
+    assert (res["filled"], res["expired"], res["total"], res["win"]) == (1, 0, 1, 1)
+    assert res["trades"][0][:5] == (3, 4, "SHORT", 105.0, 105.0 * 0.95)
+    res = run_event_backtest(rows, single_kline_signal(_amplitude_kline, 0.05, 0.05, 0.05), 2, expire_bars=1)
+    assert (res["filled"], res["expired"], res["total"]) == (0, 1, 0)
+
+
+def test_same_bar_tp_and_sl_counts_as_loss():
+    rows = [[0, 100, 100, 100, 100], [1, 100, 100, 100, 100], [2, 100, 100, 100, 100], [3, 100, 120, 80, 100]]
+    def analyze_signal(klines):
+        if klines[1][0] != 1:
+            return {"can_entry": False}
+        return {"can_entry": True, "entry_price": 100.0, "take_profit": 110.0, "stop_loss": 90.0, "pos_side": "long"}
+    res = run_event_backtest(rows, signal_dict_signal(analyze_signal), 2)
+    assert [t[1:] for t in res["trades"]] == [(3, "LONG", 100.0, 90.0, -10.0)]
+
+
+def test_loads_script_functions_by_path(tmp_path):
+    script = tmp_path / "okx-demo-strategy.py"
+    script.write_text("INST_ID = 'DEMO'\ndef analyze_kline(kline):\n    return None, None, {}\n", encoding="utf-8")
+    module = load_live_module(str(script))
+    assert module.INST_ID == "DEMO" and module.analyze_kline([0]) == (None, None, {})
+
+
+def _write_dataset(path, n=300):
+    # 交替的大振幅阴线/阳线，保证各参数组都有信号
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("timestamp,open,high,low,close\n")
+        price = 1.0
+        for i in range(n):
+            close = price * (0.97 if i % 3 == 0 else 1.02)
+            f.write(f"{1700000000000 + i * 900000},{price},{max(price, close) * 1.01},{min(price, close) * 0.99},{close}\n")
+            price = close
+    return str(path)
+
+
+def test_loads_every_repo_live_script():
+    # 真实实盘脚本：根目录脚本 from notification_service import ...，okx SDK 可能未安装
+    from backtest_live_strategies import LIVE_STRATEGIES
+    for script, *_ in LIVE_STRATEGIES.values():
+        module = load_live_module(script)
+        assert module.INST_ID and module.BAR
+
+
+def test_broken_script_does_not_stop_other_strategies(tmp_path, monkeypatch):
+    import backtest_live_strategies
+    monkeypatch.setitem(backtest_live_strategies.LIVE_STRATEGIES, "broken",
+                        (str(tmp_path / "missing.py"), None, 2, None, "MARGIN"))
+    datasets = {("TRUMP-USDT-SWAP", "15m"): [_write_dataset(tmp_path / "trump.csv")]}
+    assert backtest_live_strategies.backtest_live_strategy("broken", datasets) == []
+    results = backtest_live_strategies.backtest_live_strategy("trump_multi_15m", datasets)
+    module = load_live_module("okx_trump_multi_strategy_15m.py")
+    assert [label for label, _ in results] == [f"参数{i+1}" for i in range(len(module.STRATEGY_PARAMS))]
+    assert all(res["total"] > 0 for _, res in results)
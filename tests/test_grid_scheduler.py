@@ -0,0 +1,54 @@
+"""分块调度与有界前N名"""
+import concurrent.futures
+
+from utils.grid_scheduler import ChunkCheckpoint, TopN, chunked, run_chunked
+
+
+def test_chunked_keeps_order_and_tail():
+    assert list(chunked(range(7), 3)) == [(0, 1, 2), (3, 4, 5), (6,)]
+
+
+def test_topn_matches_full_sort_with_stable_ties():
+    results = [{'profit': p, 'id': i} for i, p in enumerate([3, 1, 5, 5, 2, 3, 5])]
+    top = TopN(4)
+    for seq in (6, 2, 0, 5, 1, 3, 4):  # 乱序完成
+        top.push(seq, results[seq])
+    expected = sorted(results, key=lambda r: r['profit'], reverse=True)[:4]
+    assert top.results() == expected
+
+
+def _square_chunk(chunk):
+    return [x * x for x in chunk]
+
+
+def test_run_chunked_reports_every_item_with_its_sequence():
+    seen = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+        run_chunked(executor, _square_chunk, iter(range(23)), 4,
+                    lambda seq, item, res: seen.__setitem__(seq, (item, res)), max_inflight=3)
+    assert seen == {i: (i, i * i) for i in range(23)}
+
+
+def test_run_chunked_reports_completed_chunks():
+    chunks = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+        run_chunked(executor, _square_chunk, iter(range(10)), 4, lambda *a: None, on_chunk=chunks.append)
+    assert sorted(chunks) == [[(0, 0, 0), (1, 1, 1), (2, 2, 4), (3, 3, 9)],
+                              [(4, 4, 16), (5, 5, 25), (6, 6, 36), (7, 7, 49)],
+                              [(8, 8, 64), (9, 9, 81)]]
+
+
+def test_checkpoint_resumes_and_skips_torn_line(tmp_path):
+    path = str(tmp_path / "run.jsonl")
+    checkpoint = ChunkCheckpoint(path, "key")
+    checkpoint.record([(0, [0.1, 0.2], {"profit": 1.5}), (1, [0.1, 0.3], {"profit": 2.0})])
+    checkpoint.close()
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('[[2,[0.2')  # 崩溃时写了一半
+    resumed = ChunkCheckpoint(path, "key")
+    assert resumed.completed == {0: ([0.1, 0.2], {"profit": 1.5}), 1: ([0.1, 0.3], {"profit": 2.0})}
+    resumed.record([(2, [0.2, 0.3], {"profit": 0.5})])
+    resumed.close()
+    assert sorted(ChunkCheckpoint(path, "key").completed) == [0, 1, 2]
+    # 运行标识不同（数据或网格变化）时从头开始
+    assert ChunkCheckpoint(path, "other").completed == {}
@@ -0,0 +1,78 @@
+"""增量回测状态：分段追加K线与一次性回测逐位一致"""
+import json
+import random
+
+import optimize_trump_strategy as ots
+from tests.conftest import load_bundled_klines, random_walk_klines
+
+
+def _random_params(rnd):
+    grid = [round(x, 3) for x in ots.frange(0.01, 0.06, 0.002)]
+    amps = [round(x, 3) for x in ots.frange(0.004, 0.08, 0.002)]
+    return tuple(sorted(rnd.sample(amps, 3))) + tuple(rnd.choice(grid) for _ in range(6))
+
+
+def test_split_advance_matches_loop():
+    klines = load_bundled_klines("15m") + random_walk_klines(3, 300)
+    rnd = random.Random(9)
+    for _ in range(40):
+        params = _random_params(rnd)
+        state = ots.new_segmented_state(params)
+        cuts = sorted(rnd.sample(range(len(klines)), 4))
+        for start, stop in zip([0] + cuts, cuts + [len(klines)]):
+            # 每段之间经过JSON序列化，模拟跨进程/跨天保存
+            state = json.loads(json.dumps(ots.advance_segmented_state(state, klines[start:stop])))
+        assert repr(state["balance"]) == repr(ots.backtest_segmented_custom_loop(klines, *params))
+        assert state["bars"] == len(klines)
+
+
+def test_incremental_reoptimize_only_processes_new_bars(tmp_path, capsys):
+    klines = random_walk_klines(5, 400)
+    path = str(tmp_path / "states.json")
+    rnd = random.Random(1)
+    candidates = [_random_params(rnd) for _ in range(5)]
+    ots.incremental_reoptimize(klines[:300], candidates, path=path)
+    capsys.readouterr()
+    ranked = ots.incremental_reoptimize(klines, path=path)
+    assert "共处理新K线 500 根" in capsys.readouterr().out
+    expected = sorted(ots.backtest_segmented_custom_loop(klines, *p) for p in candidates)[::-1]
+    assert [r['profit'] for r in ranked] == expected
+
+
+class _ParityResolver:
+    """按时间戳奇偶判定先后的确定性判定器"""
+    fingerprint = "parity"
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, ts, is_long, tp_price, sl_price):
+        self.calls += 1
+        return ts % 2 == 0
+
+
+def test_resolver_in_incremental_state_matches_kernel(tmp_path):
+    import pytest
+    from utils.backtest_kernel import HAS_NUMPY, KlineArrays, build_segment_plan, backtest_segmented_kernel
+    if not HAS_NUMPY:
+        pytest.skip("需要 numpy")
+    klines = random_walk_klines(11, 600)
+    arrays = KlineArrays(klines)
+    resolver = _ParityResolver()
+    arrays.intrabar = resolver
+    rnd = random.Random(4)
+    changed = 0
+    for _ in range(30):
+        params = _random_params(rnd)
+        state = ots.advance_segmented_state(ots.new_segmented_state(params, resolver), klines, resolver)
+        plan = build_segment_plan(arrays, *params[:3])
+        assert repr(state["balance"]) == repr(backtest_segmented_kernel(plan, *params[3:]))
+        changed += state["balance"] != ots.backtest_segmented_custom_loop(klines, *params)
+    assert changed > 0
+    # 判定器变化时保存的状态从头重算，不沿用按止损计的结果
+    path = str(tmp_path / "states.json")
+    params = _random_params(rnd)
+    ots.incremental_reoptimize(klines, [params], path=path)
+    ranked = ots.incremental_reoptimize(klines, [params], path=path, resolver=resolver)
+    plan = build_segment_plan(arrays, *params[:3])
+    assert ranked[0]["profit"] == backtest_segmented_kernel(plan, *params[3:])
@@ -0,0 +1,128 @@
+"""同K线止盈止损歧义的小周期判定"""
+import csv
+
+import pytest
+
+from utils.backtest_kernel import HAS_NUMPY
+from utils.intrabar import BAR_MS, first_hit, make_resolver
+
+pytestmark = pytest.mark.skipif(not HAS_NUMPY, reason="需要 numpy")
+
+T0 = 1_700_000_000_000
+STEP = BAR_MS["15m"]
+
+
+def _klines():
+    # 第1根阴线信号 -> 第2步在100做多（止盈101/止损98）；第3根同时触及101与98
+    bars = [(100, 100, 100, 100), (102, 102, 100, 100), (100.5, 100.6, 98.4, 98.5), (100, 103, 97, 100)]
+    return [[T0 + i * STEP, o, h, l, c] for i, (o, h, l, c) in enumerate(bars)]
+
+
+def _write(path, rows):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["timestamp", "open", "high", "low", "close"])
+        writer.writerows(rows)
+    return str(path)
+
+
+def _five_minute(path, start, highs_lows):
+    rows = [[start + i * BAR_MS["5m"], 100, h, l, 100] for i, (h, l) in enumerate(highs_lows)]
+    return _write(path / f"X_5m_{rows[0][0]}_{rows[-1][0]}.csv", rows)
+
+
+def _balance(klines, resolver):
+    from utils.backtest_kernel import KlineArrays, backtest_segmented_kernel, build_segment_plan
+    arrays = KlineArrays(klines)
+    arrays.intrabar = resolver
+    plan = build_segment_plan(arrays, 0.01, 0.5, 0.9)
+    return backtest_segmented_kernel(plan, 0.01, 0.02, 0.01, 0.02, 0.01, 0.02)
+
+
+def test_first_hit_orders_sub_bars():
+    rows = [[0, 100, 100.5, 99.5, 100], [1, 100, 101.5, 99.5, 100], [2, 100, 100, 97, 100]]
+    assert first_hit(rows, True, 101, 98) == "tp"
+    assert first_hit(rows, False, 99, 101) == "sl"
+    # 同一根小K线内仍无法区分按止损计
+    assert first_hit([[0, 100, 102, 97, 100]], True, 101, 98) == "sl"
+    assert first_hit([], True, 101, 98) is None
+
+
+def test_lower_timeframe_decides_ambiguous_bar(tmp_path):
+    klines = _klines()
+    assert _balance(klines, None) == pytest.approx(-2.0)
+    tp_dir, sl_dir = tmp_path / "tp", tmp_path / "sl"
+    tp_dir.mkdir()
+    sl_dir.mkdir()
+    start = T0 + 3 * STEP
+    tp_first = make_resolver([_five_minute(tp_dir, start, [(101.5, 99.5), (103, 99), (99, 97)])], "15m")
+    sl_first = make_resolver([_five_minute(sl_dir, start, [(100.5, 97), (103, 99), (101, 99)])], "15m")
+    assert _balance(klines, tp_first) == pytest.approx(1.0)
+    assert _balance(klines, sl_first) == pytest.approx(-2.0)
+    assert (tp_first.ambiguous, tp_first.tp_first, tp_first.unresolved) == (1, 1, 0)
+
+
+def test_loads_only_files_covering_ambiguous_bars(tmp_path):
+    klines = _klines()
+    covering = _five_minute(tmp_path, T0 + 3 * STEP, [(101.5, 99.5), (103, 99), (99, 97)])
+    far_away = _five_minute(tmp_path, T0 + 1000 * STEP, [(100, 100)] * 3)
+    resolver = make_resolver([far_away, covering], "15m")
+    assert _balance(klines, resolver) == pytest.approx(1.0)
+    assert resolver.index.files_loaded == 1
+    # 没有歧义K线时不加载任何文件
+    quiet = make_resolver([far_away, covering], "15m")
+    klines[3][2] = 100.9
+    _balance(klines, quiet)
+    assert quiet.index.files_loaded == 0 and quiet.ambiguous == 0
+
+
+def test_missing_lower_timeframe_keeps_pessimistic_loss_and_second_timestamps(tmp_path):
+    far_away = _five_minute(tmp_path, T0 + 1000 * STEP, [(100, 100)] * 3)
+    resolver = make_resolver([far_away], "15m")
+    assert _balance(_klines(), resolver) == pytest.approx(-2.0)
+    assert resolver.unresolved == 1
+    # parse_kline 输出秒级时间戳，判定器按毫秒查找
+    covering = _five_minute(tmp_path, T0 + 3 * STEP, [(101.5, 99.5), (103, 99)])
+    seconds = [[k[0] // 1000] + k[1:] for k in _klines()]
+    assert _balance(seconds, make_resolver([covering], "15m")) == pytest.approx(1.0)
+
+
+@pytest.mark.parametrize("binary", [True, False])
+def test_store_files_are_indexed_without_loading(tmp_path, binary):
+    from utils.kline_datasets import KlineStore, discover_datasets
+    store = KlineStore(str(tmp_path), binary=binary)
+    start = T0 + 3 * STEP
+    rows = [[start + i * BAR_MS["5m"], 100, 100.2, 99.8, 100] for i in range(-2500, 2500)]
+    sub_bars = [(101.5, 99.5), (103, 99), (99, 97)]
+    for i, (h, l) in enumerate(sub_bars):
+        rows[2500 + i][2:4] = [h, l]
+    store.write("X", "5m", rows)
+    files = discover_datasets((), str(tmp_path))[("X", "5m")]
+    assert files[0].endswith(".klb") == binary
+    resolver = make_resolver(files, "15m")
+    index = resolver.index
+    assert index.ranges[0][:2] == (rows[0][0], rows[-1][0])
+    assert index.files_loaded == 0 and not index._mapped
+    assert _balance(_klines(), resolver) == pytest.approx(1.0)
+    # .klb 只映射、按区间切片；CSV 在首次歧义时加载一次
+    assert index.files_loaded == (0 if binary else 1)
+    assert index.bars_between(start, start + STEP) is index.bars_between(start, start + STEP)
+    assert [row[2:4] for row in index.bars_between(start, start + STEP)] == [list(x) for x in sub_bars]
+
+
+def test_cache_key_follows_attached_resolver_and_its_files(tmp_path):
+    import os
+    import optimize_trump_strategy as ots
+    from utils.backtest_kernel import KlineArrays
+    arrays = KlineArrays(_klines())
+    assert ots.strategy_id("s", arrays) == "s" and ots.intrabar_spec(arrays) is None
+    path = _five_minute(tmp_path, T0 + 3 * STEP, [(101.5, 99.5), (103, 99)])
+    arrays.intrabar = make_resolver([path], "15m")
+    before = ots.strategy_id("s", arrays)
+    assert before.startswith("s:intrabar-") and ots.intrabar_spec(arrays) == ([path], "15m")
+    # 小周期数据改动后标识随之变化，缓存与检查点不再命中旧结果
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(f"{T0 + 3 * STEP + 2 * BAR_MS['5m']},100,100,97,100\n")
+    os.utime(path, ns=(0, 1))
+    arrays.intrabar = make_resolver(*ots.intrabar_spec(arrays))
+    assert ots.strategy_id("s", arrays) != before
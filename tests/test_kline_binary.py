@@ -0,0 +1,87 @@
+"""二进制列式K线：内存映射、区间二分切片、追加与合并存储镜像"""
+import os
+
+import pytest
+
+from utils.backtest_kernel import HAS_NUMPY
+
+pytestmark = pytest.mark.skipif(not HAS_NUMPY, reason="需要 numpy")
+
+STEP = 60000
+
+
+def _rows(start, n):
+    return [[start + i * STEP, 1.0 + i, 2.0 + i, 0.5 + i, 1.5 + i, 10.0 * i] for i in range(n)]
+
+
+def test_memmap_slices_by_timestamp_without_copying(tmp_path):
+    import numpy as np
+    from utils.kline_binary import BinaryKlines, append_binary, write_binary
+    path = str(tmp_path / "BTC-USDT-SWAP_1m.klb")
+    write_binary(path, _rows(0, 100))
+    series = BinaryKlines(path)
+    assert len(series) == 100 and isinstance(series.close, np.memmap)
+    assert series.index_range(10 * STEP, 20 * STEP) == (10, 20)
+    # 区间端点不必落在K线时间戳上
+    assert series.index_range(10 * STEP + 1, 20 * STEP + 1) == (11, 21)
+    assert series.rows(98 * STEP) == [row[:5] for row in _rows(0, 100)[98:]]
+    arrays = series.arrays(10 * STEP, 20 * STEP)
+    assert np.shares_memory(arrays.close, series.close)
+    assert arrays.ts.tolist() == list(range(10 * STEP, 20 * STEP, STEP))
+    assert series.arrays(seconds=True).ts[1] == STEP // 1000
+    # 追加只写新行，乱序或不晚于末条的追加被拒绝
+    assert append_binary(path, _rows(100 * STEP, 5)) == 5
+    with pytest.raises(ValueError):
+        append_binary(path, _rows(50 * STEP, 1))
+    appended = BinaryKlines(path)
+    assert len(appended) == 105 and appended.volume[104] == 40.0
+    assert os.path.getsize(os.path.join(path, "ts.i8")) == 105 * 8
+
+
+def test_interrupted_append_keeps_complete_rows(tmp_path):
+    from utils.kline_binary import BinaryKlines, append_binary, write_binary
+    path = str(tmp_path / "series.klb")
+    write_binary(path, _rows(0, 10))
+    # 模拟价格列已写入而 ts 未写入的中断
+    with open(os.path.join(path, "close.f8"), "ab") as f:
+        f.write(b"\0" * 16)
+    assert len(BinaryKlines(path)) == 10
+    append_binary(path, _rows(10 * STEP, 2))
+    series = BinaryKlines(path)
+    assert series.rows() == [row[:5] for row in _rows(0, 10) + _rows(10 * STEP, 2)]
+
+
+def test_store_keeps_binary_mirror_in_sync(tmp_path):
+    from utils.kline_datasets import KlineStore, dataset_length, discover_datasets, load_arrays, load_dataset
+    store = KlineStore(str(tmp_path))
+    store.write("ETH-USDT-SWAP", "1m", [[str(r[0])] + [str(v) for v in r[1:]] for r in _rows(10 * STEP, 10)])
+    store.write("ETH-USDT-SWAP", "1m", _rows(20 * STEP, 3))  # 追加
+    store.write("ETH-USDT-SWAP", "1m", _rows(0, 12))  # 与已有数据重叠：重写
+    files = discover_datasets((), str(tmp_path))[("ETH-USDT-SWAP", "1m")]
+    assert files == [store.binary_path("ETH-USDT-SWAP", "1m")]
+    assert dataset_length(files) == 23
+    csv_rows = load_dataset([store.path("ETH-USDT-SWAP", "1m")])
+    assert load_dataset(files) == csv_rows == store.load("ETH-USDT-SWAP", "1m")
+    assert store.load("ETH-USDT-SWAP", "1m", 5 * STEP, 7 * STEP) == csv_rows[5:7]
+    arrays = load_arrays(files, seconds=True)
+    assert arrays.ts.tolist() == [row[0] // 1000 for row in csv_rows]
+    assert arrays.close.tolist() == [row[4] for row in csv_rows]
+
+
+def test_optimizer_loads_arrays_straight_from_binary_mirror(tmp_path, monkeypatch):
+    import numpy as np
+    import optimize_trump_strategy as ots
+    from utils.kline_datasets import KlineStore, load_dataset
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(ots, "SAVE_DIR", str(tmp_path / "empty"))
+    assert ots.load_kline_arrays("ETH-USDT-SWAP", "15m") is None
+    store = KlineStore()
+    rows = [[1700000000000 + i * 900000, 1.0 + i, 2.0 + i, 0.5 + i, 1.5 + i] for i in range(50)]
+    store.write("ETH-USDT-SWAP", "15m", rows)
+    arrays = ots.load_kline_arrays("ETH-USDT-SWAP", "15m")
+    assert isinstance(arrays.close, np.memmap)
+    expected = [ots.parse_kline(k) for k in load_dataset([store.path("ETH-USDT-SWAP", "15m")])]
+    assert ots.kline_dicts_of(arrays) == expected
+    reference = ots.as_kline_arrays(expected)
+    for name in ("ts", "open", "high", "low", "close"):
+        assert np.array_equal(getattr(arrays, name), getattr(reference, name))
@@ -0,0 +1,158 @@
+"""异步K线采集：令牌桶限速、限速退避与翻页落盘（用本地模拟的OKX接口）"""
+import asyncio
+import threading
+import time
+
+from utils.kline_collector import KlineCollector, TokenBucket, newest_stored_ts, time_shards
+from utils.kline_datasets import discover_datasets, load_dataset
+
+STEP = 300000  # 5m
+END = 1_700_000_000_000
+
+
+class FakeOkx:
+    """按 after/before/limit 返回新→旧K线；前 rate_limited 次请求返回限速错误码"""
+
+    def __init__(self, n_bars, rate_limited=0, missing=(), latency=0.0):
+        self.series = [self.candle(END - i * STEP) for i in range(n_bars)]
+        self.rate_limited = rate_limited
+        self.missing = set(missing)
+        self.calls = 0
+        self.latency = latency
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def candle(ts, confirm="1"):
+        return [str(ts), "1", "2", "0.5", "1.5", "1", "1", "1", confirm]
+
+    def extend(self, n_bars, unconfirmed=True):
+        """在最新一端追加 n_bars 根已收盘K线（可再加一根未收盘K线）"""
+        newest = int(self.series[0][0]) if self.series[0][8] == "1" else int(self.series[1][0])
+        self.series = [c for c in self.series if c[8] == "1"]
+        new = [self.candle(newest + i * STEP) for i in range(n_bars, 0, -1)]
+        if unconfirmed:
+            new.insert(0, self.candle(newest + (n_bars + 1) * STEP, confirm="0"))
+        self.series = new + self.series
+
+    def __call__(self, session, params):
+        with self.lock:
+            self.calls += 1
+            if self.rate_limited:
+                self.rate_limited -= 1
+                return {"code": "50011" if self.rate_limited % 2 else "50111", "msg": "Too Many Requests"}
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        time.sleep(self.latency)
+        with self.lock:
+            self.in_flight -= 1
+        if params["instId"] in self.missing:
+            return {"code": "51001", "msg": "Instrument ID does not exist"}
+        after = int(params.get("after", 1 << 62))
+        before = int(params.get("before", 0))
+        rows = [row for row in self.series if before < int(row[0]) < after]
+        return {"code": "0", "data": rows[:int(params["limit"])]}
+
+
+def _fast_bucket():
+    return TokenBucket(rate=10000, capacity=100)
+
+
+def test_token_bucket_caps_rate():
+    async def run():
+        bucket = TokenBucket(rate=100, capacity=5)
+        started = time.monotonic()
+        for _ in range(25):
+            await bucket.acquire()
+        return time.monotonic() - started
+    # 初始5个令牌，之后每秒100个：25次至少 0.2 秒
+    assert asyncio.run(run()) >= 0.19
+
+
+def test_rate_limit_codes_back_off_and_recover(monkeypatch):
+    import utils.kline_collector as collector_module
+    monkeypatch.setattr(collector_module, "BACKOFF_BASE", 0.01)
+    fake = FakeOkx(50, rate_limited=2)
+    bucket = _fast_bucket()
+    collector = KlineCollector(bucket=bucket, get=fake)
+    page = asyncio.run(collector.fetch_page("BTC-USDT-SWAP", "5m"))
+    assert len(page) == 50
+    assert bucket.penalties == 2 and bucket.rate < bucket.max_rate
+    assert fake.calls == 3
+    for _ in range(40):
+        bucket.reward()
+    assert bucket.rate == bucket.max_rate
+
+
+def test_collects_all_series_concurrently_and_saves_ranges(tmp_path):
+    fake = FakeOkx(3000, missing={"NOPE-USDT-SWAP"})
+    collector = KlineCollector(bucket=_fast_bucket(), data_dir=str(tmp_path), get=fake)
+    days = 2500 * STEP / 86400000
+    counts = asyncio.run(collector.collect(["BTC-USDT-SWAP", "ETH-USDT-SWAP", "NOPE-USDT-SWAP"], ["5m"], days, END))
+    start = END - 2500 * STEP
+    assert counts[("NOPE-USDT-SWAP", "5m")] == 0
+    datasets = discover_datasets((str(tmp_path),))
+    for inst in ("BTC-USDT-SWAP", "ETH-USDT-SWAP"):
+        assert counts[(inst, "5m")] == 2500
+        klines = load_dataset(datasets[(inst, "5m")])
+        assert [k[0] for k in klines] == list(range(start, END, STEP))
+        # 每10页落盘一次
+        assert len(datasets[(inst, "5m")]) == 3
+
+
+def test_sync_fetches_only_the_confirmed_tail(tmp_path):
+    fake = FakeOkx(1000)
+    collector = KlineCollector(bucket=_fast_bucket(), data_dir=str(tmp_path), get=fake)
+    days = 500 * STEP / 86400000
+    asyncio.run(collector.collect(["BTC-USDT-SWAP"], ["5m"], days, END + 1))
+    assert newest_stored_ts("BTC-USDT-SWAP", "5m", str(tmp_path)) == END
+    fake.extend(250)
+    requests_before = collector.requests
+    counts = asyncio.run(collector.collect(["BTC-USDT-SWAP"], ["5m"], days, sync=True))
+    # 250 根新K线 + 1 根未收盘：3 页，未收盘的不保存
+    assert counts[("BTC-USDT-SWAP", "5m")] == 250
+    assert collector.requests - requests_before == 3
+    klines = load_dataset(discover_datasets((str(tmp_path),))[("BTC-USDT-SWAP", "5m")])
+    assert [k[0] for k in klines] == list(range(END - 499 * STEP, END + 251 * STEP, STEP))
+    # 没有新K线时只需一次请求
+    fake.extend(0, unconfirmed=False)
+    requests_before = collector.requests
+    counts = asyncio.run(collector.collect(["BTC-USDT-SWAP"], ["5m"], days, sync=True))
+    assert counts[("BTC-USDT-SWAP", "5m")] == 0 and collector.requests - requests_before == 1
+
+
+def test_time_shards_cover_range_without_overlap():
+    shards = time_shards(END - 2550 * STEP, END, STEP, pages=10)
+    assert shards[0] == (END - 1000 * STEP, END) and shards[-1] == (END - 2550 * STEP, END - 2000 * STEP)
+    assert all(a[0] == b[1] for a, b in zip(shards, shards[1:]))
+    assert time_shards(0, END, None) == [(0, END)]
+
+
+def test_single_series_pages_shards_concurrently(tmp_path):
+    fake = FakeOkx(6000, latency=0.02)
+    collector = KlineCollector(bucket=_fast_bucket(), data_dir=str(tmp_path), get=fake)
+    start = END - 5000 * STEP
+    total = asyncio.run(collector.fetch_series("BTC-USDT-SWAP", "5m", start, END))
+    assert total == 5000 and fake.calls == 50
+    # 5 个分片同时翻页
+    assert 1 < fake.peak_in_flight <= 5
+    klines = load_dataset(discover_datasets((str(tmp_path),))["BTC-USDT-SWAP", "5m"])
+    assert [k[0] for k in klines] == list(range(start, END, STEP))
+
+
+def test_collector_writes_one_series_per_store(tmp_path):
+    from utils.kline_datasets import KlineStore
+    fake = FakeOkx(3000)
+    store = KlineStore(str(tmp_path / "store"))
+    collector = KlineCollector(bucket=_fast_bucket(), data_dir=str(tmp_path / "fragments"), get=fake, store=store)
+    assert asyncio.run(collector.fetch_series("BTC-USDT-SWAP", "5m", END - 2499 * STEP, END + 1)) == 2500
+    fake.extend(150)
+    counts = asyncio.run(collector.collect(["BTC-USDT-SWAP"], ["5m"], sync=True))
+    assert counts[("BTC-USDT-SWAP", "5m")] == 150
+    assert not (tmp_path / "fragments").exists()
+    datasets = discover_datasets((), store.root)
+    assert datasets[("BTC-USDT-SWAP", "5m")] == [store.data_file("BTC-USDT-SWAP", "5m")]
+    klines = load_dataset(datasets[("BTC-USDT-SWAP", "5m")])
+    assert [k[0] for k in klines] == list(range(END - 2499 * STEP, END + 151 * STEP, STEP))
+    assert store.entry("BTC-USDT-SWAP", "5m")["ranges"] == [[END - 2499 * STEP, END + 150 * STEP]]
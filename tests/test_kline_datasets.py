@@ -0,0 +1,56 @@
+"""本地K线数据集发现与合并"""
+import csv
+
+from utils.kline_datasets import discover_datasets, load_dataset
+
+
+def _write(path, rows):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["timestamp", "open", "high", "low", "close", "volume", "volCcy", "volCcyQuote", "confirm"])
+        writer.writerows(rows)
+
+
+def test_discovers_nested_and_flat_layouts_and_merges_files(tmp_path):
+    swap = tmp_path / "swap_kline_data"
+    (swap / "ADA-USDT-SWAP").mkdir(parents=True)
+    flat = tmp_path / "trump_kline_data"
+    flat.mkdir()
+    rows = [[ts, 1.0, 1.2, 0.9, 1.1, 5, 5, 5, 1] for ts in range(1000, 0, -100)]  # 新→旧
+    _write(swap / "ADA-USDT-SWAP" / "ADA_5m_1000_500.csv", rows[:6])
+    _write(swap / "ADA-USDT-SWAP" / "ADA_5m_600_100.csv", rows[4:])  # 与上一个文件重叠两根
+    _write(flat / "TRUMP-USDT-SWAP_15m_1_2.csv", [[1, 2.0, 2.0, 2.0, 2.0], [2, 2.0, 2.0, 2.0, 2.0]])
+    datasets = discover_datasets((str(swap), str(flat)))
+    assert sorted(datasets) == [("ADA-USDT-SWAP", "5m"), ("TRUMP-USDT-SWAP", "15m")]
+    klines = load_dataset(datasets[("ADA-USDT-SWAP", "5m")])
+    assert [k[0] for k in klines] == list(range(100, 1001, 100))
+    assert klines[0] == [100, 1.0, 1.2, 0.9, 1.1]
+
+
+def test_store_appends_merges_and_replaces_fragments(tmp_path):
+    from utils.kline_datasets import KlineStore
+    swap = tmp_path / "swap_kline_data"
+    (swap / "ADA-USDT-SWAP").mkdir(parents=True)
+    store_dir = str(tmp_path / "kline_store")
+    step = 300000
+    rows = [[ts, 1.0, 1.2, 0.9, 1.1, 5, 5, 5, 1] for ts in range(20 * step, 0, -step)]  # 新→旧
+    _write(swap / "ADA-USDT-SWAP" / f"ADA_5m_{20 * step}_{11 * step}.csv", rows[:10])
+    _write(swap / "ADA-USDT-SWAP" / f"ADA_5m_{12 * step}_{step}.csv", rows[8:])
+    store = KlineStore(store_dir)
+    assert store.consolidate((str(swap),)) == {("ADA-USDT-SWAP", "5m"): 20}
+    # 已导入的分片不再列出，加载只读合并文件
+    datasets = discover_datasets((str(swap),), store_dir)
+    assert datasets[("ADA-USDT-SWAP", "5m")] == [store.data_file("ADA-USDT-SWAP", "5m")]
+    assert store.consolidate((str(swap),)) == {}
+    # 更晚的K线追加到文件尾，重复的不重复计入；中间缺口记为两段覆盖区间
+    assert store.write("ADA-USDT-SWAP", "5m", [[ts, 2.0, 2.0, 2.0, 2.0] for ts in (20 * step, 23 * step, 24 * step)]) == 2
+    entry = KlineStore(store_dir).entry("ADA-USDT-SWAP", "5m")
+    assert (entry["rows"], entry["first"], entry["last"]) == (22, step, 24 * step)
+    assert entry["ranges"] == [[step, 20 * step], [23 * step, 24 * step]]
+    # 补齐缺口（早于末条）时合并重写
+    assert store.write("ADA-USDT-SWAP", "5m", [[ts, 3.0, 3.0, 3.0, 3.0] for ts in (21 * step, 22 * step)]) == 2
+    klines = load_dataset(datasets[("ADA-USDT-SWAP", "5m")])
+    assert [k[0] for k in klines] == list(range(step, 25 * step, step))
+    assert klines[0] == [step, 1.0, 1.2, 0.9, 1.1]
+    assert store.entry("ADA-USDT-SWAP", "5m")["ranges"] == [[step, 24 * step]]
+    assert [k[0] for k in store.load("ADA-USDT-SWAP", "5m", 22 * step, 24 * step)] == [22 * step, 23 * step]
@@ -0,0 +1,99 @@
+"""限价单成交/撤单/到期模拟与逐根K线参考实现对照"""
+import pytest
+
+from tests.conftest import random_klines
+from utils.backtest_kernel import HAS_NUMPY, LEVERAGE, MARGIN
+
+pytestmark = pytest.mark.skipif(not HAS_NUMPY, reason="需要 numpy")
+
+
+def _reference(klines, amps, tps, sls, expire_bars, entry, slippage, tolerance):
+    # 逐根K线的状态机：先看能否挂单，再处理当根的成交/撤单/到期/止盈止损
+    amp1, amp2, amp3 = amps
+    balance = 0
+    order = position = None
+    counts = {"orders": 0, "filled": 0, "expired": 0, "cancelled": 0}
+    for i in range(1, len(klines)):
+        _, o, h, l, c = klines[i - 1]
+        amp = abs(c - o) / o
+        seg = 2 if amp >= amp3 else 1 if amp >= amp2 else 0 if amp >= amp1 else None
+        if order is None and position is None and seg is not None and c != o:
+            is_long = c < o
+            if entry in ("close", "market"):
+                price = c
+            else:
+                price = ((c + l) / 2) * (1 + slippage) if is_long else ((c + h) / 2) * (1 - slippage)
+            tp, sl = tps[seg], sls[seg]
+            tp_px = price * (1 + tp) if is_long else price * (1 - tp)
+            sl_px = price * (1 - sl) if is_long else price * (1 + sl)
+            order = (is_long, price, tp, sl, tp_px, sl_px, i)
+            if entry == "market":
+                counts["orders"] += 1
+                counts["filled"] += 1
+                position, order = order, None
+        _, _, high, low, close = klines[i]
+        if order is not None:
+            is_long, price, tp, sl, tp_px, sl_px, placed = order
+            if (is_long and low <= price) or (not is_long and high >= price):
+                counts["orders"] += 1
+                counts["filled"] += 1
+                position = order
+                order = None
+                if (is_long and low <= sl_px) or (not is_long and high >= sl_px):
+                    balance -= MARGIN * LEVERAGE * sl
+                    position = None
+                continue
+            if (is_long and close > tp_px * (1 + tolerance)) or (not is_long and close < tp_px * (1 - tolerance)):
+                counts["orders"] += 1
+                counts["cancelled"] += 1
+                order = None
+            elif i - placed + 1 >= expire_bars:
+                counts["orders"] += 1
+                counts["expired"] += 1
+                order = None
+            continue
+        if position is not None:
+            is_long, price, tp, sl, tp_px, sl_px, _ = position
+            hit_tp = high >= tp_px if is_long else low <= tp_px
+            hit_sl = low <= sl_px if is_long else high >= sl_px
+            if hit_sl:
+                balance -= MARGIN * LEVERAGE * sl
+                position = None
+            elif hit_tp:
+                balance += MARGIN * LEVERAGE * tp
+                position = None
+    return balance, counts
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+@pytest.mark.parametrize("entry,slippage,expire_bars",
+                         [("close", 0.0, 4), ("mid", 0.005, 12), ("mid", 0.0, 1), ("market", 0.0, 4)])
+def test_matches_bar_by_bar_reference(seed, entry, slippage, expire_bars):
+    from utils.backtest_kernel import KlineArrays, build_segment_plan
+    from utils.limit_orders import backtest_segmented_limit
+    klines = random_klines(600, seed, move=0.03, wick=0.015, gap=0.01)
+    amps = (0.005, 0.015, 0.025)
+    tps, sls = (0.01, 0.02, 0.03), (0.015, 0.01, 0.02)
+    plan = build_segment_plan(KlineArrays(klines), *amps)
+    stats = {}
+    balance = backtest_segmented_limit(plan, tps[0], sls[0], tps[1], sls[1], tps[2], sls[2],
+                                       expire_bars=expire_bars, entry=entry, slippage=slippage, stats=stats)
+    expected, counts = _reference(klines, amps, tps, sls, expire_bars, entry, slippage, 0.0001)
+    assert balance == pytest.approx(expected)
+    assert stats == counts
+    assert stats["filled"] and (stats["expired"] + stats["cancelled"] if entry != "market" else
+                                stats["filled"] == stats["orders"])
+
+
+def test_cancels_when_price_runs_past_take_profit_before_fill():
+    from utils.backtest_kernel import KlineArrays, build_segment_plan
+    from utils.limit_orders import backtest_segmented_limit
+    # 阴线信号在100挂多单，下一根不回落到100却收在止盈价101之上 -> 撤单
+    klines = [[0, 100, 100, 100, 100], [1, 102, 102, 100, 100], [2, 100.5, 102, 100.2, 101.5],
+              [3, 101.5, 101.6, 101.4, 101.5]]
+    stats = {}
+    trades = []
+    balance = backtest_segmented_limit(build_segment_plan(KlineArrays(klines), 0.01, 0.5, 0.9),
+                                       0.01, 0.02, 0.01, 0.02, 0.01, 0.02, trades=trades, stats=stats)
+    assert balance == 0 and trades == []
+    assert stats == {"orders": 1, "filled": 0, "expired": 0, "cancelled": 1}
@@ -0,0 +1,34 @@
+"""交易重抽样蒙特卡洛"""
+import pytest
+
+np = pytest.importorskip("numpy")
+
+import optimize_trump_strategy as ots
+from tests.conftest import load_bundled_klines
+from utils.monte_carlo import simulate_trades
+
+
+def test_permutation_keeps_final_profit_and_bounds_drawdown():
+    pnl = [5.0, -4.0, -4.0, 5.0, 5.0, -4.0]
+    mc = simulate_trades(pnl, n_sims=500, method="permutation", rng=1, batch=128)
+    assert mc["final"][5] == pytest.approx(3.0) and mc["final"][95] == pytest.approx(3.0)
+    # 三笔亏损连在一起时回撤最大为12，最小为一笔亏损4
+    assert 4.0 <= mc["drawdowns"].min() and mc["drawdowns"].max() <= 12.0
+    assert mc["equity"][50].shape == (6,)
+
+
+def test_bootstrap_ruin_probability():
+    mc = simulate_trades([-10.0, 10.0], n_sims=4000, rng=2, capital=20.0)
+    # 两笔都亏才会跌到 -20
+    assert mc["ruin_probability"] == pytest.approx(0.25, abs=0.03)
+    with pytest.raises(ValueError):
+        simulate_trades([1.0], method="unknown")
+
+
+def test_trade_pnls_match_kernel_balance():
+    klines = load_bundled_klines("15m")
+    params = dict(zip(ots.PARAM_NAMES, (0.012, 0.022, 0.032, 0.05, 0.05, 0.01, 0.01, 0.05, 0.01)))
+    pnls = ots.trade_pnls(klines, params)
+    assert sum(pnls) == pytest.approx(ots.backtest_segmented_custom_loop(klines, *params.values()))
+    [res] = ots.monte_carlo_report(klines, [params], n_sims=200)
+    assert 0.0 <= res['monte_carlo']['ruin_probability'] <= 1.0
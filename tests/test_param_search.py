@@ -0,0 +1,26 @@
+"""可插拔搜索方法：在可分离的合成目标上应找到全局最优"""
+import random
+
+from utils.param_search import OPTIMIZERS, PARAM_NAMES
+
+SPACE = [[0.01, 0.02, 0.03, 0.04]] * 3 + [[0.01, 0.02, 0.03]] * 6
+TARGET = (0.01, 0.03, 0.04, 0.02, 0.01, 0.03, 0.02, 0.01, 0.03)
+
+
+def synthetic_evaluate(configs, fraction=1.0):
+    return [-sum(abs(a - b) for a, b in zip(c, TARGET)) for c in configs]
+
+
+def test_every_method_reports_comparable_summary():
+    for name, method in OPTIMIZERS.items():
+        summary = method(synthetic_evaluate, SPACE, random.Random(1))
+        assert summary["method"] == name
+        assert 0 < summary["evaluations_to_best"] <= summary["evaluations"]
+        assert set(PARAM_NAMES) <= set(summary["best"])
+
+
+def test_coordinate_descent_matches_grid_with_fewer_evaluations():
+    grid = OPTIMIZERS["grid"](synthetic_evaluate, SPACE, random.Random(0))
+    coordinate = OPTIMIZERS["coordinate"](synthetic_evaluate, SPACE, random.Random(0))
+    assert coordinate["best"] == grid["best"]
+    assert coordinate["evaluations"] < grid["evaluations"] / 10
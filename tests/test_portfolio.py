@@ -0,0 +1,99 @@
+"""多参数多账户组合回测与逐笔标记的参考实现对照"""
+import pytest
+
+from tests.conftest import random_klines
+from utils.backtest_kernel import HAS_NUMPY, LEVERAGE, MARGIN
+
+pytestmark = pytest.mark.skipif(not HAS_NUMPY, reason="需要 numpy")
+
+PARAMS = [
+    {"TAKE_PROFIT_PERCENT": 0.02, "STOP_LOSS_PERCENT": 0.02, "AMPLITUDE_PERCENT": 0.022},
+    {"TAKE_PROFIT_PERCENT": 0.03, "STOP_LOSS_PERCENT": 0.015, "AMPLITUDE_PERCENT": 0.012},
+    {"TAKE_PROFIT_PERCENT": 0.01, "STOP_LOSS_PERCENT": 0.03, "AMPLITUDE_PERCENT": 0.018},
+]
+
+
+def _reference(klines, instances, capital):
+    # 每根K线逐笔检查、逐笔按收盘价标记浮动盈亏
+    accounts = list(dict.fromkeys(inst["account"] for inst in instances))
+    notional = MARGIN * LEVERAGE
+    positions = []
+    realized = {a: 0.0 for a in accounts}
+    profits = [0.0] * len(instances)
+    equity, margin = [[capital] * len(accounts)], [[0.0] * len(accounts)]
+    for i in range(1, len(klines)):
+        _, o, h, l, c = klines[i - 1]
+        for inst_id, inst in enumerate(instances):
+            if (h - l) / l >= inst["amplitude"]:
+                is_long = not c > o
+                tp_px = c * (1 + inst["tp"]) if is_long else c * (1 - inst["tp"])
+                sl_px = c * (1 - inst["sl"]) if is_long else c * (1 + inst["sl"])
+                positions.append((inst_id, is_long, c, tp_px, sl_px))
+        _, _, high, low, close = klines[i]
+        still_open = []
+        for inst_id, is_long, entry, tp_px, sl_px in positions:
+            inst = instances[inst_id]
+            hit_tp = high >= tp_px if is_long else low <= tp_px
+            hit_sl = low <= sl_px if is_long else high >= sl_px
+            pnl = -notional * inst["sl"] if hit_sl else notional * inst["tp"] if hit_tp else None
+            if pnl is None:
+                still_open.append((inst_id, is_long, entry, tp_px, sl_px))
+            else:
+                realized[inst["account"]] += pnl
+                profits[inst_id] += pnl
+        positions = still_open
+        row = {a: capital + realized[a] for a in accounts}
+        used = {a: 0.0 for a in accounts}
+        for inst_id, is_long, entry, _, _ in positions:
+            account = instances[inst_id]["account"]
+            row[account] += notional * ((close - entry) if is_long else (entry - close)) / entry
+            used[account] += MARGIN
+        equity.append([row[a] for a in accounts])
+        margin.append([used[a] for a in accounts])
+    return accounts, equity, margin, profits
+
+
+def test_matches_per_position_marking():
+    import numpy as np
+    from utils.portfolio import portfolio_instances, simulate_portfolio
+    klines = random_klines(800, 7, move=0.015)
+    instances = portfolio_instances(PARAMS, ["", "1"])
+    instances[-1]["account"] = "2"  # 最后一个实例单独一个账户
+    res = simulate_portfolio(klines, instances, capital=50.0)
+    accounts, equity, margin, profits = _reference(klines, instances, 50.0)
+    assert res["accounts"] == accounts == ["默认", "1", "2"]
+    np.testing.assert_allclose(res["equity"], equity, rtol=0, atol=1e-9)
+    assert res["margin"].tolist() == margin
+    assert [inst["profit"] for inst in res["instances"]] == pytest.approx(profits)
+    total = [sum(row) for row in equity]
+    peak, drawdown = total[0], 0.0
+    for value in total:
+        peak = max(peak, value)
+        drawdown = max(drawdown, peak - value)
+    assert res["max_drawdown"] == pytest.approx(drawdown)
+    assert res["total_margin_peak"] == max(sum(row) for row in margin)
+    assert res["margin_peak"] == [max(col) for col in zip(*margin)]
+    assert res["total_margin_peak"] > max(res["margin_peak"])
+
+
+def test_accounts_running_same_params_are_identical():
+    from utils.portfolio import portfolio_instances, simulate_portfolio
+    res = simulate_portfolio(random_klines(400, 3, move=0.015), portfolio_instances(PARAMS, ["", "1", "2", "3"]))
+    assert len(res["instances"]) == 12
+    equity = res["equity"]
+    assert all((equity[:, a] == equity[:, 0]).all() for a in range(4))
+    assert res["total_margin_peak"] == 4 * res["margin_peak"][0]
+
+
+def test_portfolio_entry_point_runs_real_live_script(tmp_path):
+    from backtest_live_strategies import portfolio_backtest
+    from utils.event_backtest import load_live_module
+    module = load_live_module("okx_trump_multi_strategy_15m.py")
+    path = tmp_path / "trump.csv"
+    path.write_text("timestamp,open,high,low,close\n" + "".join(
+        f"{k[0] * 900000},{k[1]},{k[2]},{k[3]},{k[4]}\n" for k in random_klines(500, 3, move=0.015)), encoding="utf-8")
+    res = portfolio_backtest({(module.INST_ID, module.BAR): [str(path)]})
+    assert len(res["accounts"]) == len(module.ACCOUNT_SUFFIXES)
+    assert len(res["instances"]) == len(module.ACCOUNT_SUFFIXES) * len(module.STRATEGY_PARAMS)
+    assert res["equity"].shape == (500, len(module.ACCOUNT_SUFFIXES))
+    assert sum(inst["trades"] for inst in res["instances"]) > 0
@@ -0,0 +1,96 @@
+"""加仓持仓簿与逐笔扫描参考实现对照"""
+import pytest
+
+from tests.conftest import random_klines
+from utils.backtest_kernel import HAS_NUMPY, LEVERAGE, MARGIN, SIDE_LONG, SIDE_SHORT
+
+pytestmark = pytest.mark.skipif(not HAS_NUMPY, reason="需要 numpy")
+
+
+def _reference(klines, amps, tps, sls, pyramiding):
+    # 每个可检查步遍历全部持仓的朴素实现（平仓规则同单笔持仓内核）
+    amp1, amp2, amp3 = amps
+    positions = []
+    trades = []
+    peak = 0
+    for i in range(1, len(klines)):
+        _, o, _, _, c = klines[i - 1]
+        amp = abs(c - o) / o
+        seg = 2 if amp >= amp3 else 1 if amp >= amp2 else 0 if amp >= amp1 else None
+        if seg is None:
+            continue
+        can_open = len(positions) < pyramiding
+        _, _, high, low, _ = klines[i]
+        still_open = []
+        for opened, side, pos_seg, entry, tp_px, sl_px in positions:
+            hit_tp = high >= tp_px if side == SIDE_LONG else low <= tp_px
+            hit_sl = low <= sl_px if side == SIDE_LONG else high >= sl_px
+            if hit_sl:
+                trades.append((opened, i, side, pos_seg, entry, sl_px, -(MARGIN * LEVERAGE * sls[pos_seg])))
+            elif hit_tp:
+                trades.append((opened, i, side, pos_seg, entry, tp_px, MARGIN * LEVERAGE * tps[pos_seg]))
+            else:
+                still_open.append((opened, side, pos_seg, entry, tp_px, sl_px))
+        positions = still_open
+        if c != o and can_open:
+            side = SIDE_LONG if c < o else SIDE_SHORT
+            tp_px = c * (1 + tps[seg]) if side == SIDE_LONG else c * (1 - tps[seg])
+            sl_px = c * (1 - sls[seg]) if side == SIDE_LONG else c * (1 + sls[seg])
+            positions.append((i - 1, side, seg, c, tp_px, sl_px))
+            peak = max(peak, len(positions))
+    return trades, len(positions), peak
+
+
+@pytest.mark.parametrize("seed", [1, 2])
+@pytest.mark.parametrize("pyramiding", [1, 5, 1000])
+def test_matches_list_scan_reference(seed, pyramiding):
+    from utils.backtest_kernel import KlineArrays, build_segment_plan
+    from utils.position_book import backtest_segmented_pyramiding
+    klines = random_klines(1500, seed)
+    amps = (0.004, 0.01, 0.016)
+    tps, sls = (0.01, 0.03, 0.05), (0.02, 0.015, 0.04)
+    trades = []
+    balance, still_open, peak = backtest_segmented_pyramiding(
+        build_segment_plan(KlineArrays(klines), *amps), tps[0], sls[0], tps[1], sls[1], tps[2], sls[2],
+        pyramiding=pyramiding, trades=trades)
+    expected, expected_open, expected_peak = _reference(klines, amps, tps, sls, pyramiding)
+    assert sorted(trades) == sorted(expected)
+    assert balance == pytest.approx(sum(t[6] for t in expected))
+    assert (still_open, peak) == (expected_open, expected_peak)
+    assert peak <= pyramiding and (pyramiding == 1 or peak > 1)
+
+
+@pytest.mark.parametrize("seed", [1, 2])
+def test_single_position_matches_kernel(seed):
+    from utils.backtest_kernel import KlineArrays, backtest_segmented_kernel, build_segment_plan
+    from utils.position_book import backtest_segmented_pyramiding
+    arrays = KlineArrays(random_klines(1500, seed))
+    # 同K线同时触及止盈止损时按时间戳奇偶判定，两个引擎须得到相同结果
+    calls = []
+    arrays.intrabar = lambda ts, is_long, tp_price, sl_price: calls.append(ts) or ts % 2 == 0
+    params = (0.006, 0.008, 0.008, 0.01, 0.01, 0.012)
+    plan = build_segment_plan(arrays, 0.004, 0.01, 0.016)
+    kernel_trades, trades = [], []
+    balance = backtest_segmented_kernel(plan, *params, trades=kernel_trades)
+    assert backtest_segmented_pyramiding(plan, *params, pyramiding=1, trades=trades)[0] == balance
+    # 内核记录开仓步，持仓簿记录信号K（开仓步-1）
+    assert [(t[0] + 1,) + t[1:] for t in trades] == kernel_trades
+    assert calls and calls[:len(calls) // 2] == calls[len(calls) // 2:]
+    # 平仓步恰为开仓点时不再开仓
+    assert any(t[1] in plan["entries"] for t in kernel_trades)
+
+
+def test_reused_slot_ignores_stale_heap_entries():
+    from utils.position_book import PositionBook
+    book = PositionBook(capacity=1)
+    first = book.open(SIDE_LONG, 100.0, 101.0, 99.0, bar=0)
+    assert book.check_bar(high=100.5, low=98.5) == [(first, False)]
+    # 新持仓复用同一槽位，旧持仓留在止盈堆中的条目（101）不能把它平掉
+    second = book.open(SIDE_LONG, 100.0, 110.0, 90.0, bar=1)
+    assert second == first
+    assert book.check_bar(high=102.0, low=99.5) == []
+    assert len(book) == 1
+    assert book.unrealized(105.0) == pytest.approx(MARGIN * LEVERAGE * 0.05)
+    # 超出容量时自动扩容
+    book.open(SIDE_SHORT, 100.0, 95.0, 105.0, bar=2)
+    assert len(book) == 2 and sorted(book.check_bar(high=106.0, low=104.0)) == [(1, False)]
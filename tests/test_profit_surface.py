@@ -0,0 +1,40 @@
+"""收益曲面导出与查询"""
+import itertools
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+import optimize_trump_strategy as ots
+from tests.conftest import random_walk_klines
+from utils.profit_surface import ProfitSurface, create_surface, neighbourhood_mean
+
+
+def test_neighbourhood_mean_ignores_nan():
+    values = np.array([[1.0, 2.0, np.nan], [4.0, np.nan, 6.0]])
+    smoothed = neighbourhood_mean(values, radius=1)
+    assert smoothed[0, 0] == pytest.approx((1 + 2 + 4) / 3)
+    assert smoothed[1, 2] == pytest.approx((2 + 6) / 2)
+
+
+def test_worker_blocks_fill_queryable_surface(tmp_path, monkeypatch):
+    klines = random_walk_klines(4, 300)
+    amp_grid = [0.01, 0.02, 0.04]
+    grid = [0.01, 0.03]
+    grids = (grid,) * 6
+    path = str(tmp_path / "surface.npy")
+    create_surface(path, ots.PARAM_NAMES, (amp_grid,) * 3 + grids)
+    # 直接在本进程调用 worker 任务
+    monkeypatch.setattr(ots, "_WORKER_KLINES", ots.as_kline_arrays(klines))
+    monkeypatch.setattr(ots, "_WORKER_GRIDS", grids)
+    ots._surface_amp_chunk([(path, (0, 1, 2), (0.01, 0.02, 0.04))])
+    surface = ProfitSurface(path)
+    for combo in itertools.product(*grids):
+        params = dict(zip(ots.PARAM_NAMES, (0.01, 0.02, 0.04) + combo))
+        expected = ots.backtest_segmented_custom_loop(klines, *(params[n] for n in ots.PARAM_NAMES))
+        assert surface.value(params) == pytest.approx(expected)
+    sub, names, axes = surface.slice(amp1_min=0.01, amp2_min=0.02, amp3_min=0.04, tp1=0.01, sl1=0.03)
+    assert names == ["tp2", "sl2", "tp3", "sl3"] and sub.shape == (2, 2, 2, 2)
+    # 未写入的分段区间保持 NaN
+    assert np.isnan(surface.values[0, 0, 0]).all()
+    assert not np.isnan(surface.robust_value(params, radius=1))
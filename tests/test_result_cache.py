@@ -0,0 +1,31 @@
+"""回测结果磁盘缓存"""
+from utils.result_cache import ResultCache, dataset_fingerprint
+
+
+def test_roundtrip_and_keys_are_separated(tmp_path):
+    with ResultCache(str(tmp_path / "cache.sqlite")) as cache:
+        cache.put_many("d1", "s", [((0.01, 0.02), 3.5), ((0.01, 0.03), {"profit": 1.0})])
+        found = cache.get_many("d1", "s", [(0.01, 0.02), (0.01, 0.03), (0.01, 0.04)])
+        assert found == {(0.01, 0.02): 3.5, (0.01, 0.03): {"profit": 1.0}}
+        assert cache.get_many("d2", "s", [(0.01, 0.02)]) == {}
+        assert cache.get_many("d1", "other", [(0.01, 0.02)]) == {}
+    # 重新打开后结果仍在
+    with ResultCache(str(tmp_path / "cache.sqlite")) as cache:
+        assert cache.get_many("d1", "s", [(0.01, 0.02)]) == {(0.01, 0.02): 3.5}
+
+
+def test_evicts_least_recently_used(tmp_path):
+    with ResultCache(str(tmp_path / "cache.sqlite"), max_entries=3) as cache:
+        cache.put_many("d", "s", [((1,), 1), ((2,), 2), ((3,), 3)])
+        cache.get_many("d", "s", [(1,)])  # 1 变为最近使用
+        cache.put_many("d", "s", [((4,), 4)])
+        assert cache.get_many("d", "s", [(1,), (2,), (3,), (4,)]) == {(1,): 1, (3,): 3, (4,): 4}
+
+
+def test_fingerprint_tracks_content():
+    klines = [{"ts": i, "open": 1.0, "high": 1.2, "low": 0.9, "close": 1.1} for i in range(5)]
+    same = [dict(k) for k in klines]
+    changed = [dict(k) for k in klines]
+    changed[3]["close"] = 1.05
+    assert dataset_fingerprint(klines) == dataset_fingerprint(same)
+    assert dataset_fingerprint(klines) != dataset_fingerprint(changed)
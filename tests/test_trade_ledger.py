@@ -0,0 +1,39 @@
+"""列式交易账本与向量化报表"""
+import pytest
+
+pytest.importorskip("numpy")
+
+from utils.backtest_kernel import SIDE_LONG, SIDE_SHORT
+from utils.trade_ledger import TradeLedger
+
+RECORDS = [
+    (0, 3, SIDE_LONG, 1, 10.0, 10.5, 5.0),
+    (4, 6, SIDE_SHORT, 2, 10.5, 11.0, -4.0),
+    (7, 8, SIDE_SHORT, 2, 11.0, 11.2, -2.0),
+    (9, 15, SIDE_LONG, 3, 11.2, 11.6, 3.0),
+]
+
+
+def test_columns_are_typed_and_compact():
+    ledger = TradeLedger.from_records(RECORDS)
+    assert ledger.side.dtype.itemsize == 1 and ledger.entry_idx.dtype.itemsize == 4
+    assert ledger.nbytes == 34 * len(RECORDS)
+    assert ledger.to_dicts()[1] == {"seg": 2, "dir": "SHORT", "entry": 10.5, "exit": 11.0, "result": -4.0,
+                                    "entry_idx": 4, "exit_idx": 6}
+
+
+def test_reports():
+    ledger = TradeLedger.from_records(RECORDS)
+    assert ledger.equity_curve().tolist() == [5.0, 1.0, -1.0, 2.0]
+    assert ledger.max_drawdown() == 6.0
+    assert ledger.profit_factor() == 8.0 / 6.0
+    assert ledger.avg_holding_bars() == (3 + 2 + 1 + 6) / 4
+    count, wins, profit = ledger.segment_stats()
+    assert count.tolist() == [1, 2, 1] and wins.tolist() == [1, 0, 1] and profit.tolist() == [5.0, -6.0, 3.0]
+
+
+def test_empty_ledger():
+    ledger = TradeLedger.from_records([])
+    assert len(ledger) == 0
+    assert ledger.report() == {"profit": 0.0, "trades": 0, "winrate": 0, "max_drawdown": 0.0,
+                               "profit_factor": 0.0, "avg_holding_bars": 0.0}
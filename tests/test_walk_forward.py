@@ -0,0 +1,25 @@
+"""前推分析的折划分与单折任务"""
+import pytest
+
+pytest.importorskip("numpy")
+
+import optimize_trump_strategy as ots
+from tests.conftest import random_walk_klines
+
+
+def test_folds_roll_by_test_length_without_overlap():
+    assert ots.walk_forward_folds(100, 40, 20) == [(0, 40, 60), (20, 60, 80), (40, 80, 100)]
+    assert ots.walk_forward_folds(50, 40, 20) == []
+
+
+def test_fold_task_reports_train_best_and_out_of_sample(monkeypatch):
+    klines = random_walk_klines(2, 500)
+    grid = [0.01, 0.03, 0.05]
+    monkeypatch.setattr(ots, "_WORKER_KLINES", ots.as_kline_arrays(klines))
+    monkeypatch.setattr(ots, "_WORKER_GRIDS", (grid,) * 6)
+    monkeypatch.setattr(ots, "_WORKER_WINDOWS", {})
+    amps = (0.01, 0.02, 0.04)
+    [res] = ots._walk_forward_chunk([((100, 400, 500), amps)])
+    assert res['profit'] == ots.search_best_tp_sl(klines[100:400], *amps, grid, grid)['profit']
+    params = [res[name] for name in ots.PARAM_NAMES]
+    assert res['oos_profit'] == ots.backtest_segmented_custom_loop(klines[400:500], *params)
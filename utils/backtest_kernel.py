@@ -0,0 +1,326 @@
+"""
+分段振幅策略回测内核（列式 NumPy 实现）
+K线数组只构建一次，分段判定、入场价以数组运算完成，止盈止损首次触达由稀疏表
+索引按 O(log n) 查询，单次回测代价为 O(交易笔数·log n)；结果与 optimize_trump_strategy.backtest_segmented_custom 的逐根循环逐位一致。
+"""
+from bisect import bisect_right
+
+try:
+    import numpy as np
+except ImportError:  # 未安装numpy时由调用方退回纯Python循环
+    np = None
+
+HAS_NUMPY = np is not None
+
+LEVERAGE = 10
+MARGIN = 10
+
+SIDE_LONG = 1
+SIDE_SHORT = -1
+
+# 每组参数的绩效指标；排序方向 1=越大越好，-1=越小越好
+METRIC_SIGNS = {
+    "profit": 1,
+    "winrate": 1,
+    "trades": 1,
+    "max_drawdown": -1,
+    "sharpe": 1,
+    "max_losing_streak": -1,
+}
+
+
+class KlineArrays:
+    """K线列式数组（ts/open/high/low/close），一次构建、多次回测复用"""
+
+    def __init__(self, klines):
+        if not HAS_NUMPY:
+            raise RuntimeError("KlineArrays 需要安装 numpy")
+        if klines and isinstance(klines[0], dict):
+            # parse_kline 输出: {"ts", "open", "high", "low", "close"}
+            self.ts = np.array([k["ts"] for k in klines], dtype=np.int64)
+            self.open = np.array([k["open"] for k in klines], dtype=np.float64)
+            self.high = np.array([k["high"] for k in klines], dtype=np.float64)
+            self.low = np.array([k["low"] for k in klines], dtype=np.float64)
+            self.close = np.array([k["close"] for k in klines], dtype=np.float64)
+        else:
+            # 原始K线: [timestamp, open, high, low, close, ...]
+            self.ts = np.array([int(k[0]) for k in klines], dtype=np.int64)
+            self.open = np.array([float(k[1]) for k in klines], dtype=np.float64)
+            self.high = np.array([float(k[2]) for k in klines], dtype=np.float64)
+            self.low = np.array([float(k[3]) for k in klines], dtype=np.float64)
+            self.close = np.array([float(k[4]) for k in klines], dtype=np.float64)
+        self._derive()
+
+    @classmethod
+    def from_columns(cls, ts, open_, high, low, close):
+        """直接引用已有列数组（如共享内存视图），不复制数据"""
+        arrays = cls.__new__(cls)
+        arrays.ts, arrays.open, arrays.high, arrays.low, arrays.close = ts, open_, high, low, close
+        arrays._derive()
+        return arrays
+
+    def slice(self, start, stop):
+        """[start, stop) 区间的视图，不复制数据"""
+        view = KlineArrays.from_columns(self.ts[start:stop], self.open[start:stop], self.high[start:stop],
+                                        self.low[start:stop], self.close[start:stop])
+        view.intrabar = self.intrabar
+        return view
+
+    def _derive(self):
+        # 实体振幅与方向：阳线做空，阴线做多，十字星不开仓
+        self.amp = np.abs(self.close - self.open) / self.open
+        self.side = np.where(self.close > self.open, SIDE_SHORT,
+                             np.where(self.close < self.open, SIDE_LONG, 0)).astype(np.int8)
+        self._check_cache = {}
+        # 同一根K线同时触及止盈止损时的小周期判定器（见 utils/intrabar.py），None 表示按止损计
+        self.intrabar = None
+
+    def __len__(self):
+        return len(self.close)
+
+    def checks_for(self, amp_min):
+        """
+        振幅>=amp_min 的信号K所对应的检查步号及其首次触达索引。
+        分段区间有序时 (amp1<amp2<amp3) 可检查步只取决于 amp1_min，
+        因此同一K线序列上所有共享 amp1_min 的分段区间与TP/SL网格共用一份索引。
+        """
+        cached = self._check_cache.get(amp_min)
+        if cached is None:
+            checks = np.flatnonzero(self.amp[:-1] >= amp_min) + 1
+            cached = (checks, FirstTouchIndex(self.high[checks], self.low[checks]))
+            self._check_cache[amp_min] = cached
+        return cached
+
+
+class FirstTouchIndex:
+    """
+    最高价/最低价稀疏表：level p 的第 i 项为区间 [i, i+2^p) 的最高价（最低价）。
+    回答“start 之后首个 high>=X / low<=Y 的位置”只需 O(log n) 次跳跃。
+    """
+
+    def __init__(self, highs, lows):
+        self.size = len(highs)
+        high_levels = [highs]
+        low_levels = [lows]
+        span = 1
+        while span * 2 <= self.size:
+            prev_high, prev_low = high_levels[-1], low_levels[-1]
+            high_levels.append(np.maximum(prev_high[:-span], prev_high[span:]))
+            low_levels.append(np.minimum(prev_low[:-span], prev_low[span:]))
+            span *= 2
+        # 查询为逐标量跳跃，转成list避免numpy标量开销
+        self.highs = [level.tolist() for level in reversed(high_levels)]
+        self.lows = [level.tolist() for level in reversed(low_levels)]
+        self.spans = [1 << p for p in reversed(range(len(high_levels)))]
+
+    def first_high_at_least(self, start, level):
+        """start 及之后首个 high>=level 的位置，不存在返回 size"""
+        pos = start
+        for span, table in zip(self.spans, self.highs):
+            if pos + span <= self.size and table[pos] < level:
+                pos += span
+        return pos
+
+    def first_low_at_most(self, start, level):
+        """start 及之后首个 low<=level 的位置，不存在返回 size"""
+        pos = start
+        for span, table in zip(self.spans, self.lows):
+            if pos + span <= self.size and table[pos] > level:
+                pos += span
+        return pos
+
+
+# 最近一次由K线列表转换出的数组。调用方反复传入同一个列表（如 parse_kline 的结果）时
+# 直接复用，分段预计算与首次触达索引因此在整个序列的所有TP/SL网格间共用
+_last_converted = (None, None)
+
+
+def as_kline_arrays(klines):
+    global _last_converted
+    if isinstance(klines, KlineArrays):
+        return klines
+    source, arrays = _last_converted
+    if source is klines and len(arrays) == len(klines):
+        return arrays
+    arrays = KlineArrays(klines)
+    _last_converted = (klines, arrays)
+    return arrays
+
+
+def assign_segments(arrays, amp1_min, amp2_min, amp3_min):
+    """逐根K线分段编号（-1=不触发, 0/1/2=分段1/2/3），优先级3>2>1"""
+    amp = arrays.amp
+    conditions = [
+        amp >= amp3_min,
+        (amp >= amp2_min) & (amp < amp3_min),
+        (amp >= amp1_min) & (amp < amp2_min),
+    ]
+    return np.select(conditions, [2, 1, 0], default=-1).astype(np.int8)
+
+
+def build_segment_plan(arrays, amp1_min, amp2_min, amp3_min):
+    """
+    预计算一组分段区间下与止盈止损无关的部分，供该区间下所有 TP/SL 组合复用。
+    回测第 i 步以 K线 i-1 为信号K、K线 i 为检查K；只有信号K落入某分段时该步才会
+    开仓或检查平仓（与原循环中的 continue 语义一致）。
+    """
+    arrays = as_kline_arrays(arrays)
+    seg = assign_segments(arrays, amp1_min, amp2_min, amp3_min)
+    if amp1_min < amp2_min < amp3_min:
+        checks, touch = arrays.checks_for(amp1_min)
+    else:
+        checks = np.flatnonzero(seg[:-1] >= 0) + 1
+        touch = FirstTouchIndex(arrays.high[checks], arrays.low[checks])
+    return plan_from_segments(arrays, seg, checks, touch)
+
+
+def plan_from_segments(arrays, seg, checks, touch):
+    """由逐根分段编号、可检查步号及其触达索引组装回测计划"""
+    # 可开仓的步号：信号K落入分段且非十字星
+    signal = checks - 1
+    entries = checks[(seg[signal] >= 0) & (arrays.side[signal] != 0)]
+    return {
+        "arrays": arrays,
+        "seg": seg,
+        "checks": checks.tolist(),
+        "touch": touch,
+        "entries": entries.tolist(),
+        "entry_seg": seg[entries - 1].tolist(),
+        "entry_side": arrays.side[entries - 1].tolist(),
+        "entry_price": arrays.close[entries - 1].tolist(),
+        "resolve": arrays.intrabar,
+    }
+
+
+def backtest_segmented_kernel(plan, tp1, sl1, tp2, sl2, tp3, sl3, trades=None):
+    """
+    按预计算的分段计划回测一组止盈止损参数，返回最终 balance；每笔交易 O(log n)。
+    传入 trades 列表时逐笔追加 (开仓步, 平仓步, 方向, 分段, 入场价, 出场价, 盈亏)。
+    """
+    tps = (tp1, tp2, tp3)
+    sls = (sl1, sl2, sl3)
+    checks = plan["checks"]
+    touch = plan["touch"]
+    check_high = touch.highs[-1]
+    check_low = touch.lows[-1]
+    n_checks = touch.size
+    entries = plan["entries"]
+    entry_seg = plan["entry_seg"]
+    entry_side = plan["entry_side"]
+    entry_price = plan["entry_price"]
+    resolve = plan.get("resolve")
+    ts = plan["arrays"].ts if resolve is not None else None
+    balance = 0
+    k = 0
+    n_entries = len(entries)
+    while k < n_entries:
+        seg = entry_seg[k]
+        tp, sl = tps[seg], sls[seg]
+        entry = entry_price[k]
+        start = bisect_right(checks, entries[k])
+        if entry_side[k] == SIDE_LONG:
+            tp_price = entry * (1 + tp)
+            sl_price = entry * (1 - sl)
+            pos = min(touch.first_high_at_least(start, tp_price), touch.first_low_at_most(start, sl_price))
+            if pos >= n_checks:
+                break
+            loss = check_low[pos] <= sl_price
+            if loss and resolve is not None and check_high[pos] >= tp_price:
+                loss = not resolve(int(ts[checks[pos]]), True, tp_price, sl_price)
+        else:
+            tp_price = entry * (1 - tp)
+            sl_price = entry * (1 + sl)
+            pos = min(touch.first_low_at_most(start, tp_price), touch.first_high_at_least(start, sl_price))
+            if pos >= n_checks:
+                break
+            loss = check_high[pos] >= sl_price
+            if loss and resolve is not None and check_low[pos] <= tp_price:
+                loss = not resolve(int(ts[checks[pos]]), False, tp_price, sl_price)
+        # 同一根K线同时触及止盈止损时按止损计（设置了小周期判定器时由小周期K线决定先后）
+        # (a - b 与 a + (-b) 在IEEE754下结果相同，balance与循环版逐位一致)
+        pnl = -(MARGIN * LEVERAGE * sl) if loss else MARGIN * LEVERAGE * tp
+        balance += pnl
+        if trades is not None:
+            trades.append((entries[k], checks[pos], entry_side[k], seg, entry, sl_price if loss else tp_price, pnl))
+        # 平仓当步不再开仓，下一笔从之后的开仓点开始
+        k = bisect_right(entries, checks[pos])
+    return balance
+
+
+def trade_metrics(balance, pnls):
+    """
+    由逐笔盈亏一次遍历得到绩效指标（METRIC_SIGNS 中的全部字段）。
+    sharpe 为逐笔收益的 均值/标准差×√笔数，max_drawdown 为从0起算的权益最大回撤。
+    """
+    equity = peak = max_drawdown = 0.0
+    total = squares = 0.0
+    wins = streak = max_streak = 0
+    for pnl in pnls:
+        equity += pnl
+        total += pnl
+        squares += pnl * pnl
+        if equity > peak:
+            peak = equity
+        elif peak - equity > max_drawdown:
+            max_drawdown = peak - equity
+        if pnl > 0:
+            wins += 1
+            streak = 0
+        else:
+            streak += 1
+            if streak > max_streak:
+                max_streak = streak
+    n = len(pnls)
+    sharpe = 0.0
+    if n >= 2:
+        mean = total / n
+        variance = squares / n - mean * mean
+        if variance > 1e-12:
+            sharpe = mean / variance ** 0.5 * n ** 0.5
+    return {"profit": balance, "winrate": wins / n if n else 0, "trades": n,
+            "max_drawdown": max_drawdown, "sharpe": sharpe, "max_losing_streak": max_streak}
+
+
+def backtest_segmented_metrics(plan, tp1, sl1, tp2, sl2, tp3, sl3):
+    """回测一组止盈止损参数并返回全部绩效指标（profit 与 backtest_segmented_kernel 的 balance 相同）"""
+    trades = []
+    balance = backtest_segmented_kernel(plan, tp1, sl1, tp2, sl2, tp3, sl3, trades=trades)
+    return trade_metrics(balance, [t[6] for t in trades])
+
+
+def segment_reach(plan, seg, tp_grid, sl_grid):
+    """
+    统计分段 seg 的开仓点中，各止盈/止损取值在开仓后任一可检查K上能够触达的个数。
+    每个开仓点之后的可检查K是固定的，与其他分段参数无关，因此：
+    止盈可触达个数是该分段盈利笔数的上界；可触达个数为0的取值之间回测结果完全相同。
+    """
+    touch = plan["touch"]
+    highs = np.array(touch.highs[-1], dtype=np.float64)
+    lows = np.array(touch.lows[-1], dtype=np.float64)
+    # 后缀极值，末尾补哨兵表示开仓后已无可检查K
+    later_high = np.append(np.maximum.accumulate(highs[::-1])[::-1], -np.inf)
+    later_low = np.append(np.minimum.accumulate(lows[::-1])[::-1], np.inf)
+    mask = np.array(plan["entry_seg"], dtype=np.int64) == seg
+    entries = np.array(plan["entries"], dtype=np.int64)[mask]
+    price = np.array(plan["entry_price"], dtype=np.float64)[mask]
+    is_long = np.array(plan["entry_side"], dtype=np.int64)[mask] == SIDE_LONG
+    start = np.searchsorted(np.array(plan["checks"], dtype=np.int64), entries, side="right")
+    up, down = later_high[start], later_low[start]
+    tp_reach = [int(np.count_nonzero(np.where(is_long, up >= price * (1 + tp), down <= price * (1 - tp))))
+                for tp in tp_grid]
+    sl_reach = [int(np.count_nonzero(np.where(is_long, down <= price * (1 - sl), up >= price * (1 + sl))))
+                for sl in sl_grid]
+    return tp_reach, sl_reach
+
+
+def collapse_unreachable(grid, reach):
+    """保留可触达的取值；不可触达的取值回测结果相同，只保留网格中最先出现的一个"""
+    kept = []
+    seen_unreachable = False
+    for value, count in zip(grid, reach):
+        if count > 0:
+            kept.append(value)
+        elif not seen_unreachable:
+            kept.append(value)
+            seen_unreachable = True
+    return kept
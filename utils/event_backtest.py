@@ -0,0 +1,190 @@
+"""
+事件驱动回测：把历史K线逐根喂给实盘脚本自己的信号函数（analyze_kline / analyze_signal），
+按实盘方式模拟“限价开仓 + 附带止盈止损”，回测的逻辑与部署的逻辑完全一致。
+
+实盘脚本在新K线开始时拉取最新K线（最新在前：K0=正在走的K线，K1=刚收盘的K线，K2...），
+回测用 NewestFirstWindow 在升序历史数组上提供同样排布的滑动视图：只移动下标，不复制、不重建列表。
+K0 在实盘中尚未收盘，信号函数只应读取 K1 及更早的K线（现有脚本均如此）。
+"""
+import importlib
+import importlib.util
+import os
+import sys
+import types
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+OKX_SDK_MODULES = ("okx.MarketData", "okx.Trade", "okx.Account")  # 实盘脚本顶层 import 的 SDK 模块
+LEVERAGE = 10
+MARGIN = 10
+ORDER_EXPIRE_BARS = 4  # 限价单挂单有效K线数，超时未成交撤单
+
+
+class NewestFirstWindow:
+    """
+    升序K线序列上的“最新在前”窗口视图：window[0] 为 rows[end]，window[j] 为 rows[end-j]。
+    move_to 只改下标，同一个对象在整个回测中复用。
+    """
+
+    def __init__(self, rows, size):
+        self.rows = rows
+        self.size = size
+        self.end = size - 1
+
+    def move_to(self, end):
+        self.end = end
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, j):
+        if isinstance(j, slice):
+            return [self[i] for i in range(*j.indices(self.size))]
+        if j < 0:
+            j += self.size
+        if not 0 <= j < self.size:
+            raise IndexError(j)
+        return self.rows[self.end - j]
+
+    def __iter__(self):
+        for j in range(self.size):
+            yield self.rows[self.end - j]
+
+
+# ========== 信号适配 ==========
+# 适配函数把各脚本的返回值统一成 (方向, 入场价, 止盈价, 止损价)，无信号返回 None
+
+def _prices(side, entry, tp_pct, sl_pct):
+    if side == "LONG":
+        return side, entry, entry * (1 + tp_pct), entry * (1 - sl_pct)
+    return side, entry, entry * (1 - tp_pct), entry * (1 + sl_pct)
+
+
+def single_kline_signal(analyze_kline, tp_pct, sl_pct, *args):
+    """TRUMP/ADA 脚本：analyze_kline(K1, *args) -> (signal, entry_price, info)"""
+    def signal(window):
+        side, entry, _ = analyze_kline(window[1], *args)
+        return _prices(side, float(entry), tp_pct, sl_pct) if side else None
+    return signal
+
+
+def window_kline_signal(analyze_kline, tp_pct, sl_pct):
+    """VINE K1K2 脚本：analyze_kline(最新在前的K线窗口) -> (signal, entry_price, info)"""
+    def signal(window):
+        side, entry, _ = analyze_kline(window)
+        return _prices(side, float(entry), tp_pct, sl_pct) if side else None
+    return signal
+
+
+def signal_dict_signal(analyze_signal):
+    """ETH K7/K1K2 脚本：analyze_signal(窗口) -> {"can_entry", "entry_price", "take_profit", "stop_loss", "pos_side"}"""
+    def signal(window):
+        res = analyze_signal(window)
+        if not res.get("can_entry"):
+            return None
+        side = "LONG" if res["pos_side"] == "long" else "SHORT"
+        return side, float(res["entry_price"]), float(res["take_profit"]), float(res["stop_loss"])
+    return signal
+
+
+def _sdk_placeholder(module_name):
+    # 未安装 okx SDK 时的占位模块：导入成功，真正调用 API 时才报错（回测只用信号函数）
+    module = types.ModuleType(module_name)
+    module.__path__ = []
+
+    def __getattr__(name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+
+        def unavailable(*args, **kwargs):
+            raise RuntimeError(f"未安装 okx SDK，不能调用 {module_name}.{name}")
+        return unavailable
+    module.__getattr__ = __getattr__
+    return module
+
+
+def prepare_live_imports():
+    """
+    让实盘脚本的顶层 import 在回测环境中可用：
+    - 仓库根目录加入 sys.path（ETH 脚本 from utils.okx_utils import ...）
+    - 根目录脚本的 from notification_service import ... 指向 utils/notification_service
+    - okx SDK 未安装时放入占位模块
+    """
+    if REPO_ROOT not in sys.path:
+        sys.path.insert(0, REPO_ROOT)
+    if "notification_service" not in sys.modules:
+        sys.modules["notification_service"] = importlib.import_module("utils.notification_service")
+    for name in OKX_SDK_MODULES:
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            package = sys.modules.get("okx") or sys.modules.setdefault("okx", _sdk_placeholder("okx"))
+            module = _sdk_placeholder(name)
+            sys.modules[name] = module
+            setattr(package, name.split(".")[1], module)
+
+
+def load_live_module(script_path):
+    """按文件路径加载实盘脚本（相对路径按仓库根目录解析；主流程在 __main__ 下不会执行）"""
+    if not os.path.isabs(script_path) and not os.path.exists(script_path):
+        script_path = os.path.join(REPO_ROOT, script_path)
+    prepare_live_imports()
+    module_name = "live_" + os.path.splitext(os.path.basename(script_path))[0].replace("-", "_")
+    spec = importlib.util.spec_from_file_location(module_name, script_path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+# ========== 回测主循环 ==========
+def run_event_backtest(rows, signal_fn, window_size, expire_bars=ORDER_EXPIRE_BARS, margin=MARGIN, leverage=LEVERAGE):
+    """
+    rows 为升序的 [timestamp, open, high, low, close, ...]。
+    每根K线 i 开始时（K0=rows[i]，K1=rows[i-1]）若空仓且无挂单，调用 signal_fn(窗口) 取信号并挂限价单；
+    - 多单 low<=入场价 / 空单 high>=入场价 时成交，挂单超过 expire_bars 根K线未成交则撤单
+    - 成交后止盈止损生效；同一根K线同时触及止盈止损按止损计；成交当根只检查止损（无法确定先后，保守处理）
+    返回 {"balance", "win", "total", "filled", "expired", "trades"}，trades 为 (开仓K线, 平仓K线, 方向, 入场价, 出场价, 盈亏)。
+    """
+    window = NewestFirstWindow(rows, window_size)
+    balance = 0
+    win = total = filled = expired = 0
+    trades = []
+    order = None  # (方向, 入场价, 止盈价, 止损价, 挂单K线)
+    position = None  # (方向, 入场价, 止盈价, 止损价, 成交K线)
+    for i in range(window_size - 1, len(rows)):
+        high = float(rows[i][2])
+        low = float(rows[i][3])
+        if order is None and position is None:
+            window.move_to(i)
+            signal = signal_fn(window)
+            if signal is not None:
+                order = signal + (i,)
+        if order is not None:
+            side, entry, tp_price, sl_price, placed = order
+            if (side == "LONG" and low <= entry) or (side == "SHORT" and high >= entry):
+                position = (side, entry, tp_price, sl_price, i)
+                order = None
+                filled += 1
+            elif i - placed + 1 >= expire_bars:
+                order = None
+                expired += 1
+        if position is None:
+            continue
+        side, entry, tp_price, sl_price, opened = position
+        if side == "LONG":
+            hit_sl = low <= sl_price
+            hit_tp = high >= tp_price and i > opened
+        else:
+            hit_sl = high >= sl_price
+            hit_tp = low <= tp_price and i > opened
+        if not (hit_sl or hit_tp):
+            continue
+        exit_price = sl_price if hit_sl else tp_price
+        change = (exit_price - entry) / entry if side == "LONG" else (entry - exit_price) / entry
+        pnl = margin * leverage * change
+        balance += pnl
+        total += 1
+        if pnl > 0:
+            win += 1
+        trades.append((opened, i, side, entry, exit_price, pnl))
+        position = None
+    return {"balance": balance, "win": win, "total": total, "filled": filled, "expired": expired, "trades": trades}
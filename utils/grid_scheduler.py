@@ -0,0 +1,148 @@
+"""
+参数网格的分块调度
+- 参数组合按 chunksize 打包成块提交给进程池，在途块数有上限，父进程内存不随网格规模增长
+- 结果只保留有界小顶堆中的前N名
+- 运行中输出吞吐（回测次数/秒）与预计剩余时间
+- 已完成的块追加写入检查点文件，中断后重启只派发缺失的部分
+"""
+import heapq
+import itertools
+import json
+import os
+import time
+import concurrent.futures
+
+
+def chunked(iterable, size):
+    """把任意可迭代对象切成长度为 size 的元组块（最后一块可能不足）"""
+    it = iter(iterable)
+    while True:
+        chunk = tuple(itertools.islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class TopN:
+    """按 key 保留最大的 N 个结果；同分时先提交者优先，结果与完成顺序无关"""
+
+    def __init__(self, n, key=lambda r: r['profit']):
+        self.n = n
+        self.key = key
+        self._heap = []
+
+    def push(self, seq, result):
+        item = (self.key(result), -seq, result)
+        if len(self._heap) < self.n:
+            heapq.heappush(self._heap, item)
+        elif item[:2] > self._heap[0][:2]:
+            heapq.heapreplace(self._heap, item)
+
+    def results(self):
+        return [r for _, _, r in sorted(self._heap, key=lambda x: x[:2], reverse=True)]
+
+
+class ProgressMeter:
+    """按回测次数统计吞吐与ETA，至多每 interval 秒打印一次"""
+
+    def __init__(self, total_backtests, label="", interval=10.0):
+        self.total = total_backtests
+        self.label = label
+        self.interval = interval
+        self.done = 0
+        self.start = time.time()
+        self._last_print = self.start
+
+    def update(self, backtests, force=False):
+        self.done += backtests
+        now = time.time()
+        if not force and now - self._last_print < self.interval:
+            return
+        self._last_print = now
+        elapsed = max(now - self.start, 1e-9)
+        rate = self.done / elapsed
+        eta = (self.total - self.done) / rate if rate > 0 else float("inf")
+        pct = self.done / self.total * 100 if self.total else 100.0
+        print(f"{self.label}进度 {self.done}/{self.total} ({pct:.1f}%) | {rate:,.0f} 次回测/秒 | 预计剩余 {eta:,.0f}秒")
+
+
+def run_chunked(executor, fn, items, chunksize, on_result, max_inflight=None, on_chunk=None):
+    """
+    把 items 按 chunksize 分块后提交 fn(chunk)，fn 返回与块内参数一一对应的结果列表。
+    每个结果回调 on_result(seq, item, result)，seq 为参数在 items 中的序号；
+    整块完成后回调 on_chunk([(seq, item, result), ...])（用于写检查点）。
+    在途块数不超过 max_inflight（默认CPU核数的2倍），保证父进程内存平稳。
+    """
+    if max_inflight is None:
+        max_inflight = 2 * (os.cpu_count() or 1)
+    chunks = enumerate(chunked(items, chunksize))
+    pending = {}
+
+    def submit_next():
+        for idx, chunk in chunks:
+            pending[executor.submit(fn, chunk)] = (idx * chunksize, chunk)
+            return True
+        return False
+
+    while len(pending) < max_inflight and submit_next():
+        pass
+    while pending:
+        done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+        for future in done:
+            base, chunk = pending.pop(future)
+            records = [(base + offset, item, result) for offset, (item, result) in enumerate(zip(chunk, future.result()))]
+            for record in records:
+                on_result(*record)
+            if on_chunk is not None:
+                on_chunk(records)
+            submit_next()
+
+
+def _loads(line):
+    try:
+        return json.loads(line)
+    except ValueError:
+        return None
+
+
+class ChunkCheckpoint:
+    """
+    已完成块的追加写检查点（JSON Lines）：首行为运行标识，之后每行是一个完成块的
+    [[seq, item, result], ...]。运行标识不同时重新开始；进程崩溃时最后一行可能写了一半，读取时丢弃。
+    """
+
+    def __init__(self, path, run_key):
+        self.path = path
+        self.completed = {}
+        resume = False
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                content = f.read()
+            lines = content.split("\n")
+            if _loads(lines[0]) == {"run": run_key}:
+                resume = True
+                for line in lines[1:]:
+                    records = _loads(line)
+                    if not isinstance(records, list):
+                        continue
+                    for seq, item, result in records:
+                        self.completed[seq] = (item, result)
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        if resume:
+            self._file = open(path, "a", encoding="utf-8")
+            if not content.endswith("\n"):
+                self._file.write("\n")  # 与写了一半的行隔开
+        else:
+            self._file = open(path, "w", encoding="utf-8")
+            self._file.write(json.dumps({"run": run_key}) + "\n")
+        self._file.flush()
+
+    def record(self, records):
+        self._file.write(json.dumps([list(r) for r in records], separators=(",", ":")) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
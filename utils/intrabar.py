@@ -0,0 +1,128 @@
+"""
+同一根K线同时触及止盈止损时，用更小周期K线判断先后
+本地文件名带有时间范围（<symbol>_<bar>_<ts1>_<ts2>.csv），据此建立文件级时间索引；合并存储的文件
+取 manifest / .klb 映射中的首末时间戳（见 kline_datasets.stored_range），建索引时不加载任何K线。
+只有出现歧义的K线才按时间找到覆盖它的文件：.klb 在内存映射上二分切出该K线的小周期行，CSV 分片加载一次后缓存；
+同一根K线的查询结果按时间区间缓存，代价与歧义K线数量成正比，与小周期历史总量无关。
+"""
+import bisect
+import hashlib
+import os
+
+from utils.kline_datasets import BAR_MS, BINARY_SUFFIX, FILE_PATTERN, BinaryKlines, load_dataset, stored_range
+
+
+class LowerTimeframeIndex:
+    """同一 (instId, bar) 的多个文件按时间范围索引，按需加载并缓存"""
+
+    def __init__(self, files):
+        ranges = []
+        self._loaded = {}
+        self._mapped = {}
+        self._lookups = {}
+        self.files_loaded = 0
+        for path in files:
+            match = FILE_PATTERN.match(os.path.basename(path))
+            if match:
+                ts1, ts2 = int(match.group("ts1")), int(match.group("ts2"))
+                ranges.append((min(ts1, ts2), max(ts1, ts2), path))
+                continue
+            span = stored_range(path)
+            if span is not None:
+                ranges.append((span[0], span[1], path))
+        self.ranges = sorted(ranges)
+
+    def _slice(self, path, start_ms, end_ms):
+        # .klb：映射上二分切片，只转换区间内的几行
+        if path.endswith(BINARY_SUFFIX) and BinaryKlines is not None:
+            series = self._mapped.get(path)
+            if series is None:
+                series = self._mapped[path] = BinaryKlines(path)
+            return series.rows(start_ms, end_ms)
+        ts_list, rows = self._rows(path)
+        return rows[bisect.bisect_left(ts_list, start_ms):bisect.bisect_left(ts_list, end_ms)]
+
+    def _rows(self, path):
+        cached = self._loaded.get(path)
+        if cached is None:
+            rows = load_dataset([path])
+            cached = ([row[0] for row in rows], rows)
+            self._loaded[path] = cached
+            self.files_loaded += 1
+        return cached
+
+    def bars_between(self, start_ms, end_ms):
+        """[start_ms, end_ms) 内的小周期K线，升序 [timestamp, open, high, low, close]（按区间缓存）"""
+        key = (start_ms, end_ms)
+        cached = self._lookups.get(key)
+        if cached is not None:
+            return cached
+        found = {}
+        for lo, hi, path in self.ranges:
+            if hi < start_ms or lo >= end_ms:
+                continue
+            for row in self._slice(path, start_ms, end_ms):
+                found[row[0]] = row
+        cached = self._lookups[key] = [found[ts] for ts in sorted(found)]
+        return cached
+
+
+def first_hit(rows, is_long, tp_price, sl_price):
+    """按小周期K线顺序判断先触及哪一边；同一根小K线内仍无法区分时按止损计，无数据返回 None"""
+    for _, _, high, low, _ in rows:
+        if is_long:
+            hit_tp, hit_sl = high >= tp_price, low <= sl_price
+        else:
+            hit_tp, hit_sl = low <= tp_price, high >= sl_price
+        if hit_sl:
+            return "sl"
+        if hit_tp:
+            return "tp"
+    return None
+
+
+class IntrabarResolver:
+    """
+    供回测内核调用：resolver(ts, is_long, tp_price, sl_price) 返回 True 表示止盈先于止损触达。
+    ts 为歧义K线的开盘时间（秒或毫秒均可，parse_kline 输出为秒），bar_ms 为该K线周期长度（毫秒）。
+    """
+
+    def __init__(self, index, bar_ms):
+        self.index = index
+        self.bar_ms = bar_ms
+        self.ambiguous = 0
+        self.tp_first = 0
+        self.unresolved = 0
+
+    def __call__(self, ts, is_long, tp_price, sl_price):
+        self.ambiguous += 1
+        # 秒级时间戳（< 1e11）换算为毫秒，与本地文件一致
+        start = ts * 1000 if ts < 10 ** 11 else ts
+        hit = first_hit(self.index.bars_between(start, start + self.bar_ms), is_long, tp_price, sl_price)
+        if hit is None:
+            self.unresolved += 1
+        elif hit == "tp":
+            self.tp_first += 1
+        return hit == "tp"
+
+
+def files_fingerprint(files):
+    """小周期文件的指纹（文件名、大小、修改时间；.klb 目录逐列计入），数据增删改后随之变化，不读取内容"""
+    digest = hashlib.sha1()
+    for path in sorted(files):
+        entries = [os.path.join(path, name) for name in sorted(os.listdir(path))] if os.path.isdir(path) else [path]
+        for entry in entries:
+            stat = os.stat(entry)
+            digest.update(f"{os.path.basename(path)}/{os.path.basename(entry)}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+    return digest.hexdigest()[:16]
+
+
+def make_resolver(files, bar):
+    """
+    由小周期数据文件列表与上层K线周期（如 "15m"）构建判定器。
+    spec 可传给进程池 worker 重建同一判定器，fingerprint 用于缓存与检查点的键。
+    """
+    resolver = IntrabarResolver(LowerTimeframeIndex(files), BAR_MS[bar])
+    resolver.spec = (list(files), bar)
+    resolver.fingerprint = files_fingerprint(files)
+    return resolver
@@ -0,0 +1,123 @@
+"""
+K线定长二进制列式格式（numpy.memmap 直接映射，不解析文本）
+一个序列一个目录 <name>.klb/，每列一个原始小端文件：ts.i8（int64 毫秒）、open/high/low/close/volume.f8（float64），
+行数 = ts 文件大小 / 8。打开时各列以只读 memmap 映射，不把文件读入内存；ts 升序，[start, end) 区间用二分查找定位，
+切片是映射上的视图，可直接构建 KlineArrays。
+追加只在各列文件尾写入（先写价格列、最后写 ts，ts 决定可见行数，中途中断不会出现半行）；其余改动整目录重写后替换。
+kline_datasets.KlineStore 为每个序列维护一份 .klb 镜像，load_dataset / discover_datasets 优先使用它。
+"""
+import os
+import shutil
+
+import numpy as np
+
+from utils.backtest_kernel import KlineArrays
+
+BINARY_SUFFIX = ".klb"
+COLUMNS = ("ts", "open", "high", "low", "close", "volume")
+COLUMN_DTYPES = (np.dtype("<i8"), np.dtype("<f8"), np.dtype("<f8"), np.dtype("<f8"), np.dtype("<f8"), np.dtype("<f8"))
+COLUMN_FILES = ("ts.i8", "open.f8", "high.f8", "low.f8", "close.f8", "volume.f8")
+
+
+def to_columns(klines):
+    """[timestamp, open, high, low, close(, volume)] 行（数值或字符串）转为按列数组，缺少成交量记为 nan"""
+    columns = [np.array([int(k[0]) for k in klines], dtype=COLUMN_DTYPES[0])]
+    for idx in range(1, 5):
+        columns.append(np.array([float(k[idx]) for k in klines], dtype=COLUMN_DTYPES[idx]))
+    columns.append(np.array([float(k[5]) if len(k) > 5 and k[5] != "" else np.nan for k in klines],
+                            dtype=COLUMN_DTYPES[5]))
+    return columns
+
+
+def _write_columns(directory, columns, mode):
+    # ts 最后写入：追加中断时 ts 文件决定的行数仍只包含完整写完的行
+    for idx in (1, 2, 3, 4, 5, 0):
+        with open(os.path.join(directory, COLUMN_FILES[idx]), mode) as f:
+            f.write(np.ascontiguousarray(columns[idx], dtype=COLUMN_DTYPES[idx]).tobytes())
+
+
+def write_binary(path, klines=None, columns=None):
+    """写入（覆盖）一个序列；klines 需按时间戳升序且不重复，也可直接传 to_columns 格式的 columns"""
+    columns = to_columns(klines) if columns is None else columns
+    if len(columns[0]) > 1 and not np.all(np.diff(columns[0]) > 0):
+        raise ValueError("时间戳必须严格升序")
+    tmp_path = path + ".tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    _write_columns(tmp_path, columns, "wb")
+    old_path = path + ".old"
+    if os.path.exists(path):
+        shutil.rmtree(old_path, ignore_errors=True)
+        os.replace(path, old_path)
+    os.replace(tmp_path, path)
+    shutil.rmtree(old_path, ignore_errors=True)
+    return path
+
+
+def append_binary(path, klines):
+    """在文件尾追加晚于末条的K线，代价只与新增行数有关；返回追加行数"""
+    if not os.path.isdir(path):
+        write_binary(path, klines)
+        return len(klines)
+    columns = to_columns(klines)
+    if not len(columns[0]):
+        return 0
+    existing = BinaryKlines(path)
+    n = len(existing)
+    if (n and columns[0][0] <= existing.ts[-1]) or (len(columns[0]) > 1 and not np.all(np.diff(columns[0]) > 0)):
+        raise ValueError("追加的时间戳必须严格升序且晚于已有末条")
+    del existing
+    # 上次追加中断留下的多余尾部（价格列已写、ts 未写）先截掉
+    for idx in range(1, len(COLUMNS)):
+        column_path = os.path.join(path, COLUMN_FILES[idx])
+        if os.path.getsize(column_path) > 8 * n:
+            os.truncate(column_path, 8 * n)
+    _write_columns(path, columns, "ab")
+    return len(columns[0])
+
+
+class BinaryKlines:
+    """只读映射的二进制K线序列；ts/open/high/low/close/volume 为 memmap（空序列为长度0数组）"""
+
+    def __init__(self, path):
+        self.path = path
+        n = os.path.getsize(os.path.join(path, COLUMN_FILES[0])) // 8
+        self.length = n
+        for name, dtype, file_name in zip(COLUMNS, COLUMN_DTYPES, COLUMN_FILES):
+            if n:
+                column = np.memmap(os.path.join(path, file_name), dtype=dtype, mode="r", shape=(n,))
+            else:
+                column = np.zeros(0, dtype=dtype)
+            setattr(self, name, column)
+
+    def __len__(self):
+        return self.length
+
+    def index_range(self, start_ms=None, end_ms=None):
+        """[start_ms, end_ms) 对应的行号区间 (lo, hi)，二分查找"""
+        lo = 0 if start_ms is None else int(np.searchsorted(self.ts, start_ms, side="left"))
+        hi = self.length if end_ms is None else int(np.searchsorted(self.ts, end_ms, side="left"))
+        return lo, max(lo, hi)
+
+    def columns(self, start_ms=None, end_ms=None):
+        """区间内各列的视图（不复制）"""
+        lo, hi = self.index_range(start_ms, end_ms)
+        return [getattr(self, name)[lo:hi] for name in COLUMNS]
+
+    def arrays(self, start_ms=None, end_ms=None, seconds=False):
+        """
+        区间内的 KlineArrays，价格列直接引用映射；seconds=True 时时间戳换算为秒（与 parse_kline 一致），
+        此时只有 ts 列会生成新数组。
+        """
+        ts, open_, high, low, close, _ = self.columns(start_ms, end_ms)
+        if seconds:
+            ts = ts // 1000
+        return KlineArrays.from_columns(ts, open_, high, low, close)
+
+    def rows(self, start_ms=None, end_ms=None):
+        """区间内的 [timestamp, open, high, low, close] 列表（与 load_dataset 输出一致）"""
+        ts, open_, high, low, close, _ = self.columns(start_ms, end_ms)
+        prices = np.column_stack((open_, high, low, close)).tolist()
+        for t, row in zip(ts.tolist(), prices):
+            row.insert(0, t)
+        return prices
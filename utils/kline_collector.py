@@ -0,0 +1,341 @@
+"""
+异步历史K线采集（asyncio + requests，不引入新依赖）
+所有标的/周期共用一个全局令牌桶：OKX history-candles 限速为每2秒20次（按IP），令牌桶按该速率发放请求许可，
+任意多个序列同时翻页时总请求速率始终贴着限额，而不是每个线程各自 sleep 固定时长。
+遇到限速错误码（50008/50111/50112/50011）时全体暂停并把速率减半，之后每次成功逐步恢复（乘性减、加性增）。
+HTTP 请求在线程中执行（asyncio.to_thread），文件命名与 swap_kline_data 目录布局同「采集 K线数据.py」。
+增量同步（--sync）只补本地最新K线之后缺失的尾部：最新时间戳直接取自文件名，以 before=最新时间戳 固定下界、
+after 逐页向前，补齐的尾部写成一个新文件（原子替换写入）；只保存已收盘的K线（confirm=1），未收盘的留给下次同步。
+单个深度序列（如90天1m）按周期长度把时间范围切成互不重叠的分片，每个分片的 after 游标由周期直接算出，
+各分片同时翻页，单序列回补也能用满并发；分片之间没有重叠，加载时按时间戳合并去重。
+--store 时写入 kline_datasets.KlineStore 合并存储（每个 (instId, bar) 一个去重文件），不再产生分片文件。
+用法: python -m utils.kline_collector --inst BTC-USDT-SWAP ETH-USDT-SWAP --bar 5m 15m --days 30 [--sync]
+"""
+import argparse
+import asyncio
+import csv
+import logging
+import os
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from utils.kline_datasets import BAR_MS, FILE_PATTERN, STORE_DIR, KlineStore
+
+API_URL = "https://www.okx.com/api/v5/market/history-candles"
+API_KEY = os.getenv("OKX_API_KEY")
+RATE_LIMIT = 20  # 每个限速窗口的请求数
+RATE_WINDOW = 2.0  # 限速窗口（秒）
+PAGE_LIMIT = 100  # 每页最多K线数
+MAX_IN_FLIGHT = 16  # 同时进行中的HTTP请求数（线程数）
+SAVE_EVERY_PAGES = 10  # 每翻这么多页落盘一次
+SHARD_PAGES = 10  # 单个序列按时间切片并行翻页时，每个分片的页数
+RETRY_LIMIT = 5  # 非限速错误的重试次数
+API_WAIT_CODES = ("50008", "50111", "50112", "50011")  # OKX限速错误码（50011 为通用的请求频率超限）
+NOT_FOUND_CODES = ("51001", "51005")  # 标的不存在或不可用
+BACKOFF_BASE = 1.0  # 限速后首次暂停秒数，连续限速时翻倍
+BACKOFF_MAX = 30.0
+DATA_DIR = "swap_kline_data"
+DAYS_TO_FETCH = 30
+CSV_HEADER = ["timestamp", "open", "high", "low", "close", "volume", "volCcy", "volCcyQuote", "confirm"]
+
+logger = logging.getLogger(__name__)
+
+
+# ========== 全局令牌桶 ==========
+class TokenBucket:
+    """
+    每秒补充 rate 个令牌、最多积攒 capacity 个；所有协程共用。
+    penalize() 在收到限速错误时调用：暂停全部请求并把速率减半；reward() 在成功时调用：速率逐步恢复到上限。
+    """
+
+    def __init__(self, rate=RATE_LIMIT / RATE_WINDOW, capacity=RATE_LIMIT, clock=time.monotonic):
+        self.max_rate = rate
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.clock = clock
+        self.updated = clock()
+        self.paused_until = 0.0
+        self.strikes = 0
+        self.acquired = 0
+        self.penalties = 0
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        # 单线程事件循环内检查与扣减之间没有 await，不需要锁
+        while True:
+            now = self.clock()
+            if now < self.paused_until:
+                await asyncio.sleep(self.paused_until - now)
+                continue
+            self._refill(now)
+            if self.tokens >= 1:
+                self.tokens -= 1
+                self.acquired += 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def penalize(self):
+        """返回本次暂停的秒数；暂停期间其他在途请求报告的限速不再重复降速"""
+        now = self.clock()
+        if now < self.paused_until:
+            return self.paused_until - now
+        self._refill(now)
+        self.strikes += 1
+        self.penalties += 1
+        self.rate = max(self.max_rate / 16, self.rate / 2)
+        self.tokens = 0.0
+        delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (self.strikes - 1))
+        self.paused_until = max(self.paused_until, now + delay)
+        return delay
+
+    def reward(self):
+        self.strikes = 0
+        if self.rate < self.max_rate:
+            self._refill(self.clock())
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+
+# ========== 请求与翻页 ==========
+def http_get(session, params):
+    """同步GET，返回OKX响应JSON；非200状态转换成带 code 的字典"""
+    headers = {"Content-Type": "application/json"}
+    if API_KEY:
+        headers["OK-ACCESS-KEY"] = API_KEY
+    resp = session.get(API_URL, params=params, headers=headers, timeout=30)
+    if resp.status_code != 200:
+        return {"code": f"HTTP{resp.status_code}", "msg": resp.text[:100]}
+    return resp.json()
+
+
+def create_session(pool_size=MAX_IN_FLIGHT):
+    session = requests.Session()
+    session.mount("https://", HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size))
+    return session
+
+
+def time_shards(start_ms, end_ms, bar_ms, pages=SHARD_PAGES):
+    """把 [start_ms, end_ms) 从新到旧切成每片 pages 页K线的区间 [(lo, hi), ...]；bar_ms 未知时不切分"""
+    if not bar_ms or pages <= 0:
+        return [(start_ms, end_ms)]
+    span = pages * PAGE_LIMIT * bar_ms
+    shards = []
+    hi = end_ms
+    while hi > start_ms:
+        lo = max(start_ms, hi - span)
+        shards.append((lo, hi))
+        hi = lo
+    return shards
+
+
+def confirmed(candle):
+    # 第9列 confirm: 0=K线未收盘
+    return len(candle) < 9 or str(candle[8]) != "0"
+
+
+def newest_stored_ts(inst_id, bar, data_dir=DATA_DIR):
+    """本地 <data_dir>/<instId>/ 下该周期文件名中的最大时间戳，无文件返回 None（不读取文件内容）"""
+    directory = os.path.join(data_dir, inst_id)
+    newest = None
+    if os.path.isdir(directory):
+        for name in os.listdir(directory):
+            match = FILE_PATTERN.match(name)
+            if match and match.group("bar") == bar:
+                ts = max(int(match.group("ts1")), int(match.group("ts2")))
+                newest = ts if newest is None else max(newest, ts)
+    return newest
+
+
+def save_candles(candles, inst_id, bar, data_dir=DATA_DIR):
+    """candles 为OKX原始顺序（新→旧），写入 <data_dir>/<instId>/<symbol>_<bar>_<首条ts>_<末条ts>.csv"""
+    if not candles:
+        return None
+    directory = os.path.join(data_dir, inst_id)
+    os.makedirs(directory, exist_ok=True)
+    symbol = inst_id.split("-")[0]
+    path = os.path.join(directory, f"{symbol}_{bar}_{candles[0][0]}_{candles[-1][0]}.csv")
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(CSV_HEADER)
+        writer.writerows(candles)
+    os.replace(tmp_path, path)
+    return path
+
+
+class KlineCollector:
+    """
+    共享令牌桶、并发上限与HTTP会话的采集器；get 可替换为其他请求函数（签名同 http_get）。
+    传入 store（KlineStore）时K线写入合并存储：回补的序列在全部分片完成后一次合并写入，增量尾部直接追加；
+    否则按批写分片文件到 data_dir。
+    """
+
+    def __init__(self, bucket=None, max_in_flight=MAX_IN_FLIGHT, data_dir=DATA_DIR, get=http_get, session=None,
+                 store=None):
+        self.bucket = bucket or TokenBucket()
+        self.max_in_flight = max_in_flight
+        self.data_dir = data_dir
+        self.get = get
+        self.session = session
+        self.store = store
+        self.requests = 0
+        self._in_flight = None
+        self._buffered = {}
+
+    def _save(self, candles, inst_id, bar):
+        if self.store is None:
+            save_candles(candles, inst_id, bar, self.data_dir)
+        else:
+            self._buffered.setdefault((inst_id, bar), []).extend(candles)
+
+    async def fetch_page(self, inst_id, bar, before=None, after=None):
+        """一页K线（新→旧）；标的不存在返回 None，重试耗尽返回 []"""
+        if self._in_flight is None:
+            self._in_flight = asyncio.Semaphore(self.max_in_flight)
+        params = {"instId": inst_id, "bar": bar, "limit": str(PAGE_LIMIT)}
+        if before:
+            params["before"] = str(before)
+        if after:
+            params["after"] = str(after)
+        failures = 0
+        while failures < RETRY_LIMIT:
+            await self.bucket.acquire()
+            async with self._in_flight:
+                self.requests += 1
+                try:
+                    data = await asyncio.to_thread(self.get, self.session, params)
+                except requests.exceptions.RequestException as e:
+                    logger.warning(f"请求异常 [{inst_id}-{bar}]: {e}")
+                    failures += 1
+                    continue
+            code = data.get("code")
+            if code == "0":
+                self.bucket.reward()
+                return data.get("data") or []
+            if code in API_WAIT_CODES:
+                delay = self.bucket.penalize()
+                logger.warning(f"触发API限速 [{inst_id}-{bar}] {code}，全局暂停{delay:.1f}秒，速率降至{self.bucket.rate:.2f}/秒")
+                continue
+            if code in NOT_FOUND_CODES:
+                logger.warning(f"标的不存在或不可用: {inst_id}")
+                return None
+            logger.error(f"API错误 [{inst_id}-{bar}]: {code} - {data.get('msg')}")
+            failures += 1
+        return []
+
+    async def fetch_series(self, inst_id, bar, start_ms, end_ms=None):
+        """
+        [start_ms, end_ms) 按 SHARD_PAGES 页切成互不重叠的时间分片，各分片从自己的右端点独立向前翻页并同时进行，
+        总速率仍由共享令牌桶控制；返回保存的K线数。周期未知时整段作为一个分片串行翻页。
+        """
+        end_ms = end_ms or int(time.time() * 1000)
+        shards = time_shards(start_ms, end_ms, BAR_MS.get(bar), SHARD_PAGES)
+        results = await asyncio.gather(*(self._fetch_shard(inst_id, bar, lo, hi) for lo, hi in shards))
+        total = sum(count for count, _ in results)
+        if self.store is not None:
+            total = self.store.write(inst_id, bar, self._buffered.pop((inst_id, bar), []))
+        pages = sum(n for _, n in results)
+        logger.info(f"完成 {inst_id}-{bar}: {total} 条K线，{pages} 页，{len(shards)} 个分片")
+        return total
+
+    async def _fetch_shard(self, inst_id, bar, start_ms, end_ms):
+        # 从 after=end_ms 向前翻页到 start_ms，只保留 [start_ms, end_ms) 内的K线，每 SAVE_EVERY_PAGES 页落盘一次
+        after = end_ms
+        pending = []
+        total = 0
+        pages = 0
+        while True:
+            candles = await self.fetch_page(inst_id, bar, after=after)
+            if not candles:
+                break
+            pages += 1
+            reached = int(candles[-1][0]) <= start_ms
+            pending.extend(c for c in candles if int(c[0]) >= start_ms and confirmed(c))
+            if reached or pages % SAVE_EVERY_PAGES == 0:
+                self._save(pending, inst_id, bar)
+                total += len(pending)
+                pending = []
+            if reached:
+                break
+            after = candles[-1][0]
+        if pending:
+            self._save(pending, inst_id, bar)
+            total += len(pending)
+        return total, pages
+
+    async def fetch_tail(self, inst_id, bar, since_ts):
+        """since_ts 之后（不含）的已收盘K线（新→旧）：before 固定为 since_ts，after 从最新逐页向前，不足一页即结束"""
+        rows = []
+        after = None
+        while True:
+            page = await self.fetch_page(inst_id, bar, before=since_ts, after=after)
+            if not page:
+                break
+            rows.extend(page)
+            if len(page) < PAGE_LIMIT:
+                break
+            after = page[-1][0]
+        return [c for c in rows if confirmed(c)]
+
+    async def sync_series(self, inst_id, bar, days=DAYS_TO_FETCH, end_ms=None):
+        """本地已有数据时只补尾部，否则按 days 完整回溯；返回新保存的K线数"""
+        if self.store is not None:
+            newest = self.store.newest_ts(inst_id, bar)
+        else:
+            newest = newest_stored_ts(inst_id, bar, self.data_dir)
+        if newest is None:
+            end_ms = end_ms or int(time.time() * 1000)
+            return await self.fetch_series(inst_id, bar, end_ms - days * 86400 * 1000, end_ms)
+        tail = await self.fetch_tail(inst_id, bar, newest)
+        if self.store is not None:
+            self.store.write(inst_id, bar, tail)
+        else:
+            save_candles(tail, inst_id, bar, self.data_dir)
+        logger.info(f"同步 {inst_id}-{bar}: 本地最新 {newest}，新增 {len(tail)} 条K线")
+        return len(tail)
+
+    async def collect(self, instruments, timeframes, days=DAYS_TO_FETCH, end_ms=None, sync=False):
+        """全部 (标的, 周期) 同时翻页，返回 {(instId, bar): K线数}；sync=True 时已有数据的序列只补尾部"""
+        end_ms = end_ms or int(time.time() * 1000)
+        start_ms = end_ms - days * 86400 * 1000
+        tasks = [(inst_id, bar) for inst_id in instruments for bar in timeframes]
+        if sync:
+            jobs = (self.sync_series(inst_id, bar, days, end_ms) for inst_id, bar in tasks)
+        else:
+            jobs = (self.fetch_series(inst_id, bar, start_ms, end_ms) for inst_id, bar in tasks)
+        counts = await asyncio.gather(*jobs)
+        return dict(zip(tasks, counts))
+
+
+def collect_klines(instruments, timeframes, days=DAYS_TO_FETCH, data_dir=DATA_DIR, sync=False, store_dir=None):
+    """同步入口：创建会话与采集器并运行到结束；store_dir 非空时写入该目录的合并存储"""
+    session = create_session()
+    try:
+        store = KlineStore(store_dir) if store_dir else None
+        collector = KlineCollector(data_dir=data_dir, session=session, store=store)
+        started = time.monotonic()
+        counts = asyncio.run(collector.collect(instruments, timeframes, days, sync=sync))
+        elapsed = time.monotonic() - started
+        logger.info(f"采集完成: {len(counts)} 个序列，{sum(counts.values())} 条K线，{collector.requests} 次请求，"
+                    f"耗时{elapsed:.1f}秒，限速 {collector.bucket.penalties} 次")
+        return counts
+    finally:
+        session.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='[%(asctime)s] [%(levelname)s] %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+    parser = argparse.ArgumentParser(description='异步历史K线采集（全局令牌桶限速）')
+    parser.add_argument('--inst', nargs='+', required=True, help='标的，如 BTC-USDT-SWAP')
+    parser.add_argument('--bar', nargs='+', default=["5m", "15m"], help='周期')
+    parser.add_argument('--days', type=int, default=DAYS_TO_FETCH, help='回溯天数')
+    parser.add_argument('--data-dir', default=DATA_DIR, help='数据目录')
+    parser.add_argument('--sync', action='store_true', help='增量同步：已有数据的序列只补最新尾部')
+    parser.add_argument('--store', nargs='?', const=STORE_DIR, default=None, help='写入合并存储（默认目录 kline_store）')
+    args = parser.parse_args()
+    collect_klines(args.inst, args.bar, args.days, args.data_dir, sync=args.sync, store_dir=args.store)
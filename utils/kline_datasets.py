@@ -0,0 +1,272 @@
+"""
+本地K线数据集发现与加载
+- swap_kline_data/<instId>/<symbol>_<bar>_<ts1>_<ts2>.csv（采集脚本按批保存，OKX返回顺序为新→旧，同一标的周期有多个文件）
+- trump_kline_data/<instId>_<bar>_<ts1>_<ts2>.csv（optimize_trump_strategy 保存，旧→新）
+同一 (instId, bar) 的全部文件合并、按时间戳去重并升序排列。
+合并存储 kline_store/<instId>/<instId>_<bar>.csv：每个 (instId, bar) 一个升序去重的文件，新数据追加到文件尾，
+manifest.json 记录各序列的行数、首末时间戳、覆盖区间与已导入的分片文件；discover_datasets 优先返回合并文件并跳过已导入的分片，
+合并完成后加载一个序列只需读一个文件。安装了 numpy 时合并存储同时维护 <instId>_<bar>.klb 二进制镜像（见 kline_binary），
+discover_datasets 返回该镜像，加载时直接内存映射而不解析CSV。
+"""
+import csv
+import glob
+import json
+import os
+import re
+
+try:
+    from utils.kline_binary import BINARY_SUFFIX, BinaryKlines, append_binary, to_columns, write_binary
+except ImportError:  # 未安装numpy时只用CSV
+    BINARY_SUFFIX, BinaryKlines = ".klb", None
+
+DATA_ROOTS = ("swap_kline_data", "trump_kline_data")
+STORE_DIR = "kline_store"
+FILE_PATTERN = re.compile(r"^(?P<symbol>.+)_(?P<bar>\d+[a-zA-Z]+)_(?P<ts1>\d+)_(?P<ts2>\d+)\.csv$")
+STORE_HEADER = ["timestamp", "open", "high", "low", "close", "volume"]
+MANIFEST_NAME = "manifest.json"
+BAR_MS = {"1m": 60000, "3m": 180000, "5m": 300000, "15m": 900000, "30m": 1800000, "1H": 3600000, "4H": 14400000}
+
+
+def discover_datasets(roots=DATA_ROOTS, store_dir=STORE_DIR):
+    """返回 {(instId, bar): [文件路径, ...]}，按 instId、bar 排序；合并存储中的序列排在首位，已导入的分片不再列出"""
+    datasets = {}
+    imported = set()
+    store = KlineStore(store_dir) if store_dir and os.path.isfile(os.path.join(store_dir, MANIFEST_NAME)) else None
+    if store:
+        for key, entry in store.series.items():
+            inst_id, bar = key.split("/")
+            datasets[(inst_id, bar)] = [store.data_file(inst_id, bar)]
+            imported.update(os.path.normpath(src) for src in entry.get("sources", ()))
+    for root in roots:
+        for path in glob.glob(os.path.join(root, "**", "*.csv"), recursive=True):
+            match = FILE_PATTERN.match(os.path.basename(path))
+            if not match or os.path.normpath(path) in imported:
+                continue
+            parent = os.path.dirname(path)
+            # 标的子目录名就是 instId；平铺目录下取文件名前缀
+            inst_id = os.path.basename(parent) if os.path.normpath(parent) != os.path.normpath(root) else match.group("symbol")
+            datasets.setdefault((inst_id, match.group("bar")), []).append(path)
+    return {key: files[:1] + sorted(files[1:]) if store and store.has(*key) else sorted(files)
+            for key, files in sorted(datasets.items())}
+
+
+def load_dataset(files):
+    """读取并合并多个CSV，返回升序去重的 [timestamp, open, high, low, close] 列表"""
+    rows = {}
+    for path in files:
+        if path.endswith(BINARY_SUFFIX):
+            for row in BinaryKlines(path).rows():
+                rows[row[0]] = row
+            continue
+        with open(path, "r", encoding="utf-8") as f:
+            reader = csv.reader(f)
+            next(reader, None)  # 跳过表头
+            for row in reader:
+                if len(row) < 5:
+                    continue
+                rows[int(row[0])] = [int(row[0]), float(row[1]), float(row[2]), float(row[3]), float(row[4])]
+    return [rows[ts] for ts in sorted(rows)]
+
+
+def stored_range(path):
+    """
+    合并存储文件（CSV 或 .klb 镜像）覆盖的 (首条ts, 末条ts)，不加载数据：.klb 直接读映射的首末时间戳，
+    CSV 取所在存储 manifest 中的 first/last；无法确定返回 None。
+    """
+    if path.endswith(BINARY_SUFFIX) and BinaryKlines is not None:
+        series = BinaryKlines(path)
+        return (int(series.ts[0]), int(series.ts[-1])) if len(series) else None
+    inst_dir = os.path.dirname(os.path.abspath(path))
+    inst_id = os.path.basename(inst_dir)
+    prefix = f"{inst_id}_"
+    name = os.path.basename(path)
+    if not (name.startswith(prefix) and name.endswith(".csv")):
+        return None
+    entry = KlineStore(os.path.dirname(inst_dir)).entry(inst_id, name[len(prefix):-len(".csv")])
+    return (entry["first"], entry["last"]) if entry else None
+
+
+def dataset_length(files):
+    """数据集K线数；单个二进制镜像直接取行数，不加载"""
+    if len(files) == 1 and files[0].endswith(BINARY_SUFFIX) and BinaryKlines is not None:
+        return len(BinaryKlines(files[0]))
+    return len(load_dataset(files))
+
+
+def load_arrays(files, seconds=False):
+    """
+    数据集的 KlineArrays；单个二进制镜像时价格列直接引用内存映射（不解析、不复制），
+    否则读取文件后转换。seconds=True 时时间戳为秒（与 parse_kline 一致）。
+    """
+    if len(files) == 1 and files[0].endswith(BINARY_SUFFIX) and BinaryKlines is not None:
+        return BinaryKlines(files[0]).arrays(seconds=seconds)
+    from utils.backtest_kernel import KlineArrays
+    rows = load_dataset(files)
+    if seconds:
+        rows = [[k[0] // 1000] + k[1:] for k in rows]
+    return KlineArrays(rows)
+
+
+# ========== 合并存储 ==========
+def _store_row(candle):
+    # OKX原始行或 [ts, o, h, l, c(, vol...)] 统一为存储行（字符串，保留原始精度）
+    volume = candle[5] if len(candle) > 5 else ""
+    return [str(int(candle[0])), str(candle[1]), str(candle[2]), str(candle[3]), str(candle[4]), str(volume)]
+
+
+def covered_ranges(timestamps, bar_ms, ranges=None):
+    """升序时间戳按周期合并成连续覆盖区间 [[首, 末], ...]，可接在已有区间之后；周期未知时相邻即合并"""
+    ranges = [list(r) for r in ranges] if ranges else []
+    for ts in timestamps:
+        if ranges and (bar_ms is None or ts - ranges[-1][1] <= bar_ms):
+            ranges[-1][1] = max(ranges[-1][1], ts)
+        else:
+            ranges.append([ts, ts])
+    return ranges
+
+
+class KlineStore:
+    """
+    每个 (instId, bar) 一个升序去重的CSV。write 的新数据全部晚于已有末条时直接追加到文件尾（与已有数据量无关），
+    否则与已有数据合并去重后原子重写；每次写入后原子更新 manifest。
+    """
+
+    def __init__(self, root=STORE_DIR, binary=True):
+        self.root = root
+        self.binary = binary and BinaryKlines is not None
+        self.manifest_path = os.path.join(root, MANIFEST_NAME)
+        self.series = {}
+        if os.path.isfile(self.manifest_path):
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                self.series = json.load(f).get("series", {})
+
+    def path(self, inst_id, bar):
+        return os.path.join(self.root, inst_id, f"{inst_id}_{bar}.csv")
+
+    def binary_path(self, inst_id, bar):
+        return os.path.join(self.root, inst_id, f"{inst_id}_{bar}{BINARY_SUFFIX}")
+
+    def data_file(self, inst_id, bar):
+        """加载该序列应读取的文件：有二进制镜像时用镜像，否则用CSV"""
+        binary_path = self.binary_path(inst_id, bar)
+        return binary_path if BinaryKlines is not None and os.path.isdir(binary_path) else self.path(inst_id, bar)
+
+    def has(self, inst_id, bar):
+        return f"{inst_id}/{bar}" in self.series
+
+    def entry(self, inst_id, bar):
+        """manifest 中的序列信息 {rows, first, last, ranges, sources}，不存在返回 None"""
+        return self.series.get(f"{inst_id}/{bar}")
+
+    def newest_ts(self, inst_id, bar):
+        entry = self.entry(inst_id, bar)
+        return entry["last"] if entry else None
+
+    def _save_manifest(self):
+        os.makedirs(self.root, exist_ok=True)
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"series": self.series}, f, ensure_ascii=False, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.manifest_path)
+
+    def _read_rows(self, inst_id, bar):
+        with open(self.path(inst_id, bar), "r", encoding="utf-8") as f:
+            reader = csv.reader(f)
+            next(reader, None)
+            return [row for row in reader if len(row) >= 5]
+
+    def write(self, inst_id, bar, candles, sources=()):
+        """写入任意顺序、可重叠的K线，返回新增的K线数；sources 为导入的分片文件路径（记入 manifest）"""
+        new = {}
+        for candle in candles:
+            row = _store_row(candle)
+            new[int(row[0])] = row
+        key = f"{inst_id}/{bar}"
+        entry = self.series.get(key)
+        path = self.path(inst_id, bar)
+        bar_ms = BAR_MS.get(bar)
+        if not new:
+            return 0
+        if entry and min(new) > entry["last"]:
+            # 全部晚于末条：追加
+            with open(path, "a", newline="", encoding="utf-8") as f:
+                csv.writer(f).writerows(new[ts] for ts in sorted(new))
+            added = len(new)
+            if self.binary:
+                self._append_binary(inst_id, bar, [new[ts] for ts in sorted(new)], entry["rows"])
+            entry["rows"] += added
+            entry["last"] = max(new)
+            entry["ranges"] = covered_ranges(sorted(new), bar_ms, entry["ranges"])
+        else:
+            merged = {int(row[0]): row for row in self._read_rows(inst_id, bar)} if entry else {}
+            before = len(merged)
+            merged.update(new)
+            added = len(merged) - before
+            timestamps = sorted(merged)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "w", newline="", encoding="utf-8") as f:
+                writer = csv.writer(f)
+                writer.writerow(STORE_HEADER)
+                writer.writerows(merged[ts] for ts in timestamps)
+            os.replace(tmp_path, path)
+            if self.binary:
+                write_binary(self.binary_path(inst_id, bar), columns=to_columns([merged[ts] for ts in timestamps]))
+            entry = dict(entry or {"sources": []}, rows=len(timestamps), first=timestamps[0], last=timestamps[-1],
+                         ranges=covered_ranges(timestamps, bar_ms))
+        entry["sources"].extend(src for src in sources if src not in entry["sources"])
+        self.series[key] = entry
+        self._save_manifest()
+        return added
+
+    def _append_binary(self, inst_id, bar, rows, expected):
+        # 镜像行数与CSV一致时直接追加，缺失或不一致（如旧版本建的存储）时按CSV重建
+        binary_path = self.binary_path(inst_id, bar)
+        if os.path.isdir(binary_path) and len(BinaryKlines(binary_path)) == expected:
+            append_binary(binary_path, rows)
+        else:
+            write_binary(binary_path, self._read_rows(inst_id, bar))
+
+    def load(self, inst_id, bar, start_ms=None, end_ms=None):
+        """一次读取完整序列，返回升序 [timestamp, open, high, low, close]，可按 [start_ms, end_ms) 截取"""
+        if not self.has(inst_id, bar):
+            return []
+        binary_path = self.data_file(inst_id, bar)
+        if binary_path.endswith(BINARY_SUFFIX):
+            return BinaryKlines(binary_path).rows(start_ms, end_ms)
+        klines = [[int(row[0]), float(row[1]), float(row[2]), float(row[3]), float(row[4])]
+                  for row in self._read_rows(inst_id, bar)]
+        if start_ms is not None or end_ms is not None:
+            lo = float("-inf") if start_ms is None else start_ms
+            hi = float("inf") if end_ms is None else end_ms
+            klines = [k for k in klines if lo <= k[0] < hi]
+        return klines
+
+    def consolidate(self, roots=DATA_ROOTS):
+        """把各数据目录中尚未导入的分片文件并入存储，返回 {(instId, bar): 新增K线数}；分片文件保留不删"""
+        added = {}
+        for key, files in discover_datasets(roots, self.root).items():
+            fragments = [path for path in files if path not in (self.path(*key), self.binary_path(*key))]
+            rows = []
+            for path in fragments:
+                with open(path, "r", encoding="utf-8") as f:
+                    reader = csv.reader(f)
+                    next(reader, None)
+                    rows.extend(row for row in reader if len(row) >= 5)
+            if fragments:
+                # 同一序列的全部分片一次合并写入
+                added[key] = self.write(key[0], key[1], rows, sources=[os.path.normpath(path) for path in fragments])
+        return added
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="把分片K线文件合并到按 (instId, bar) 去重的存储")
+    parser.add_argument("--roots", nargs="+", default=list(DATA_ROOTS), help="分片文件所在目录")
+    parser.add_argument("--store-dir", default=STORE_DIR, help="合并存储目录")
+    args = parser.parse_args()
+    kline_store = KlineStore(args.store_dir)
+    for (inst_id, bar), count in kline_store.consolidate(args.roots).items():
+        entry = kline_store.entry(inst_id, bar)
+        print(f"{inst_id} {bar}: 新增 {count} 根，共 {entry['rows']} 根，覆盖区间 {len(entry['ranges'])} 段")
@@ -0,0 +1,144 @@
+"""
+限价单开仓的分段振幅回测
+实盘脚本在信号K收盘后挂限价单（TRUMP/ADA 挂收盘价；VINE 挂 (收盘+最高)/2 或 (收盘+最低)/2 并让出滑点），
+有效期内未成交则撤单；未成交前价格越过止盈价时按 should_cancel_order 撤单。
+ENTRY_MARKET 在挂单K线开盘即以信号K收盘价成交，作为同一引擎、同一平仓规则下的立即成交基准。
+全部开仓点的成交/撤单位置由 [挂单K线, 挂单K线+有效期) 窗口矩阵一次性算出，逐笔推进时只剩
+O(log n) 的止盈止损首次触达查询，代价与 backtest_segmented_kernel 同一量级。
+"""
+from bisect import bisect_right
+
+from utils.backtest_kernel import LEVERAGE, MARGIN, SIDE_LONG, np
+
+ENTRY_CLOSE = "close"  # 挂信号K收盘价（TRUMP/ADA）
+ENTRY_MID = "mid"  # 挂收盘与影线端点的中点并让出滑点（VINE）
+ENTRY_MARKET = "market"  # 信号K收盘价立即成交（限价单复核的对照基准）
+ORDER_EXPIRE_BARS = 4  # 挂单有效K线数（含挂单当根）
+PRICE_TOLERANCE = 0.0001  # should_cancel_order 的止盈价容差
+
+
+def limit_entry_prices(arrays, signal, side, entry=ENTRY_CLOSE, slippage=0.0):
+    """信号K下标数组 signal 对应的挂单价；slippage 为小数（0.005=0.5%）"""
+    close = arrays.close[signal]
+    if entry in (ENTRY_CLOSE, ENTRY_MARKET):
+        return close.copy()
+    if entry == ENTRY_MID:
+        is_long = side == SIDE_LONG
+        mid = np.where(is_long, (close + arrays.low[signal]) / 2, (close + arrays.high[signal]) / 2)
+        return mid * np.where(is_long, 1 + slippage, 1 - slippage)
+    raise ValueError(f"未知的挂单价格方式: {entry}")
+
+
+def first_fills(arrays, placed, price, is_long, tp_price, expire_bars=ORDER_EXPIRE_BARS, tolerance=PRICE_TOLERANCE):
+    """
+    每张挂单在有效期窗口内的结果，返回 (成交K线, 结束K线, 是否因越过止盈撤单)：
+    - 多单 low<=挂单价 / 空单 high>=挂单价 的首根K线成交
+    - 未成交的K线收盘价越过止盈价（含容差）则该K线结束后撤单；同一根K线先算成交
+    - 成交K线为 -1 表示未成交；窗口超出数据末尾且尚未结束时结束K线为 -1
+    """
+    n = len(arrays)
+    idx = placed[:, None] + np.arange(expire_bars)
+    valid = idx < n
+    idx = np.minimum(idx, n - 1)
+    long_ = is_long[:, None]
+    fill = valid & np.where(long_, arrays.low[idx] <= price[:, None], arrays.high[idx] >= price[:, None])
+    close = arrays.close[idx]
+    cancel = valid & np.where(long_, close > (tp_price * (1 + tolerance))[:, None],
+                              close < (tp_price * (1 - tolerance))[:, None])
+    fill_at = np.where(fill.any(axis=1), fill.argmax(axis=1), expire_bars)
+    cancel_at = np.where(cancel.any(axis=1), cancel.argmax(axis=1), expire_bars)
+    filled = fill_at <= cancel_at
+    filled &= fill_at < expire_bars
+    end = placed + np.where(filled, fill_at, np.minimum(cancel_at, expire_bars - 1))
+    fill_bar = np.where(filled, end, -1)
+    end = np.where(end < n, end, -1)
+    return fill_bar, end, ~filled & (cancel_at < expire_bars)
+
+
+def backtest_segmented_limit(plan, tp1, sl1, tp2, sl2, tp3, sl3, expire_bars=ORDER_EXPIRE_BARS, entry=ENTRY_CLOSE,
+                             slippage=0.0, tolerance=PRICE_TOLERANCE, trades=None, stats=None):
+    """
+    与 backtest_segmented_kernel 相同的分段开仓点，但以限价单入场，返回最终 balance：
+    - 空仓且无挂单时，开仓点K线开盘挂单，有效期 expire_bars 根K线
+    - 成交后每根K线检查止盈止损；成交当根只检查止损，同一根K线同时触及按止损计（有小周期判定器时由其决定）
+    - entry=ENTRY_MARKET 时挂单K线开盘即成交，成交当根与之后的K线一样完整检查止盈止损
+    - 平仓/撤单/到期的K线内不再挂新单
+    传入 trades 时追加 (挂单K线, 平仓K线, 方向, 分段, 成交价, 出场价, 盈亏)；
+    传入 stats 字典时累计 orders/filled/expired/cancelled。
+    """
+    arrays = plan["arrays"]
+    placed = np.asarray(plan["entries"], dtype=np.int64)
+    counts = {"orders": 0, "filled": 0, "expired": 0, "cancelled": 0}
+    balance = 0
+    if len(placed):
+        seg = np.asarray(plan["entry_seg"], dtype=np.int64)
+        side = np.asarray(plan["entry_side"], dtype=np.int64)
+        is_long = side == SIDE_LONG
+        tp = np.array((tp1, tp2, tp3), dtype=np.float64)[seg]
+        sl = np.array((sl1, sl2, sl3), dtype=np.float64)[seg]
+        price = limit_entry_prices(arrays, placed - 1, side, entry, slippage)
+        tp_price = np.where(is_long, price * (1 + tp), price * (1 - tp))
+        sl_price = np.where(is_long, price * (1 - sl), price * (1 + sl))
+        market = entry == ENTRY_MARKET
+        if market:
+            fill_bar, end, cancelled = placed, placed, np.zeros(len(placed), dtype=bool)
+        else:
+            fill_bar, end, cancelled = first_fills(arrays, placed, price, is_long, tp_price, expire_bars, tolerance)
+        balance = _walk_orders(plan, placed.tolist(), seg.tolist(), side.tolist(), tp.tolist(), sl.tolist(),
+                               price.tolist(), tp_price.tolist(), sl_price.tolist(), fill_bar.tolist(), end.tolist(),
+                               cancelled.tolist(), counts, trades, market)
+    if stats is not None:
+        for key, value in counts.items():
+            stats[key] = stats.get(key, 0) + value
+    return balance
+
+
+def _walk_orders(plan, placed, seg, side, tp, sl, price, tp_price, sl_price, fill_bar, end, cancelled, counts, trades,
+                 market=False):
+    arrays = plan["arrays"]
+    # 全部K线的首次触达索引：位置 p 对应K线 p+1
+    _, touch = arrays.checks_for(float("-inf"))
+    bar_high = touch.highs[-1]
+    bar_low = touch.lows[-1]
+    resolve = plan.get("resolve")
+    balance = 0
+    k = 0
+    n_orders = len(placed)
+    while k < n_orders:
+        if end[k] < 0:
+            break
+        counts["orders"] += 1
+        f = fill_bar[k]
+        if f < 0:
+            counts["cancelled" if cancelled[k] else "expired"] += 1
+            k = bisect_right(placed, end[k])
+            continue
+        counts["filled"] += 1
+        long_ = side[k] == SIDE_LONG
+        tp_px, sl_px = tp_price[k], sl_price[k]
+        # 限价成交当根无法确定成交与止盈的先后，只检查止损；立即成交从成交当根起完整检查
+        start = f - 1 if market else f
+        if not market and f >= 1 and (bar_low[f - 1] <= sl_px if long_ else bar_high[f - 1] >= sl_px):
+            exit_bar, loss = f, True
+        else:
+            if long_:
+                pos = min(touch.first_high_at_least(start, tp_px), touch.first_low_at_most(start, sl_px))
+                if pos >= touch.size:
+                    break
+                loss = bar_low[pos] <= sl_px
+                if loss and resolve is not None and bar_high[pos] >= tp_px:
+                    loss = not resolve(int(arrays.ts[pos + 1]), True, tp_px, sl_px)
+            else:
+                pos = min(touch.first_low_at_most(start, tp_px), touch.first_high_at_least(start, sl_px))
+                if pos >= touch.size:
+                    break
+                loss = bar_high[pos] >= sl_px
+                if loss and resolve is not None and bar_low[pos] <= tp_px:
+                    loss = not resolve(int(arrays.ts[pos + 1]), False, tp_px, sl_px)
+            exit_bar = pos + 1
+        pnl = -(MARGIN * LEVERAGE * sl[k]) if loss else MARGIN * LEVERAGE * tp[k]
+        balance += pnl
+        if trades is not None:
+            trades.append((placed[k], exit_bar, side[k], seg[k], price[k], sl_px if loss else tp_px, pnl))
+        k = bisect_right(placed, exit_bar)
+    return balance
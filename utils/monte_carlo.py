@@ -0,0 +1,50 @@
+"""
+交易盈亏重抽样的蒙特卡洛稳健性分析（批量 NumPy 运算）
+- bootstrap: 有放回抽取同样笔数的交易
+- permutation: 只打乱交易顺序（最终收益不变，考察回撤与破产风险对顺序的敏感度）
+每批生成 batch×笔数 的矩阵，一次 cumsum 得到全部权益曲线。
+"""
+from utils.backtest_kernel import np
+
+N_SIMS = 2000
+BATCH = 1000
+PERCENTILES = (5, 25, 50, 75, 95)
+RUIN_CAPITAL = 100.0  # 账户资金，权益曲线跌到 -RUIN_CAPITAL 及以下视为破产
+
+
+def simulate_trades(pnl, n_sims=N_SIMS, method="bootstrap", rng=None, batch=BATCH,
+                    percentiles=PERCENTILES, capital=RUIN_CAPITAL):
+    """
+    返回 {"equity": {百分位: 逐笔权益曲线}, "max_drawdown": {百分位: 值}, "final": {百分位: 值},
+          "ruin_probability": 破产概率, "drawdowns": 每次模拟的最大回撤数组}
+    """
+    pnl = np.asarray(pnl, dtype=np.float64)
+    rng = np.random.default_rng(rng)
+    n = len(pnl)
+    if n == 0:
+        zeros = {p: 0.0 for p in percentiles}
+        return {"equity": {p: np.zeros(0) for p in percentiles}, "max_drawdown": zeros, "final": dict(zeros),
+                "ruin_probability": 0.0, "drawdowns": np.zeros(n_sims)}
+    curves = np.empty((n_sims, n), dtype=np.float64)
+    drawdowns = np.empty(n_sims, dtype=np.float64)
+    for start in range(0, n_sims, batch):
+        size = min(batch, n_sims - start)
+        if method == "bootstrap":
+            samples = pnl[rng.integers(0, n, size=(size, n))]
+        elif method == "permutation":
+            samples = rng.permuted(np.broadcast_to(pnl, (size, n)), axis=1)
+        else:
+            raise ValueError(f"未知的重抽样方法: {method}")
+        equity = np.cumsum(samples, axis=1)
+        # 回撤从初始权益0起算
+        peak = np.maximum.accumulate(np.maximum(equity, 0.0), axis=1)
+        drawdowns[start:start + size] = np.max(peak - equity, axis=1)
+        curves[start:start + size] = equity
+    ruined = np.min(curves, axis=1) <= -capital
+    return {
+        "equity": dict(zip(percentiles, np.percentile(curves, percentiles, axis=0))),
+        "max_drawdown": dict(zip(percentiles, np.percentile(drawdowns, percentiles).tolist())),
+        "final": dict(zip(percentiles, np.percentile(curves[:, -1], percentiles).tolist())),
+        "ruin_probability": float(np.mean(ruined)),
+        "drawdowns": drawdowns,
+    }
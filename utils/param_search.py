@@ -0,0 +1,153 @@
+"""
+分段振幅策略的参数搜索方法（可插拔）
+每个搜索方法签名为 method(evaluate, space, rng, **opts)：
+- evaluate(configs, fraction) 批量回测参数元组，fraction 为使用的最近K线比例，返回收益列表
+- space 为 PARAM_NAMES 顺序的取值网格列表
+返回 {"method", "best", "evaluations", "evaluations_to_best", "bar_evaluations"}，便于横向比较。
+"""
+import itertools
+
+PARAM_NAMES = ("amp1_min", "amp2_min", "amp3_min", "tp1", "sl1", "tp2", "sl2", "tp3", "sl3")
+EVAL_BATCH = 512  # 穷举时每批提交的参数组数
+
+
+def is_valid(config):
+    return config[0] < config[1] < config[2]
+
+
+def config_to_params(config, profit):
+    params = dict(zip(PARAM_NAMES, config))
+    params['profit'] = profit
+    return params
+
+
+class EvalTracker:
+    """统计回测次数，并记录最终最优参数在第几次全量回测时首次出现"""
+
+    def __init__(self, evaluate):
+        self._evaluate = evaluate
+        self.evaluations = 0
+        self.bar_evaluations = 0.0
+        self.full_cache = {}
+        self.best = None
+        self.best_profit = None
+        self.evaluations_to_best = None
+
+    def evaluate(self, configs, fraction=1.0):
+        if fraction >= 1.0:
+            todo = [c for c in dict.fromkeys(configs) if c not in self.full_cache]
+        else:
+            todo = list(configs)
+        profits = self._evaluate(todo, fraction) if todo else []
+        partial = {}
+        for config, profit in zip(todo, profits):
+            self.evaluations += 1
+            self.bar_evaluations += min(fraction, 1.0)
+            if fraction >= 1.0:
+                self.full_cache[config] = profit
+                if self.best is None or profit > self.best_profit:
+                    self.best, self.best_profit = config, profit
+                    self.evaluations_to_best = self.evaluations
+            else:
+                partial[config] = profit
+        if fraction >= 1.0:
+            return [self.full_cache[c] for c in configs]
+        return [partial[c] for c in configs]
+
+    def summary(self, method):
+        return {
+            "method": method,
+            "best": config_to_params(self.best, self.best_profit) if self.best is not None else None,
+            "evaluations": self.evaluations,
+            "evaluations_to_best": self.evaluations_to_best,
+            "bar_evaluations": self.bar_evaluations,
+        }
+
+
+def sample_configs(space, n, rng):
+    """从网格中无放回随机抽取 n 组合法参数（网格不足时全部返回）"""
+    total = 1
+    for grid in space:
+        total *= len(grid)
+    seen = set()
+    attempts = 0
+    while len(seen) < n and attempts < 50 * n and attempts < 50 * total:
+        attempts += 1
+        config = tuple(rng.choice(grid) for grid in space)
+        if is_valid(config):
+            seen.add(config)
+    return sorted(seen)
+
+
+def grid_search(evaluate, space, rng, batch=EVAL_BATCH):
+    """穷举网格（基准方法）"""
+    tracker = EvalTracker(evaluate)
+    configs = (c for c in itertools.product(*space) if is_valid(c))
+    while True:
+        chunk = list(itertools.islice(configs, batch))
+        if not chunk:
+            break
+        tracker.evaluate(chunk)
+    return tracker.summary("grid")
+
+
+def successive_halving(evaluate, space, rng, n_configs=729, eta=3, min_fraction=1 / 9):
+    """
+    随机抽取 n_configs 组参数，先在最近 min_fraction 比例的K线上回测，
+    每轮保留前 1/eta 并把数据量放大 eta 倍，直到在全量数据上决出最优。
+    """
+    tracker = EvalTracker(evaluate)
+    configs = sample_configs(space, n_configs, rng)
+    fraction = min_fraction
+    while configs:
+        profits = tracker.evaluate(configs, fraction)
+        if fraction >= 1.0:
+            break
+        ranked = sorted(zip(profits, range(len(configs))), key=lambda x: (-x[0], x[1]))
+        keep = max(1, len(configs) // eta)
+        configs = [configs[i] for _, i in ranked[:keep]]
+        fraction = min(1.0, fraction * eta)
+    return tracker.summary("halving")
+
+
+def _descend(tracker, space, current, current_profit, max_rounds):
+    for _ in range(max_rounds):
+        improved = False
+        for dim, grid in enumerate(space):
+            candidates = []
+            for value in grid:
+                config = current[:dim] + (value,) + current[dim + 1:]
+                if config != current and is_valid(config):
+                    candidates.append(config)
+            if not candidates:
+                continue
+            for config, profit in zip(candidates, tracker.evaluate(candidates)):
+                if profit > current_profit:
+                    current, current_profit = config, profit
+                    improved = True
+        if not improved:
+            break
+    return current, current_profit
+
+
+def coordinate_descent(evaluate, space, rng, n_starts=32, n_climbs=8, max_rounds=10):
+    """
+    随机抽取 n_starts 组起点，从其中最好的 n_climbs 组分别做坐标下降：逐维扫描该维全部取值
+    并移动到最优值，一轮所有维度都无改进（或达到轮数上限）时停止。每维的候选值作为一批并行回测，
+    已回测过的参数直接命中缓存。
+    """
+    tracker = EvalTracker(evaluate)
+    starts = sample_configs(space, n_starts, rng)
+    if not starts:
+        return tracker.summary("coordinate")
+    ranked = sorted(zip(tracker.evaluate(starts), range(len(starts))), key=lambda x: (-x[0], x[1]))
+    for profit, idx in ranked[:n_climbs]:
+        _descend(tracker, space, starts[idx], profit, max_rounds)
+    return tracker.summary("coordinate")
+
+
+OPTIMIZERS = {
+    "grid": grid_search,
+    "halving": successive_halving,
+    "coordinate": coordinate_descent,
+}
@@ -0,0 +1,126 @@
+"""
+多参数组 × 多账户的组合回测（共享同一条K线流，一次遍历）
+实盘 okx_trump_multi_strategy_15m 每根K线依次用 STRATEGY_PARAMS 的每组参数判断信号，并在 ACCOUNT_SUFFIXES
+的每个账户以全仓（cross）模式下单，同一账户会同时持有多组参数开出的多笔仓位。
+全部 (账户, 参数组) 实例共用一个 PositionBook（owner 列记录实例），每根K线：
+1. 有信号的实例以信号K收盘价开仓（各参数组的信号按振幅向量化预先算出）
+2. 持仓簿批量检查全部持仓的止盈止损
+3. 按账户累计多/空持仓笔数与 Σ1/入场价，遍历结束后一次性算出各账户的权益、占用保证金曲线
+   （浮动盈亏 = 名义价值×(收盘价×Σ1/入场价 − 笔数)，不必逐笔标记）
+"""
+from utils.backtest_kernel import LEVERAGE, MARGIN, SIDE_LONG, SIDE_SHORT, as_kline_arrays, np
+from utils.position_book import PositionBook
+
+ACCOUNT_CAPITAL = 100.0  # 每个账户的初始资金（USDT），用于权益与可用保证金
+
+
+def portfolio_instances(strategy_params, account_suffixes):
+    """由实盘脚本的 STRATEGY_PARAMS 与 ACCOUNT_SUFFIXES 生成实例列表"""
+    return [{"account": suffix or "默认", "label": f"参数{i+1}", "amplitude": p["AMPLITUDE_PERCENT"],
+             "tp": p["TAKE_PROFIT_PERCENT"], "sl": p["STOP_LOSS_PERCENT"]}
+            for suffix in account_suffixes for i, p in enumerate(strategy_params)]
+
+
+def _signal_events(arrays, instances):
+    # 与 analyze_kline 一致：振幅=(最高-最低)/最低，达到阈值即开仓，阳线做空、否则做多
+    amp = (arrays.high - arrays.low) / arrays.low
+    steps, owners = [], []
+    for inst_id, inst in enumerate(instances):
+        step = np.flatnonzero(amp[:-1] >= inst["amplitude"]) + 1
+        steps.append(step)
+        owners.append(np.full(len(step), inst_id, dtype=np.int64))
+    steps = np.concatenate(steps) if steps else np.zeros(0, dtype=np.int64)
+    owners = np.concatenate(owners) if owners else np.zeros(0, dtype=np.int64)
+    order = np.lexsort((owners, steps))
+    return steps[order].tolist(), owners[order].tolist()
+
+
+def _max_drawdown(equity):
+    return float(np.max(np.maximum.accumulate(equity) - equity)) if len(equity) else 0.0
+
+
+def simulate_portfolio(klines, instances, margin=MARGIN, leverage=LEVERAGE, capital=ACCOUNT_CAPITAL):
+    """
+    instances 为 [{"account", "label", "amplitude", "tp", "sl"}, ...]，同一 account 的实例共用全仓保证金。
+    返回:
+      accounts: 账户名列表（以下逐账户数组的列顺序）
+      equity / margin / positions: 每根K线收盘时各账户的权益、占用保证金、持仓笔数（K线数×账户数）
+      total_equity: 全部账户权益合计；max_drawdown: 合计权益的最大回撤；account_drawdown: 各账户最大回撤
+      margin_peak: 各账户占用保证金峰值；total_margin_peak: 全部账户同时占用的保证金峰值
+      min_free_margin: 各账户 权益-占用保证金 的最小值（<0 表示期间出现保证金不足）
+      instances: 各实例的 profit/trades/wins
+    """
+    arrays = as_kline_arrays(klines)
+    n_bars = len(arrays)
+    accounts = list(dict.fromkeys(inst["account"] for inst in instances))
+    account_of = [accounts.index(inst["account"]) for inst in instances]
+    n_accounts = len(accounts)
+    notional = margin * leverage
+    high = arrays.high.tolist()
+    low = arrays.low.tolist()
+    close = arrays.close.tolist()
+    side = np.where(arrays.close > arrays.open, SIDE_SHORT, SIDE_LONG).tolist()
+    ev_step, ev_owner = _signal_events(arrays, instances)
+    tps = [inst["tp"] for inst in instances]
+    sls = [inst["sl"] for inst in instances]
+    stats = [{"profit": 0, "trades": 0, "wins": 0} for _ in instances]
+    # 逐账户累计量：已实现盈亏、多/空笔数、多/空 Σ1/入场价
+    realized = [0.0] * n_accounts
+    long_n = [0] * n_accounts
+    short_n = [0] * n_accounts
+    long_inv = [0.0] * n_accounts
+    short_inv = [0.0] * n_accounts
+    snapshot = np.zeros((n_bars, 5, n_accounts), dtype=np.float64)
+    book = PositionBook()
+    ptr = 0
+    n_events = len(ev_step)
+    for i in range(1, n_bars):
+        while ptr < n_events and ev_step[ptr] == i:
+            inst_id = ev_owner[ptr]
+            acct = account_of[inst_id]
+            entry = close[i - 1]
+            if side[i - 1] == SIDE_LONG:
+                book.open(SIDE_LONG, entry, entry * (1 + tps[inst_id]), entry * (1 - sls[inst_id]), i - 1, owner=inst_id)
+                long_n[acct] += 1
+                long_inv[acct] += 1 / entry
+            else:
+                book.open(SIDE_SHORT, entry, entry * (1 - tps[inst_id]), entry * (1 + sls[inst_id]), i - 1, owner=inst_id)
+                short_n[acct] += 1
+                short_inv[acct] += 1 / entry
+            ptr += 1
+        for slot, hit_tp in book.check_bar(high[i], low[i]):
+            inst_id = int(book.owner[slot])
+            acct = account_of[inst_id]
+            pnl = notional * tps[inst_id] if hit_tp else -(notional * sls[inst_id])
+            realized[acct] += pnl
+            st = stats[inst_id]
+            st["profit"] += pnl
+            st["trades"] += 1
+            st["wins"] += hit_tp
+            entry = float(book.entry[slot])
+            if book.side[slot] == SIDE_LONG:
+                long_n[acct] -= 1
+                long_inv[acct] = long_inv[acct] - 1 / entry if long_n[acct] else 0.0
+            else:
+                short_n[acct] -= 1
+                short_inv[acct] = short_inv[acct] - 1 / entry if short_n[acct] else 0.0
+        snapshot[i] = (realized, long_n, short_n, long_inv, short_inv)
+    realized_c, long_c, short_c, long_inv_c, short_inv_c = (snapshot[:, j] for j in range(5))
+    mark = arrays.close[:, None]
+    equity = capital + realized_c + notional * (mark * long_inv_c - long_c) + notional * (short_c - mark * short_inv_c)
+    positions = (long_c + short_c).astype(np.int64)
+    margin_used = positions * float(margin)
+    total_equity = equity.sum(axis=1)
+    return {
+        "accounts": accounts,
+        "equity": equity,
+        "margin": margin_used,
+        "positions": positions,
+        "total_equity": total_equity,
+        "max_drawdown": _max_drawdown(total_equity),
+        "account_drawdown": [_max_drawdown(equity[:, a]) for a in range(n_accounts)],
+        "margin_peak": margin_used.max(axis=0).tolist() if n_bars else [0.0] * n_accounts,
+        "total_margin_peak": float(margin_used.sum(axis=1).max()) if n_bars else 0.0,
+        "min_free_margin": (equity - margin_used).min(axis=0).tolist() if n_bars else [capital] * n_accounts,
+        "instances": [dict(inst, **st) for inst, st in zip(instances, stats)],
+    }
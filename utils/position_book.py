@@ -0,0 +1,165 @@
+"""
+加仓（pyramiding）持仓簿
+多笔持仓各自带止盈止损，按列存放在可扩容的 NumPy 数组中（平仓后的槽位复用）。
+每个方向的止盈价、止损价各维护一个堆：每根K线只需查看堆顶，弹出被触及的持仓，
+单根K线的检查代价为 O((平仓笔数+1)·log 持仓数)，不随未平仓数量线性增长。
+"""
+import heapq
+from bisect import bisect_left
+
+from utils.backtest_kernel import LEVERAGE, MARGIN, SIDE_LONG, np
+
+PYRAMIDING = 10  # 同时持有的最大笔数（Pine pyramiding 参数）
+
+
+class PositionBook:
+    """多笔持仓；堆中的过期条目（已平仓或槽位已复用）在弹出时按代号跳过"""
+
+    def __init__(self, capacity=64):
+        self.side = np.zeros(capacity, dtype=np.int8)
+        self.segment = np.zeros(capacity, dtype=np.int8)
+        self.opened = np.zeros(capacity, dtype=np.int32)
+        self.owner = np.zeros(capacity, dtype=np.int32)  # 持仓所属实例（组合回测中区分账户/参数组）
+        self.entry = np.zeros(capacity, dtype=np.float64)
+        self.tp_price = np.zeros(capacity, dtype=np.float64)
+        self.sl_price = np.zeros(capacity, dtype=np.float64)
+        self.is_open = np.zeros(capacity, dtype=bool)
+        self.gen = np.zeros(capacity, dtype=np.int64)
+        self._free = list(range(capacity - 1, -1, -1))
+        self.count = 0
+        # 多单: 止盈价最小堆 / 止损价最大堆；空单: 止盈价最大堆 / 止损价最小堆（最大堆存负值）
+        self._long_tp, self._long_sl, self._short_tp, self._short_sl = [], [], [], []
+
+    def __len__(self):
+        return self.count
+
+    def _grow(self):
+        size = len(self.side)
+        for name in ("side", "segment", "opened", "owner", "entry", "tp_price", "sl_price", "is_open", "gen"):
+            column = getattr(self, name)
+            setattr(self, name, np.concatenate((column, np.zeros(size, dtype=column.dtype))))
+        self._free.extend(range(2 * size - 1, size - 1, -1))
+
+    def _compact(self):
+        # 过期条目过多时按未平仓槽位重建四个堆
+        heaps = (self._long_tp, self._long_sl, self._short_tp, self._short_sl)
+        for heap in heaps:
+            heap[:] = [item for item in heap if self.is_open[item[1]] and self.gen[item[1]] == item[2]]
+            heapq.heapify(heap)
+
+    def open(self, side, entry, tp_price, sl_price, bar, segment=0, owner=0):
+        """开一笔持仓，返回槽位"""
+        if not self._free:
+            self._grow()
+        if len(self._long_tp) + len(self._short_tp) > 4 * self.count + 256:
+            self._compact()
+        slot = self._free.pop()
+        self.side[slot], self.segment[slot], self.opened[slot], self.owner[slot] = side, segment, bar, owner
+        self.entry[slot], self.tp_price[slot], self.sl_price[slot] = entry, tp_price, sl_price
+        self.is_open[slot] = True
+        self.gen[slot] += 1
+        gen = int(self.gen[slot])
+        if side == SIDE_LONG:
+            heapq.heappush(self._long_tp, (tp_price, slot, gen))
+            heapq.heappush(self._long_sl, (-sl_price, slot, gen))
+        else:
+            heapq.heappush(self._short_tp, (-tp_price, slot, gen))
+            heapq.heappush(self._short_sl, (sl_price, slot, gen))
+        self.count += 1
+        return slot
+
+    def _pop_hits(self, heap, limit, hit_tp, closed):
+        # 弹出堆顶键值 <= limit 的条目，跳过过期条目
+        is_open, gen = self.is_open, self.gen
+        while heap and heap[0][0] <= limit:
+            _, slot, item_gen = heapq.heappop(heap)
+            if is_open[slot] and gen[slot] == item_gen:
+                is_open[slot] = False
+                self._free.append(slot)
+                self.count -= 1
+                closed.append((slot, hit_tp))
+
+    def check_bar(self, high, low):
+        """
+        用一根K线的最高/最低价批量检查全部持仓，返回平仓列表 [(槽位, 是否止盈)]。
+        同一根K线同时触及止盈止损按止损计：先弹出止损堆，再弹出止盈堆。
+        槽位中的数据在下一次 open 之前保持不变，可直接读取。
+        """
+        closed = []
+        self._pop_hits(self._long_sl, -low, False, closed)
+        self._pop_hits(self._short_sl, high, False, closed)
+        self._pop_hits(self._long_tp, high, True, closed)
+        self._pop_hits(self._short_tp, -low, True, closed)
+        return closed
+
+    def open_slots(self):
+        return np.flatnonzero(self.is_open)
+
+    def unrealized(self, price, margin=MARGIN, leverage=LEVERAGE):
+        """按当前价格计算全部未平仓的浮动盈亏合计（列运算）"""
+        slots = self.open_slots()
+        entry = self.entry[slots]
+        change = np.where(self.side[slots] == SIDE_LONG, price - entry, entry - price) / entry
+        return float(np.sum(margin * leverage * change))
+
+
+def backtest_segmented_pyramiding(plan, tp1, sl1, tp2, sl2, tp3, sl3, pyramiding=PYRAMIDING, trades=None):
+    """
+    分段振幅信号的加仓回测，返回 (balance, 期末未平仓笔数, 最大同时持仓笔数)。平仓规则与 backtest_segmented_kernel 一致，
+    pyramiding=1 时结果与之逐笔相同：
+    - 只在可检查步（信号K落入分段）检查持仓，开仓当步不检查新开的持仓，从之后的可检查步开始
+    - 开仓点（信号K落入分段且非十字星）在该步检查前持仓不足 pyramiding 笔时以信号K收盘价新开一笔
+    - 同一根K线同时触及止盈止损按止损计，计划带小周期判定器（plan["resolve"]）时由其决定先后
+    传入 trades 时按平仓顺序追加 (信号K, 平仓K线, 方向, 分段, 入场价, 出场价, 盈亏)，可直接交给 TradeLedger.from_records。
+    """
+    arrays = plan["arrays"]
+    high = arrays.high.tolist()
+    low = arrays.low.tolist()
+    checks = plan["checks"]
+    entries = plan["entries"]
+    entry_seg = plan["entry_seg"]
+    entry_side = plan["entry_side"]
+    entry_price = plan["entry_price"]
+    resolve = plan.get("resolve")
+    ts = arrays.ts if resolve is not None else None
+    tps, sls = (tp1, tp2, tp3), (sl1, sl2, sl3)
+    book = PositionBook(max(1, min(pyramiding, 1024)))
+    balance = 0
+    peak = 0
+    n_checks = len(checks)
+    n_entries = len(entries)
+    k = 0
+    j = bisect_left(checks, entries[0]) if entries else n_checks
+    while j < n_checks:
+        i = checks[j]
+        # 持仓上限按本步检查前的笔数判断：pyramiding=1 时平仓当步不再开仓（与单笔持仓内核一致）
+        can_open = book.count < pyramiding
+        for slot, hit_tp in book.check_bar(high[i], low[i]):
+            is_long = book.side[slot] == SIDE_LONG
+            tp_price, sl_price = float(book.tp_price[slot]), float(book.sl_price[slot])
+            if not hit_tp and resolve is not None and (high[i] >= tp_price if is_long else low[i] <= tp_price):
+                hit_tp = resolve(int(ts[i]), bool(is_long), tp_price, sl_price)
+            seg = int(book.segment[slot])
+            pnl = MARGIN * LEVERAGE * tps[seg] if hit_tp else -(MARGIN * LEVERAGE * sls[seg])
+            balance += pnl
+            if trades is not None:
+                trades.append((int(book.opened[slot]), i, int(book.side[slot]), seg, float(book.entry[slot]),
+                               tp_price if hit_tp else sl_price, pnl))
+        if k < n_entries and entries[k] == i:
+            if can_open:
+                seg = entry_seg[k]
+                tp, sl, price = tps[seg], sls[seg], entry_price[k]
+                if entry_side[k] == SIDE_LONG:
+                    book.open(SIDE_LONG, price, price * (1 + tp), price * (1 - sl), i - 1, seg)
+                else:
+                    book.open(entry_side[k], price, price * (1 - tp), price * (1 + sl), i - 1, seg)
+                peak = max(peak, book.count)
+            k += 1
+        if book.count:
+            j += 1
+        elif k < n_entries:
+            # 空仓时直接跳到下一个开仓点
+            j = bisect_left(checks, entries[k], j + 1)
+        else:
+            break
+    return balance, book.count, peak
@@ -0,0 +1,101 @@
+"""
+完整参数收益曲面（memmap float32 N维数组）
+父进程按各维取值网格创建 .npy 文件（旁边的 .json 记录维度名与取值），worker 以 r+ 方式映射同一文件，
+把各自负责的分段区间子块原地写入；不合法的分段区间（非递增）保持 NaN。
+查询接口支持按取值切片与邻域平均（稳健性热力图无需重跑回测）。
+"""
+import json
+
+from utils.backtest_kernel import np
+
+
+def _meta_path(path):
+    return path + ".json"
+
+
+def create_surface(path, names, axes):
+    """创建全 NaN 的收益曲面文件，返回其形状"""
+    shape = tuple(len(axis) for axis in axes)
+    surface = np.lib.format.open_memmap(path, mode="w+", dtype=np.float32, shape=shape)
+    surface[...] = np.nan
+    surface.flush()
+    del surface
+    with open(_meta_path(path), "w", encoding="utf-8") as f:
+        json.dump({"names": list(names), "axes": [list(axis) for axis in axes]}, f)
+    return shape
+
+
+_OPEN_SURFACES = {}
+
+
+def write_block(path, index, block):
+    """把子块写入曲面 surface[index]（worker 内按路径缓存映射，只写自己的区域）"""
+    surface = _OPEN_SURFACES.get(path)
+    if surface is None:
+        surface = np.load(path, mmap_mode="r+")
+        _OPEN_SURFACES[path] = surface
+    surface[index] = block
+    surface.flush()
+
+
+def _box_sum(values, axis, radius):
+    # 沿一个维度求 [i-radius, i+radius] 窗口和（边界处窗口截断）
+    length = values.shape[axis]
+    prefix = np.cumsum(values, axis=axis, dtype=np.float64)
+    zero = np.zeros_like(np.take(prefix, [0], axis=axis))
+    prefix = np.concatenate([zero, prefix], axis=axis)
+    idx = np.arange(length)
+    hi = np.minimum(idx + radius + 1, length)
+    lo = np.maximum(idx - radius, 0)
+    return np.take(prefix, hi, axis=axis) - np.take(prefix, lo, axis=axis)
+
+
+def neighbourhood_mean(values, radius=1):
+    """N维邻域平均（每维 ±radius 个格点，忽略 NaN；邻域全为 NaN 时结果为 NaN）"""
+    values = np.asarray(values, dtype=np.float64)
+    valid = ~np.isnan(values)
+    total = np.where(valid, values, 0.0)
+    count = valid.astype(np.float64)
+    for axis in range(values.ndim):
+        total = _box_sum(total, axis, radius)
+        count = _box_sum(count, axis, radius)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(count > 0, total / count, np.nan)
+
+
+class ProfitSurface:
+    """只读方式映射收益曲面，按参数取值查询"""
+
+    def __init__(self, path):
+        self.values = np.load(path, mmap_mode="r")
+        with open(_meta_path(path), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        self.names = meta["names"]
+        self.axes = meta["axes"]
+
+    def index_of(self, name, value):
+        axis = self.axes[self.names.index(name)]
+        return min(range(len(axis)), key=lambda i: abs(axis[i] - value))
+
+    def slice(self, **fixed):
+        """固定部分参数的取值，返回 (子数组视图, 剩余维度名, 剩余维度取值)"""
+        index = []
+        names, axes = [], []
+        for name, axis in zip(self.names, self.axes):
+            if name in fixed:
+                index.append(self.index_of(name, fixed[name]))
+            else:
+                index.append(slice(None))
+                names.append(name)
+                axes.append(axis)
+        return self.values[tuple(index)], names, axes
+
+    def value(self, params):
+        return float(self.values[tuple(self.index_of(name, params[name]) for name in self.names)])
+
+    def robust_value(self, params, radius=1):
+        """参数点邻域（每维 ±radius 格）内的平均收益，衡量峰值是否稳健"""
+        index = tuple(slice(max(0, i - radius), i + radius + 1)
+                      for i in (self.index_of(name, params[name]) for name in self.names))
+        block = np.asarray(self.values[index], dtype=np.float64)
+        return float(np.nanmean(block)) if np.any(~np.isnan(block)) else float("nan")
@@ -0,0 +1,110 @@
+"""
+回测结果的磁盘缓存（sqlite，标准库）
+键为 (数据集内容哈希, 策略标识, 参数元组)，超过条数上限时按最近使用时间淘汰（LRU）。
+只在父进程读写，worker 不接触缓存文件，避免多进程写锁竞争。
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+from utils.backtest_kernel import HAS_NUMPY, as_kline_arrays
+
+CACHE_PATH = os.path.join("optimizer_cache", "results.sqlite")
+MAX_ENTRIES = 500000
+BATCH = 500  # sqlite 单条语句的参数个数有限，批量查询时分批
+
+
+def dataset_fingerprint(klines):
+    """K线内容哈希：列表与由它转换出的 KlineArrays 得到相同结果"""
+    digest = hashlib.sha1()
+    if HAS_NUMPY:
+        klines = as_kline_arrays(klines)
+        for column in (klines.ts, klines.open, klines.high, klines.low, klines.close):
+            digest.update(column.tobytes())
+    else:
+        for k in klines:
+            if isinstance(k, dict):
+                row = (k["ts"], k["open"], k["high"], k["low"], k["close"])
+            else:
+                row = tuple(k[:5])
+            digest.update(repr(row).encode())
+    return f"{len(klines)}-{digest.hexdigest()}"
+
+
+def _encode_params(params):
+    return json.dumps(params, separators=(",", ":"))
+
+
+class ResultCache:
+    """(dataset, strategy, params) -> 结果（任意可JSON序列化对象）"""
+
+    def __init__(self, path=CACHE_PATH, max_entries=MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "dataset TEXT, strategy TEXT, params TEXT, value TEXT, last_used INTEGER, "
+            "PRIMARY KEY (dataset, strategy, params))"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_last_used ON results (last_used)")
+        self.conn.commit()
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, dataset, strategy, params_list):
+        """批量查询，返回 {params: value}，命中项刷新最近使用时间"""
+        found = {}
+        encoded = {_encode_params(p): p for p in params_list}
+        keys = list(encoded)
+        for i in range(0, len(keys), BATCH):
+            part = keys[i:i + BATCH]
+            marks = ",".join("?" * len(part))
+            rows = self.conn.execute(
+                f"SELECT params, value FROM results WHERE dataset=? AND strategy=? AND params IN ({marks})",
+                [dataset, strategy] + part,
+            ).fetchall()
+            for key, value in rows:
+                found[encoded[key]] = json.loads(value)
+        if found:
+            now = time.time_ns()
+            self.conn.executemany(
+                "UPDATE results SET last_used=? WHERE dataset=? AND strategy=? AND params=?",
+                [(now, dataset, strategy, _encode_params(p)) for p in found],
+            )
+            self.conn.commit()
+        self.hits += len(found)
+        self.misses += len(params_list) - len(found)
+        return found
+
+    def put_many(self, dataset, strategy, items):
+        """写入 [(params, value), ...]，超出上限时淘汰最久未使用的条目"""
+        if not items:
+            return
+        now = time.time_ns()
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO results (dataset, strategy, params, value, last_used) VALUES (?, ?, ?, ?, ?)",
+            [(dataset, strategy, _encode_params(p), json.dumps(v), now) for p, v in items],
+        )
+        count = self.conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        if count > self.max_entries:
+            self.conn.execute(
+                "DELETE FROM results WHERE rowid IN (SELECT rowid FROM results ORDER BY last_used LIMIT ?)",
+                (count - self.max_entries,),
+            )
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -0,0 +1,57 @@
+"""
+K线列数组的共享内存封装
+父进程把 ts/open/high/low/close 写入一块 multiprocessing.shared_memory，
+进程池 worker 在初始化时按名字挂载，直接在共享缓冲区上构建 KlineArrays（零拷贝），
+任务本身只需传递参数元组。
+"""
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from utils.backtest_kernel import KlineArrays, as_kline_arrays
+
+COLUMNS = ("ts", "open", "high", "low", "close")
+COLUMN_DTYPES = (np.int64, np.float64, np.float64, np.float64, np.float64)
+
+
+class SharedKlines:
+    """父进程持有的共享K线块；with 语句结束时释放并删除共享内存"""
+
+    def __init__(self, klines):
+        arrays = as_kline_arrays(klines)
+        self.length = len(arrays)
+        # 每列 8 字节定长，按列连续存放；长度为0时也至少申请1字节
+        self.shm = shared_memory.SharedMemory(create=True, size=max(1, 8 * len(COLUMNS) * self.length))
+        for idx, (name, dtype) in enumerate(zip(COLUMNS, COLUMN_DTYPES)):
+            view = _column_view(self.shm, idx, self.length, dtype)
+            view[:] = getattr(arrays, name)
+
+    @property
+    def spec(self):
+        """传给 worker 初始化函数的描述信息（可安全pickle）"""
+        return (self.shm.name, self.length)
+
+    def close(self):
+        self.shm.close()
+        self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def _column_view(shm, idx, length, dtype):
+    return np.ndarray((length,), dtype=dtype, buffer=shm.buf, offset=8 * idx * length)
+
+
+def attach_shared_klines(spec):
+    """在 worker 中按 spec 挂载共享K线，返回引用共享缓冲区的 KlineArrays"""
+    name, length = spec
+    shm = shared_memory.SharedMemory(name=name)
+    columns = [_column_view(shm, idx, length, dtype) for idx, dtype in enumerate(COLUMN_DTYPES)]
+    arrays = KlineArrays.from_columns(*columns)
+    # 持有句柄，保证共享缓冲区在数组存活期间不被释放
+    arrays._shm = shm
+    return arrays
@@ -0,0 +1,88 @@
+"""
+列式交易账本（struct-of-arrays）
+每笔交易占 4+4+1+1+8+8+8=34 字节，权益曲线、回撤、分段统计等报表都是整列的向量运算。
+"""
+from utils.backtest_kernel import SIDE_LONG, np
+
+LEDGER_FIELDS = (
+    ("entry_idx", "int32"),  # 信号K（入场）索引
+    ("exit_idx", "int32"),  # 平仓K线索引
+    ("side", "int8"),  # SIDE_LONG / SIDE_SHORT
+    ("segment", "int8"),  # 分段编号 1/2/3
+    ("entry", "float64"),
+    ("exit", "float64"),
+    ("pnl", "float64"),
+)
+
+
+class TradeLedger:
+    """按列存放的成交记录，各列为等长的 NumPy 数组"""
+
+    def __init__(self, **columns):
+        for name, dtype in LEDGER_FIELDS:
+            setattr(self, name, np.asarray(columns[name], dtype=dtype))
+
+    @classmethod
+    def from_records(cls, records):
+        """records 为 [(entry_idx, exit_idx, side, segment, entry, exit, pnl), ...]"""
+        columns = list(zip(*records)) if records else [()] * len(LEDGER_FIELDS)
+        return cls(**{name: column for (name, _), column in zip(LEDGER_FIELDS, columns)})
+
+    def __len__(self):
+        return len(self.pnl)
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for name, _ in LEDGER_FIELDS)
+
+    def to_dicts(self):
+        """转换为 backtest_segmented_loop 的逐笔字典格式，便于打印或与旧代码对照"""
+        return [{"seg": int(seg), "dir": "LONG" if side == SIDE_LONG else "SHORT", "entry": entry, "exit": exit_price,
+                 "result": pnl, "entry_idx": int(entry_idx), "exit_idx": int(exit_idx)}
+                for entry_idx, exit_idx, side, seg, entry, exit_price, pnl in zip(
+                    self.entry_idx, self.exit_idx, self.side, self.segment,
+                    self.entry.tolist(), self.exit.tolist(), self.pnl.tolist())]
+
+    # ========== 报表 ==========
+    def equity_curve(self):
+        """逐笔累计收益"""
+        return np.cumsum(self.pnl)
+
+    def max_drawdown(self):
+        """权益曲线（从0开始）相对历史高点的最大回撤"""
+        if not len(self):
+            return 0.0
+        equity = np.concatenate(([0.0], self.equity_curve()))
+        return float(np.max(np.maximum.accumulate(equity) - equity))
+
+    def profit_factor(self):
+        """总盈利 / 总亏损；无亏损时为 inf（无交易时为0）"""
+        gross_win = float(self.pnl[self.pnl > 0].sum())
+        gross_loss = float(-self.pnl[self.pnl < 0].sum())
+        if gross_loss == 0:
+            return float("inf") if gross_win > 0 else 0.0
+        return gross_win / gross_loss
+
+    def avg_holding_bars(self):
+        if not len(self):
+            return 0.0
+        return float(np.mean(self.exit_idx.astype(np.int64) - self.entry_idx))
+
+    def segment_stats(self, n_segments=3):
+        """各分段的 (交易笔数, 盈利笔数, 收益合计)，按分段1..n排列"""
+        idx = self.segment.astype(np.int64) - 1
+        count = np.bincount(idx, minlength=n_segments)
+        wins = np.bincount(idx, weights=self.pnl > 0, minlength=n_segments).astype(np.int64)
+        profit = np.bincount(idx, weights=self.pnl, minlength=n_segments)
+        return count, wins, profit
+
+    def report(self):
+        total = len(self)
+        return {
+            "profit": float(self.pnl.sum()),
+            "trades": total,
+            "winrate": float(np.count_nonzero(self.pnl > 0)) / total if total else 0,
+            "max_drawdown": self.max_drawdown(),
+            "profit_factor": self.profit_factor(),
+            "avg_holding_bars": self.avg_holding_bars(),
+        }